@@ -0,0 +1,261 @@
+import asyncio
+import os
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from agents.deadline import Deadline
+from agents.new_openai_agent import NewOpenAIAgent, _needs_second_call, _with_timeout
+from agents.resilience import classify_error
+from agents.streaming import SentenceCutoff
+
+
+class AsyncOpenAIAgent(NewOpenAIAgent):
+    """
+    An asyncio variant of `NewOpenAIAgent`, for running many conversations concurrently.
+
+    Prompts, routing and parsing are shared with `NewOpenAIAgent`; only the API calls are awaited,
+    on an `AsyncOpenAI` client whose connection pool is sized for concurrent requests, so that
+    connections (and their TLS sessions) are reused instead of opened per request.
+    The synchronous entrypoint `generate_functions_and_responses` keeps working as before.
+
+    Environment variables:
+        OPENAI_MAX_CONNECTIONS: The size of the connection pool (default 64).
+        OPENAI_MAX_KEEPALIVE: The number of idle connections kept open (default 32).
+        OPENAI_TIMEOUT: The request timeout in seconds (default 30).
+    """
+    def __init__(self):
+        super().__init__()
+        limits = httpx.Limits(
+            max_connections=int(os.environ.get("OPENAI_MAX_CONNECTIONS", 64)),
+            max_keepalive_connections=int(os.environ.get("OPENAI_MAX_KEEPALIVE", 32)),
+            keepalive_expiry=30.0,
+        )
+        timeout = httpx.Timeout(float(os.environ.get("OPENAI_TIMEOUT", 30)), connect=5.0)
+        self.async_client = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            base_url=os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+            max_retries=0,
+        )
+
+    async def agenerate_functions_and_responses(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor):
+        """
+        Coroutine version of `generate_functions_and_responses`.
+        Uses `executor.aexecute` when the executor provides it (see `function_calls/concurrent_executor.py`).
+        """
+        deadline = Deadline(stats=self.deadline_stats, max_calls=self.max_calls_per_turn)
+        if self.combined_call:
+            reply = await self._agenerate_combined(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline)
+            return {"final_responses": reply}
+
+        if self.use_function_calls and self.speculative_response and self._should_speculate(tool_registry, action_registry, dialogue):
+            reply = await self._agenerate_speculative(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline)
+            return {"final_responses": reply}
+
+        function_results = [] # only for task2
+        if self.use_function_calls:
+            try:
+                with deadline.stage("select_functions", planned=max(0.0, deadline.remaining() - self.response_reserve)):
+                    functions_to_call = await self._aselect_functions(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, deadline)
+                function_results = await _aexecute(executor, functions_to_call)
+            except Exception as e:
+                print(f"[ERROR] Function selection failed ({classify_error(e)}): {e}")
+
+        try:
+            with deadline.stage("response"):
+                reply = await self._aresponse_text(
+                    self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, function_results),
+                    timeout=deadline.timeout(), deadline=deadline
+                )
+        except Exception as e:
+            reply = "Sorry, I encountered an error generating a response."
+            deadline.stats["fallback"] += 1
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+
+        return {"final_responses": reply}
+
+    async def _agenerate_speculative(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline):
+        """
+        Coroutine version of `_generate_speculative`.
+        """
+        self.speculative_stats["turns"] += 1
+        start = time.perf_counter()
+        try:
+            speculation = asyncio.ensure_future(_atimed(self._aresponse_text(
+                self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, []),
+                timeout=deadline.timeout(), deadline=deadline
+            )))
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+        function_results = []
+        select_time = 0.0
+        try:
+            with deadline.stage("select_functions", planned=max(0.0, deadline.remaining() - self.response_reserve)):
+                functions_to_call, select_time = await _atimed(self._aselect_functions(
+                    tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, deadline
+                ))
+            function_results = await _aexecute(executor, functions_to_call)
+        except Exception as e:
+            print(f"[ERROR] Function selection failed ({classify_error(e)}): {e}")
+
+        try:
+            with deadline.stage("response"):
+                reply, response_time = await speculation
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            reply = None
+
+        if reply is not None and not _needs_second_call(function_results, tool_registry, reply):
+            self.speculative_stats["used"] += 1
+            self.speculative_stats["latency_saved"] += select_time + response_time - (time.perf_counter() - start)
+            return reply
+        if not deadline.calls_left() or not deadline.allows(self.min_call_time):
+            if reply is not None:
+                self.speculative_stats["mispredicted"] += 1
+                return reply
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+        self.speculative_stats["discarded"] += 1
+        try:
+            with deadline.stage("response"):
+                return await self._aresponse_text(
+                    self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, function_results),
+                    timeout=deadline.timeout(), deadline=deadline
+                )
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            if reply is not None:
+                return reply
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+    async def _aselect_functions(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, deadline=None):
+        """
+        Coroutine version of `_select_functions`.
+        """
+        functions_to_call = self._route_functions(tool_registry, action_registry, knowledge, dialogue)
+        if functions_to_call is not None:
+            return functions_to_call
+
+        timeout = None
+        if deadline is not None:
+            if not deadline.allows(self.min_call_time, reserve=self.response_reserve):
+                deadline.skip("function_call")
+                return []
+            timeout = deadline.timeout(reserve=self.response_reserve)
+        request = self._function_request(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue)
+        if request is None:
+            return []
+        # retries leave the call of the response
+        response = await self._achat_completion(request, timeout=timeout, deadline=deadline, reserve_calls=1)
+        return self._parse_function_calls(response, knowledge)
+
+    async def _agenerate_combined(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline):
+        """
+        Coroutine version of `_generate_combined`.
+        """
+        self.combined_stats["turns"] += 1
+        draft = None
+        function_results = []
+        try:
+            routed = self._route_functions(tool_registry, action_registry, knowledge, dialogue)
+            if routed is not None:
+                self.combined_stats["routed"] += 1
+                function_results = await _aexecute(executor, routed)
+            else:
+                with deadline.stage("combined_call"):
+                    response = await self._achat_completion(
+                        self._combined_request(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue),
+                        timeout=deadline.timeout(), deadline=deadline
+                    )
+                functions_to_call, draft = self._parse_combined(response, tool_registry, action_registry, knowledge)
+                function_results = await _aexecute(executor, functions_to_call) if functions_to_call else []
+                if not _needs_second_call(function_results, tool_registry, draft):
+                    self.combined_stats["second_call_avoided"] += 1
+                    return draft
+                if not deadline.calls_left() or not deadline.allows(self.min_call_time):
+                    deadline.skip("response")
+                    self.combined_stats["second_call_skipped"] += 1
+                    return draft
+
+            with deadline.stage("response"):
+                reply = await self._aresponse_text(
+                    self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, function_results),
+                    timeout=deadline.timeout(), deadline=deadline
+                )
+            if routed is None:
+                self.combined_stats["second_call"] += 1
+            return reply
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            if draft:
+                return draft
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+    async def _achat_completion(self, request, timeout=None, deadline=None, reserve_calls=0):
+        """
+        Coroutine version of `_chat_completion`.
+        """
+        async def send(**request):
+            return await self.resilience.acall(lambda left: self.async_client.chat.completions.create(**_with_timeout(request, left)), timeout,
+                                               deadline=deadline, reserve_calls=reserve_calls)
+
+        if self.llm_cache is None:
+            return await send(**request)
+        return await self.llm_cache.acreate(send, **request)
+
+    async def _aresponse_text(self, request, timeout=None, deadline=None):
+        """
+        Coroutine version of `_response_text`.
+        """
+        start = time.perf_counter()
+        if not self.stream_responses or self.llm_cache is not None:
+            response = await self._achat_completion(request, timeout=timeout, deadline=deadline)
+            self.stream_stats.record(None, time.perf_counter() - start, False)
+            return response.choices[0].message.content
+
+        async def stream_text(left):
+            cutoff = SentenceCutoff(self.max_sentences)
+            first_token = None
+            stream = await self.async_client.chat.completions.create(**_with_timeout(dict(request, stream=True), left))
+            try:
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    if cutoff.feed(delta):
+                        break
+            finally:
+                await stream.close()
+            return cutoff, first_token
+
+        cutoff, first_token = await self.resilience.acall(stream_text, timeout, deadline=deadline)
+        self.stream_stats.record(first_token, time.perf_counter() - start, cutoff.cut)
+        return cutoff.result()
+
+    async def aclose(self):
+        """Closes the pooled connections."""
+        await self.async_client.close()
+
+
+async def _aexecute(executor, functions_to_call):
+    """Uses `executor.aexecute` when the executor provides it (see `function_calls/concurrent_executor.py`)."""
+    if hasattr(executor, "aexecute"):
+        return await executor.aexecute(functions_to_call)
+    return executor.execute(functions_to_call)
+
+
+async def _atimed(awaitable):
+    """Returns the result of `awaitable` and the seconds it took."""
+    start = time.perf_counter()
+    result = await awaitable
+    return result, time.perf_counter() - start
@@ -0,0 +1,129 @@
+"""
+A per-turn time budget, passed to every stage of an agent.
+
+The evaluator gives each turn 7 seconds. A `Deadline` is created when a turn starts; each
+API call gets a timeout computed from the time left, optional stages (e.g. function selection)
+are skipped when too little time is left for the stages after them, and stages that take longer
+than planned are logged.
+
+The evaluator also allows MAX_CALLS_PER_TURN API calls per turn. The `Deadline` counts the calls of the turn, so that
+retries (see `resilience.py`) only use calls that the later stages do not need, and a call past the limit is refused.
+"""
+import contextlib
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+
+TURN_TIMEOUT = float(os.environ.get("TURN_TIMEOUT", 7.0))
+# Time kept back for returning the response and for clock differences with the evaluator.
+DEADLINE_MARGIN = float(os.environ.get("DEADLINE_MARGIN", 0.5))
+MAX_CALLS_PER_TURN = int(os.environ.get("MAX_CALLS_PER_TURN", 2))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage would start with no time left."""
+
+
+class CallLimitExceeded(RuntimeError):
+    """Raised when an API call would exceed the calls allowed per turn."""
+
+
+class Deadline:
+    """
+    The time budget of one turn.
+
+    Args:
+        budget: The seconds available for the turn.
+        margin: The seconds kept back at the end of the turn.
+        clock: A monotonic clock, replaceable in tests.
+        stats: A Counter shared across turns, updated with overruns, skipped stages, timeouts and refused calls.
+        max_calls: The API calls allowed in the turn, including retries.
+    """
+    def __init__(self, budget: float = TURN_TIMEOUT, margin: float = DEADLINE_MARGIN,
+                 clock: Callable[[], float] = time.monotonic, stats: Optional[Counter] = None,
+                 max_calls: int = MAX_CALLS_PER_TURN):
+        self.clock = clock
+        self.start = clock()
+        self.expires_at = self.start + budget - margin
+        self.stats = stats if stats is not None else Counter()
+        self.stages: List[Dict] = []
+        self.max_calls = max_calls
+        self.calls = 0
+        self._calls_lock = threading.Lock()  # the calls of a speculative turn are made from several threads
+        self.stats["turns"] += 1
+
+    def elapsed(self) -> float:
+        return self.clock() - self.start
+
+    def remaining(self) -> float:
+        """The seconds left until the deadline (negative once it has passed)."""
+        return self.expires_at - self.clock()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, reserve: float = 0.0, cap: Optional[float] = None) -> float:
+        """
+        Returns the timeout of a call that must leave `reserve` seconds for the later stages,
+        at most `cap`. Raises `DeadlineExceeded` if no time is left for it.
+        """
+        timeout = self.remaining() - reserve
+        if cap is not None:
+            timeout = min(timeout, cap)
+        if timeout <= 0:
+            raise DeadlineExceeded(f"{self.remaining():.2f}s left, {reserve:.2f}s reserved")
+        return timeout
+
+    def allows(self, needed: float, reserve: float = 0.0) -> bool:
+        """Whether an optional stage that needs `needed` seconds fits before the `reserve` of the later stages."""
+        return self.remaining() - reserve >= needed
+
+    def calls_left(self) -> int:
+        """The API calls the turn still allows."""
+        return max(0, self.max_calls - self.calls)
+
+    def take_call(self, reserve: int = 0) -> bool:
+        """
+        Counts an API call if it leaves `reserve` calls for the later stages of the turn.
+        Returns whether the call may be made.
+        """
+        with self._calls_lock:
+            if self.max_calls - self.calls - reserve < 1:
+                self.stats["calls_refused"] += 1
+                return False
+            self.calls += 1
+            return True
+
+    def skip(self, name: str) -> None:
+        """Records that an optional stage was skipped for lack of time."""
+        self.stages.append({"stage": name, "elapsed": 0.0, "planned": None, "skipped": True})
+        self.stats[f"skipped_{name}"] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name: str, planned: Optional[float] = None):
+        """
+        Times a stage. A stage overruns when it takes longer than `planned` seconds (if positive), or ends after the deadline;
+        overruns are counted in `stats` and logged.
+        """
+        start = self.clock()
+        try:
+            yield self
+        except Exception as e:
+            if isinstance(e, TimeoutError) or "timeout" in type(e).__name__.lower() or "timed out" in str(e).lower():
+                self.stats[f"timeout_{name}"] += 1
+            raise
+        finally:
+            elapsed = self.clock() - start
+            self.stages.append({"stage": name, "elapsed": elapsed, "planned": planned, "skipped": False})
+            if (planned and elapsed > planned) or self.expired():
+                self.stats[f"overrun_{name}"] += 1
+                print(f"[DEADLINE] stage '{name}' took {elapsed:.2f}s"
+                      + (f" (planned {planned:.2f}s)" if planned is not None else "")
+                      + f", {self.remaining():.2f}s left in the turn")
+
+    def summary(self) -> Dict:
+        """The elapsed and remaining time of the turn, its API calls and the timings of its stages."""
+        return {"elapsed": self.elapsed(), "remaining": self.remaining(), "calls": self.calls, "stages": list(self.stages)}
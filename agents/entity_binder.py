@@ -0,0 +1,225 @@
+"""
+Binds item and quest name parameters from the dialogue without calling the LLM.
+
+An Aho-Corasick automaton is built once per conversation from the names in
+`knowledge_info` (and a few generated aliases), so that all names mentioned in an
+utterance are found in a single linear pass over the text. Each name keeps the kind
+of its entry ('item' for entries with a `type`, 'quest' otherwise), so that an item
+is never bound to a `quest_name` parameter or the reverse.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Length-preserving normalization, so that match offsets refer to the original text.
+_NORMALIZE = str.maketrans({"-": " ", "’": "'", "_": " "})
+
+ITEM = 'item'
+QUEST = 'quest'
+
+
+@dataclass
+class Binding:
+    """A canonical name found in the dialogue."""
+    name: str
+    source: str  # 'utterance', 'target_item' or 'history'
+    start: int = -1
+    end: int = -1
+    kind: str = ''  # 'item', 'quest', or '' when unknown
+
+
+class AhoCorasick:
+    """A minimal Aho-Corasick automaton over lowercase strings."""
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value: str) -> None:
+        """Adds a pattern. `value` is reported whenever the pattern is found."""
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), value))
+        self._built = False
+
+    def build(self) -> None:
+        """Computes the failure links. Called automatically before the first search."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yields (start, end, value) for every pattern occurrence in `text`."""
+        if not self._built:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield i - length + 1, i + 1, value
+
+
+class EntityBinder:
+    """
+    Finds the known item and quest names mentioned in a dialogue.
+
+    Matches must start and end at word boundaries. Overlapping matches are resolved
+    in favour of the longest name, so "Long Sword" is not also reported as "Sword".
+
+    Args:
+        names: The canonical names.
+        aliases: Optional extra spellings per name.
+        kinds: Optional kind ('item' or 'quest') per name; names without one are bound to any name parameter.
+    """
+    def __init__(self, names: Iterable[str], aliases: Optional[Dict[str, Iterable[str]]] = None,
+                 kinds: Optional[Dict[str, str]] = None):
+        self.names = []
+        self.kinds = dict(kinds or {})
+        self._automaton = AhoCorasick()
+        seen = set()
+        for name in names:
+            if not name or name in seen:
+                continue
+            seen.add(name)
+            self.names.append(name)
+            patterns = set(_generate_aliases(name))
+            if aliases and name in aliases:
+                patterns.update(_normalize(alias) for alias in aliases[name])
+            for pattern in patterns:
+                if pattern:
+                    self._automaton.add(pattern, name)
+        self._automaton.build()
+
+    @classmethod
+    def from_knowledge(cls, knowledge_info: List[Dict[str, str]],
+                       aliases: Optional[Dict[str, Iterable[str]]] = None) -> 'EntityBinder':
+        """Builds a binder from the `knowledge_info` list of a conversation."""
+        names = [item.get("name", "") for item in knowledge_info]
+        kinds = {item.get("name", ""): _entity_kind(item) for item in knowledge_info}
+        return cls(names, aliases, kinds)
+
+    def find(self, text: str) -> List[Binding]:
+        """Returns the names mentioned in `text`, in order of appearance."""
+        normalized = _normalize(text)
+        candidates = []
+        for start, end, name in self._automaton.iter_matches(normalized):
+            if _is_boundary(normalized, start - 1) and _is_boundary(normalized, end):
+                candidates.append((start, end, name))
+        # Longest match first, then keep the non-overlapping ones.
+        candidates.sort(key=lambda c: (c[0] - c[1], c[0]))
+        taken = []
+        for start, end, name in candidates:
+            if all(end <= s or start >= e for s, e, _ in taken):
+                taken.append((start, end, name))
+        taken.sort()
+        return [Binding(name=name, source="utterance", start=start, end=end, kind=self.kinds.get(name, ''))
+                for start, end, name in taken]
+
+    def bind(self, dialogue: List[Dict]) -> List[Binding]:
+        """
+        Proposes name bindings for the current turn, most likely first.
+
+        The order is: names mentioned in the current utterance, the `target_item`s of the
+        current utterance, then names mentioned earlier in the dialogue (most recent first).
+        Each name is proposed at most once.
+        """
+        if not dialogue:
+            return []
+        bindings = []
+        seen = set()
+
+        def add(binding):
+            if binding.name not in seen:
+                seen.add(binding.name)
+                bindings.append(binding)
+
+        current = dialogue[-1]
+        for binding in self.find(current.get("text", "")):
+            add(binding)
+        for item in current.get("target_item") or []:
+            if isinstance(item, dict) and item.get("name"):
+                add(Binding(name=item["name"], source="target_item", kind=self.kinds.get(item["name"], ITEM)))
+        for item in reversed(dialogue[:-1]):
+            for binding in self.find(item.get("text", "")):
+                binding.source = "history"
+                add(binding)
+        return bindings
+
+    def bind_arguments(self, properties: Dict[str, Dict], dialogue: List[Dict]) -> Optional[Dict]:
+        """
+        Fills the name parameters of a function from the dialogue.
+
+        Args:
+            properties: The `properties` of the function's parameters (OpenAI function calling format).
+            dialogue: List[Dict], the dialogue history. `dialogue[-1]` refers to the current turn.
+
+        Returns:
+            A parameter dict, or None when a parameter cannot be bound. Parameters ending in
+            'names' receive all names of the parameter's kind mentioned in the current turn (or
+            the best one), parameters ending in 'name' the best name of their kind.
+        """
+        bindings = self.bind(dialogue)
+        arguments = {}
+        for param_name in properties:
+            if not param_name.endswith(("name", "names")):
+                return None
+            kind = _parameter_kind(param_name)
+            candidates = [b for b in bindings if not kind or not b.kind or b.kind == kind]
+            if not candidates:
+                return None
+            if param_name.endswith("names"):
+                arguments[param_name] = [b.name for b in candidates if b.source != "history"] or [candidates[0].name]
+            else:
+                arguments[param_name] = candidates[0].name
+        return arguments
+
+
+def _entity_kind(knowledge_item: Dict[str, str]) -> str:
+    """The kind of a `knowledge_info` entry: items have a `type` (e.g. 'Bow'), quests do not."""
+    return ITEM if knowledge_item.get("type") else QUEST
+
+
+def _parameter_kind(param_name: str) -> str:
+    """The kind of entity a name parameter expects, e.g. 'item' for `item_names`, or '' for any."""
+    if param_name.startswith("item"):
+        return ITEM
+    if param_name.startswith("quest"):
+        return QUEST
+    return ''
+
+
+def _normalize(text: str) -> str:
+    return text.translate(_NORMALIZE).lower()
+
+
+def _generate_aliases(name: str) -> List[str]:
+    normalized = _normalize(name)
+    aliases = [normalized, normalized.replace("'", "")]
+    if normalized.startswith("the "):
+        aliases.append(normalized[4:])
+    return aliases
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
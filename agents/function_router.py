@@ -0,0 +1,228 @@
+"""
+A lightweight, locally trained router that predicts which functions a turn needs.
+
+The router is trained offline on the `gold_functions` of the training datasets and
+uses hashed word n-gram features with a one-vs-rest logistic regression model.
+The model is stored as plain NumPy arrays, so predicting the function names of a
+turn costs a handful of array lookups instead of an API call.
+"""
+import json
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+DEFAULT_ROUTER_PATH = "data/function_router.npz"
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+@dataclass
+class RouterPrediction:
+    """The function names predicted for a turn, with the router's confidence."""
+    names: List[str]
+    confidence: float
+    scores: Dict[str, float] = field(default_factory=dict)
+
+
+class FunctionRouter:
+    """
+    Predicts the function names needed for a dialogue turn.
+
+    Features are hashed unigrams and bigrams of the current player utterance and of the
+    preceding NPC utterance (so that confirmations such as "Yes, please." can be routed
+    to the action the NPC just proposed), plus a flag for the presence of target items.
+
+    Attributes:
+        labels: The function names the router can predict.
+        weights: float32 array of shape (n_features, n_labels).
+        bias: float32 array of shape (n_labels,).
+        n_features: The size of the hashed feature space.
+    """
+    def __init__(self, labels: Sequence[str], weights: np.ndarray, bias: np.ndarray, n_features: int):
+        self.labels = list(labels)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.n_features = int(n_features)
+        self._label_index = {name: i for i, name in enumerate(self.labels)}
+
+    ############################################################
+    # Features
+    ############################################################
+
+    def featurize(self, dialogue: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Converts a dialogue into a sparse, l2-normalized hashed feature vector.
+
+        Args:
+            dialogue: List[Dict], the dialogue history. `dialogue[-1]` refers to the current turn.
+
+        Returns:
+            (indices, values): the non-zero feature indices and their values.
+        """
+        return _hash_features(_dialogue_features(dialogue), self.n_features)
+
+    ############################################################
+    # Prediction
+    ############################################################
+
+    def predict(self, dialogue: List[Dict], allowed_names: Optional[Iterable[str]] = None,
+                threshold: float = 0.5) -> RouterPrediction:
+        """
+        Predicts the function names for the current turn.
+
+        Args:
+            dialogue: List[Dict], the dialogue history. `dialogue[-1]` refers to the current turn.
+            allowed_names: Optional function names available for the conversation, e.g. the keys of
+                the tool and action registries. Labels outside of this set are never predicted.
+            threshold: Probability above which a function is predicted.
+
+        Returns:
+            RouterPrediction. `confidence` is the probability of the predicted label set as a whole,
+            i.e. the product over all allowed labels of max(p, 1 - p).
+        """
+        indices, values = self.featurize(dialogue)
+        logits = values @ self.weights[indices] + self.bias
+        probs = 1.0 / (1.0 + np.exp(-logits))
+
+        if allowed_names is None:
+            label_ids = range(len(self.labels))
+        else:
+            label_ids = [self._label_index[name] for name in allowed_names if name in self._label_index]
+
+        names = []
+        scores = {}
+        confidence = 1.0
+        for i in label_ids:
+            p = float(probs[i])
+            scores[self.labels[i]] = p
+            if p >= threshold:
+                names.append(self.labels[i])
+                confidence *= p
+            else:
+                confidence *= 1.0 - p
+        return RouterPrediction(names=names, confidence=confidence, scores=scores)
+
+    ############################################################
+    # Training and persistence
+    ############################################################
+
+    @classmethod
+    def train(cls, examples: Sequence[Tuple[List[Dict], Iterable[str]]], n_features: int = 2 ** 12,
+              epochs: int = 400, learning_rate: float = 32.0, l2: float = 1e-4) -> 'FunctionRouter':
+        """
+        Trains a router with full-batch gradient descent.
+
+        Args:
+            examples: (dialogue, gold function names) pairs.
+            n_features: The size of the hashed feature space.
+            epochs: Number of gradient steps.
+            learning_rate: Step size.
+            l2: L2 regularization strength.
+        """
+        labels = sorted({name for _, names in examples for name in names})
+        label_index = {name: i for i, name in enumerate(labels)}
+
+        x = np.zeros((len(examples), n_features), dtype=np.float32)
+        y = np.zeros((len(examples), len(labels)), dtype=np.float32)
+        for row, (dialogue, names) in enumerate(examples):
+            indices, values = _hash_features(_dialogue_features(dialogue), n_features)
+            x[row, indices] = values
+            for name in names:
+                y[row, label_index[name]] = 1.0
+
+        weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+        bias = np.zeros(len(labels), dtype=np.float32)
+        n = max(len(examples), 1)
+        for _ in range(epochs):
+            probs = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+            error = probs - y
+            weights -= learning_rate * (x.T @ error / n + l2 * weights)
+            bias -= learning_rate * error.mean(axis=0)
+
+        return cls(labels, weights, bias, n_features)
+
+    @classmethod
+    def train_from_files(cls, paths: Iterable[str], **kwargs) -> 'FunctionRouter':
+        """Trains a router on the `gold_functions` of the given dataset files (e.g. `data/task1_train.json`)."""
+        examples = []
+        for path in paths:
+            examples.extend(load_router_examples(path))
+        return cls.train(examples, **kwargs)
+
+    def save(self, path: str = DEFAULT_ROUTER_PATH) -> None:
+        """Saves the router as a compressed NumPy archive."""
+        np.savez_compressed(
+            path,
+            labels=np.array(self.labels),
+            weights=self.weights,
+            bias=self.bias,
+            n_features=np.array(self.n_features),
+        )
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_ROUTER_PATH) -> 'FunctionRouter':
+        """Loads a router saved with `save`."""
+        with np.load(path) as data:
+            return cls([str(name) for name in data["labels"]], data["weights"], data["bias"], int(data["n_features"]))
+
+
+def load_router_examples(path: str) -> List[Tuple[List[Dict], List[str]]]:
+    """
+    Loads (dialogue, gold function names) pairs from a dataset file.
+
+    Gold function names are stripped, since the datasets contain names such as
+    'select_request_confirm ' with trailing whitespace.
+    """
+    with open(path, "r", encoding="utf-8") as fp:
+        data = json.load(fp)
+
+    examples = []
+    for conv_data in data:
+        turn_keys = sorted(
+            [k for k in conv_data.keys() if k.startswith("turn_")],
+            key=lambda k: int(k.split("_")[1])
+        )
+        for turn_key in turn_keys:
+            turn_data = conv_data[turn_key]
+            names = sorted({func["name"].strip() for func in turn_data.get("gold_functions", [])})
+            examples.append((turn_data.get("dialogue", []), names))
+    return examples
+
+
+def _dialogue_features(dialogue: List[Dict]) -> List[str]:
+    if not dialogue:
+        return []
+    current = dialogue[-1]
+    features = _ngrams("u", current.get("text", ""))
+    for item in reversed(dialogue[:-1]):
+        if item.get("speaker") == "npc":
+            features.extend(_ngrams("n", item.get("text", "")))
+            break
+    if current.get("target_item"):
+        features.append("has_target_item")
+    return features
+
+
+def _ngrams(prefix: str, text: str) -> List[str]:
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    features = [f"{prefix}:{token}" for token in tokens]
+    features.extend(f"{prefix}:{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+def _hash_features(features: List[str], n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    # crc32 is stable across processes, unlike the salted built-in `hash`.
+    counts = {}
+    for feature in features:
+        index = zlib.crc32(feature.encode("utf-8")) % n_features
+        counts[index] = counts.get(index, 0.0) + 1.0
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values /= norm
+    return indices, values
@@ -0,0 +1,242 @@
+"""
+A persistent SQLite cache in front of chat completion calls.
+
+Re-running the local scripts after a prompt tweak only sends the requests that changed;
+identical requests, including the judge prompts of `local_run_task2.py`, are answered from disk.
+A request is keyed by its model, messages, tools and sampling parameters, canonicalized as JSON
+with sorted keys. Sampled requests (temperature > 0) also carry a seed, so several samples of the
+same prompt can be cached side by side by changing `LLM_CACHE_SEED`.
+
+The cache is disabled unless `LLM_CACHE_PATH` is set, so the evaluation is never answered from it.
+
+Environment variables:
+    LLM_CACHE_PATH: The SQLite file, e.g. `cache/llm_cache.sqlite`.
+    LLM_CACHE_MODE: 'readwrite' (default), or 'replay' to open the file read-only and fail on misses.
+    LLM_CACHE_MAX_ENTRIES: The number of responses kept; least recently used ones are evicted (default 100000).
+    LLM_CACHE_SEED: The seed of sampled requests (default 0).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+CACHE_MODES = ('readwrite', 'replay')
+# Request fields that do not change the response.
+_IGNORED_FIELDS = ('stream', 'timeout', 'extra_headers', 'extra_query', 'user')
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a request is not in the cache."""
+
+
+class LLMCache:
+    """
+    A size-bounded, least-recently-used cache of chat completion responses.
+
+    Args:
+        path: The SQLite file. Its directory is created if needed.
+        max_entries: The number of responses kept.
+        mode: 'readwrite', or 'replay' to only read (misses raise `CacheMiss`).
+        seed: The seed dimension of requests sampled with a non-zero temperature.
+
+    The cache can be shared by threads; calls are serialized by a lock.
+    """
+    def __init__(self, path: str, max_entries: int = 100000, mode: str = 'readwrite', seed: int = 0):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.path = path
+        self.max_entries = max_entries
+        self.mode = mode
+        self.seed = seed
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if mode == 'replay':
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self._clock = 0
+        else:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_used INTEGER)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+            self._clock = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM responses").fetchone()[0]
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_env(cls) -> Optional['LLMCache']:
+        """Returns a cache configured from the environment variables, or None if `LLM_CACHE_PATH` is not set."""
+        path = os.environ.get("LLM_CACHE_PATH")
+        if not path:
+            return None
+        return cls(
+            path,
+            max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 100000)),
+            mode=os.environ.get("LLM_CACHE_MODE", "readwrite"),
+            seed=int(os.environ.get("LLM_CACHE_SEED", 0)),
+        )
+
+    ############################################################
+    # Keys.
+    ############################################################
+    def key(self, request: Dict[str, Any]) -> str:
+        """
+        Returns the cache key of a request (the keyword arguments of `chat.completions.create`).
+        """
+        request = {k: v for k, v in request.items() if k not in _IGNORED_FIELDS and v is not None}
+        if request.get('temperature', 1.0) != 0 and 'seed' not in request:
+            request['seed'] = self.seed
+        canonical = json.dumps(_canonical(request), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=20).hexdigest()
+
+    ############################################################
+    # Lookups.
+    ############################################################
+    def get(self, key: str) -> Optional[str]:
+        """Returns the stored response of `key`, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode != 'replay':
+                self._clock += 1
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (self._clock, key))
+                self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = '') -> None:
+        """Stores a response, evicting the least recently used ones beyond `max_entries`."""
+        if self.mode == 'replay':
+            return
+        with self._lock:
+            self._clock += 1
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, time.time(), self._clock),
+            )
+            self.writes += 1
+            self._entries += 0 if exists else 1
+            if self._entries > self.max_entries:
+                # evict a batch at once, so that a full cache does not delete on every write
+                excess = self._entries - self.max_entries + max(1, self.max_entries // 100)
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self.evictions += excess
+                self._entries -= excess
+            self._conn.commit()
+
+    def create(self, create: Callable, **request):
+        """
+        Returns `create(**request)` from the cache, calling it on a miss.
+        `create` is `client.chat.completions.create` of an OpenAI client; responses are stored as JSON
+        and restored as `ChatCompletion` objects, so callers read them as usual.
+        Streaming requests are not cached.
+        """
+        if request.get('stream'):
+            return create(**request)
+        from openai.types.chat import ChatCompletion
+
+        key = self.key(request)
+        cached = self.get(key)
+        if cached is not None:
+            return ChatCompletion.model_validate_json(cached)
+        self._check_replay(key)
+        response = create(**request)
+        self.put(key, response.model_dump_json(), request.get('model', ''))
+        return response
+
+    async def acreate(self, create: Callable, **request):
+        """Coroutine version of `create`, for `AsyncOpenAI` clients."""
+        if request.get('stream'):
+            return await create(**request)
+        from openai.types.chat import ChatCompletion
+
+        key = self.key(request)
+        cached = self.get(key)
+        if cached is not None:
+            return ChatCompletion.model_validate_json(cached)
+        self._check_replay(key)
+        response = await create(**request)
+        self.put(key, response.model_dump_json(), request.get('model', ''))
+        return response
+
+    def text(self, request: Dict[str, Any], generate: Callable[[], str]) -> str:
+        """
+        Returns the text generated for `request` from the cache, calling `generate()` on a miss.
+        For clients other than OpenAI, e.g. `{'model': ..., 'prompt': ...}` for Gemini.
+        """
+        key = self.key(request)
+        cached = self.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        self._check_replay(key)
+        text = generate()
+        self.put(key, json.dumps(text), request.get('model', ''))
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the hit/miss counters of this process and the number of stored responses."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': self._entries,
+            'mode': self.mode,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _check_replay(self, key):
+        if self.mode == 'replay':
+            raise CacheMiss(f"Request {key} is not in the replay cache {self.path}")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> Optional[LLMCache]:
+    """
+    Returns the cache configured by the environment variables, shared by the agents and the judge
+    of the process, or None if caching is disabled.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache.from_env()
+        return _default_cache
+
+
+def _canonical(value):
+    if hasattr(value, 'model_dump'):
+        # e.g. assistant messages with tool calls, passed back to the API as pydantic objects
+        value = value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
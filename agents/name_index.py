@@ -0,0 +1,143 @@
+"""
+Maps near-miss item and quest names to their canonical names.
+
+Names are normalized (lowercase, punctuation to spaces) and split into padded character
+trigrams, which are stored in an inverted index. A query only visits the names that share
+at least one trigram with it, so lookups stay fast as the number of names grows, and
+"Avis-Wind", "avis wind" or "avis wind sword" all resolve to "Avis Wind".
+
+A near miss is only resolved when it is unambiguous: the query must be long enough and its best
+match must score clearly above the runner-up. "Sword" matches "Long Sword" and "Short Sword" almost
+equally, so it is left as is rather than turned into a confident, wrong name.
+
+The index does not depend on the evaluation code, so it can be used by agents, and by the
+Executor through its `name_resolver` argument (see `function_calls/executor.py`).
+"""
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+# Parameters whose values are item or quest names.
+NAME_PARAMETERS = ('item_name', 'quest_name', 'item_names', 'quest_names')
+
+
+class NameIndex:
+    """
+    A character trigram index over canonical names.
+
+    Args:
+        names: The canonical names.
+        min_score: The default Dice similarity of trigram sets required by `resolve`.
+        min_margin: The lead of the best match over the runner-up required by `resolve`.
+        min_length: The normalized length of the shortest query `resolve` maps to a different name.
+    """
+    def __init__(self, names: Iterable[str] = (), min_score: float = 0.6, min_margin: float = 0.15, min_length: int = 4):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.min_length = min_length
+        self.names: List[str] = []
+        self._exact: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._gram_counts: List[int] = []
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return _normalize(name) in self._exact
+
+    def add(self, name: str) -> None:
+        """Adds a canonical name. Names that normalize to a known name are ignored."""
+        if not isinstance(name, str):
+            return
+        key = _normalize(name)
+        if not key or key in self._exact:
+            return
+        name_id = len(self.names)
+        self.names.append(name)
+        self._exact[key] = name_id
+        grams = _trigrams(key)
+        self._gram_counts.append(len(grams))
+        for gram in grams:
+            self._postings[gram].append(name_id)
+
+    def search(self, query: str, limit: int = 3) -> List[Tuple[str, float]]:
+        """
+        Returns up to `limit` (name, score) pairs, best first.
+        The score is 1.0 for a normalized exact match, else the Dice similarity of the trigram sets.
+        """
+        if not isinstance(query, str):
+            return []
+        key = _normalize(query)
+        if key in self._exact:
+            return [(self.names[self._exact[key]], 1.0)]
+        grams = _trigrams(key)
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        scored = [(2.0 * count / (len(grams) + self._gram_counts[name_id]), name_id) for name_id, count in shared.items()]
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [(self.names[name_id], score) for score, name_id in scored[:limit]]
+
+    def resolve(self, query: str, min_score: Optional[float] = None) -> Optional[str]:
+        """
+        Returns the canonical name of `query`, or None if no name is similar enough, the query is
+        shorter than `min_length`, or the best match leads the runner-up by less than `min_margin`.
+        """
+        matches = self.search(query, limit=2)
+        if not matches:
+            return None
+        name, score = matches[0]
+        if score == 1.0:
+            return name
+        threshold = self.min_score if min_score is None else min_score
+        if score < threshold or len(_normalize(query)) < self.min_length:
+            return None
+        if len(matches) > 1 and score - matches[1][1] < self.min_margin:
+            return None
+        return name
+
+    def canonicalize_parameters(self, parameters: Dict) -> Dict:
+        """Returns a copy of function parameters with item and quest names resolved; unknown names are kept."""
+        resolved = dict(parameters)
+        for param_name in NAME_PARAMETERS:
+            value = resolved.get(param_name)
+            if isinstance(value, str):
+                resolved[param_name] = self.resolve(value) or value
+            elif isinstance(value, list):
+                resolved[param_name] = [self.resolve(v) or v if isinstance(v, str) else v for v in value]
+        return resolved
+
+    @classmethod
+    def from_knowledge(cls, knowledge_info: List[Dict[str, str]], min_score: float = 0.6) -> 'NameIndex':
+        """Builds an index from the `knowledge_info` list of a conversation."""
+        return cls([item.get("name", "") for item in knowledge_info], min_score)
+
+    @classmethod
+    def from_conversation(cls, conversation, min_score: float = 0.6) -> 'NameIndex':
+        """
+        Builds an index from what the agent sees of an `npcdataset.Conversation`: its knowledge and the
+        target items of its messages. Gold function parameters are never used, so that resolving names
+        does not give a local run names taken from the answers.
+        """
+        index = cls.from_knowledge(conversation.knowledge, min_score)
+        for turn in conversation.turns:
+            for message in turn.messages:
+                for item in message.target_items or ():
+                    index.add(item.get("name", "") if isinstance(item, dict) else item)
+        return index
+
+
+def _normalize(text: str) -> str:
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def _trigrams(key: str) -> frozenset:
+    padded = f" {key} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
@@ -2,7 +2,13 @@ import google.generativeai as genai
 # from google.generativeai.types import Content
 import json
 import os
-import time
+from collections import Counter
+
+from agents.deadline import Deadline
+from agents.llm_cache import default_cache
+from agents.rate_limiter import shared_rate_limiter
+from agents.resilience import classify_error, default_resilience
+from agents.token_budget import estimate_tokens
 
 def invoke_function_calling_llm():
     pass
@@ -32,27 +38,30 @@ class NewGeminiAgent(object):
 
         genai.configure(api_key=os.environ.get("GEMINI_API_KEY")) 
         self.model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+        # Optional on-disk response cache for local runs, enabled by LLM_CACHE_PATH (see agents/llm_cache.py). 
+        self.llm_cache = default_cache()
+        # Failed calls are retried with backoff within their timeout, behind a shared circuit breaker (see agents/resilience.py). 
+        self.resilience = default_resilience("gemini")
+
+        # 호출 한도(RPM/TPM)는 같은 프로세스의 모든 Gemini 에이전트가 공유하는 rate limiter로 관리 
+        # Calls only wait when the quotas require it (see agents/rate_limiter.py), and never beyond the deadline. 
+        self.rate_limiter = shared_rate_limiter(
+            self.model.model_name,
+            rpm=int(os.environ.get("GEMINI_RPM", 15)),
+            tpm=int(os.environ.get("GEMINI_TPM", 1000000)),
+        )
 
-        # 호출 통계용 변수 초기화
-        self.call_count = 0
-        self.call_times = []  # 각 호출 시각 저장
+        # Each turn must be answered within TURN_TIMEOUT seconds (see agents/deadline.py). 
+        # The function inference call is skipped unless `response_reserve` seconds are left for the response call. 
+        self.response_reserve = float(os.environ.get("RESPONSE_RESERVE", 2.5))
+        self.min_call_time = float(os.environ.get("MIN_CALL_TIME", 1.0))
+        self.deadline_stats = Counter()
 
     ############################################################
     # The entrypoint of the evaluator.  
     ############################################################
     def generate_functions_and_responses(self, tool_registry, action_registry, worldview, persona, role, knowledge, state, dialogue, executor):
-        # 호출 통계 업데이트
-        self.call_count += 1
-        now = time.time()
-        self.call_times.append(now)
-        
-        # 1분 이내 호출만 필터링
-        one_min_ago = now - 60
-        recent_calls = [t for t in self.call_times if t > one_min_ago]
-        calls_per_min = len(recent_calls)
-
-        # 디버깅 출력
-        print(f"[Gemini 호출] 총 호출 횟수: {self.call_count}, 최근 1분 호출 횟수: {calls_per_min}")
+        deadline = Deadline(stats=self.deadline_stats)
 
         # Step 1: Function Calling용 메시지 생성
         function_messages, all_functions = self._create_messages_for_function(tool_registry, action_registry, dialogue)
@@ -62,12 +71,19 @@ class NewGeminiAgent(object):
         print(function_prompt)
         print("=====================")
 
-        # Step 2: Gemini로 함수 추론
-        response = self.model.generate_content(function_prompt)
-        time.sleep(4)  # 요청 간 딜레이 추가
-
-        # Step 3: 함수 파싱 및 실행
-        functions_to_call = self._extract_function_calls(response.text)
+        # Step 2: Gemini로 함수 추론 (시간이 부족하면 생략)
+        functions_to_call = []
+        try:
+            if deadline.allows(self.min_call_time + self.rate_limiter.delay(estimate_tokens(function_prompt)), reserve=self.response_reserve):
+                with deadline.stage("select_functions", planned=max(0.0, deadline.remaining() - self.response_reserve)):
+                    response_text = self._generate(function_prompt, deadline, reserve=self.response_reserve, reserve_calls=1)
+                # 함수 파싱
+                functions_to_call = self._extract_function_calls(response_text)
+            else:
+                deadline.skip("function_call")
+        except Exception as e:
+            print(f"[ERROR] Function inference failed ({classify_error(e)}): {e}")
+        # Step 3: 함수 실행
         function_results = executor.execute(functions_to_call)
 
         # Step 4: 응답 생성용 메시지 구성
@@ -79,24 +95,45 @@ class NewGeminiAgent(object):
         print("=====================")
 
         # Step 5: Gemini로 응답 생성
-        response = self.model.generate_content(full_prompt)
-        time.sleep(4)  # 요청 간 딜레이 추가
-
-        # 호출 통계 업데이트 (응답 생성도 한 번의 호출이므로)
-        self.call_count += 1
-        now2 = time.time()
-        self.call_times.append(now2)
-
-        # 다시 1분당 호출 확인
-        recent_calls2 = [t for t in self.call_times if t > now2 - 60]
-        calls_per_min2 = len(recent_calls2)
-
-        print(f"[Gemini 호출] 총 호출 횟수: {self.call_count}, 최근 1분 호출 횟수: {calls_per_min2}")
+        try:
+            with deadline.stage("response"):
+                response_text = self._generate(full_prompt, deadline)
+        except Exception as e:
+            response_text = "Sorry, I encountered an error generating a response."
+            deadline.stats["fallback"] += 1
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
 
         return {
-            'final_responses': response.text
+            'final_responses': response_text
         }
-    
+
+    def _generate(self, prompt, deadline=None, reserve=0.0, reserve_calls=0):
+        """
+        Generates text for a prompt, through the response cache when it is enabled. 
+        Every attempt, retries included, waits for the rate limiter, but only as long as `deadline` leaves `reserve` seconds 
+        for the later stages and `min_call_time` seconds for itself, and then gets the time left as its timeout (see `self.resilience`). 
+        Each attempt takes one of the calls of `deadline`, and retries leave `reserve_calls` calls for the later stages. 
+        """
+        tokens = estimate_tokens(prompt)
+
+        def attempt(left):
+            if deadline is None:
+                self.rate_limiter.acquire(tokens)
+                return self.model.generate_content(prompt).text
+            # past the wait, the call is made over the quota; a rate-limit error is then retried by `self.resilience` 
+            self.rate_limiter.acquire(tokens, max_wait=deadline.remaining() - reserve - self.min_call_time, strict=False)
+            left = deadline.timeout(reserve=reserve, cap=left)
+            return self.model.generate_content(prompt, request_options={"timeout": left}).text
+
+        def generate():
+            if deadline is None:
+                return self.resilience.call(attempt)
+            return self.resilience.call(attempt, deadline.timeout(reserve=reserve), deadline=deadline, reserve_calls=reserve_calls)
+
+        if self.llm_cache is None:
+            return generate()
+        return self.llm_cache.text({"model": self.model.model_name, "prompt": prompt}, generate)
+
     def _extract_function_calls(self, response_text):
         """
         Gemini는 function calling을 지원하지 않으므로,
@@ -1,9 +1,23 @@
 from typing import List, Dict
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import copy
+import hashlib
 import os
+import re
+import time
 from openai import OpenAI
 import json
 
+from agents.deadline import MAX_CALLS_PER_TURN, Deadline
+from agents.entity_binder import EntityBinder
+from agents.function_router import DEFAULT_ROUTER_PATH, FunctionRouter
+from agents.llm_cache import default_cache
+from agents.name_index import NameIndex
+from agents.resilience import classify_error, default_resilience
+from agents.streaming import SentenceCutoff, StreamStats
+from agents.token_budget import REPLY_TOKENS, TOKENS_PER_MESSAGE, Section, TokenBudget, TokenCounter
+
 
 
 class NewOpenAIAgent(object):
@@ -24,9 +38,11 @@ class NewOpenAIAgent(object):
         """
         Initialize an openai agent. You can assume that the API keys are automatically configured in the environment variables. 
         """
+        # Retries are disabled, since they could outlive the time budget of the turn. 
         self.client = OpenAI(
             api_key=os.environ.get("OPENAI_API_KEY"),
-            base_url=os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+            base_url=os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            max_retries=0
         )
 
         self.model = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
@@ -35,26 +51,92 @@ class NewOpenAIAgent(object):
         self.max_tokens = int(os.environ.get("MAX_TOKENS", 200))
         self.MAX_TOKENS_FUNCTION_CALL=2000
 
+        # The API track allows 2000 input and 200 output tokens per call. Prompts over the input budget are 
+        # trimmed by priority (see agents/token_budget.py). The budget is on by default only when tokens are counted 
+        # exactly with tiktoken, so estimates never change the prompts; MAX_INPUT_TOKENS sets it explicitly (0 disables it). 
+        self.token_budget = None
+        counter = TokenCounter(self.model)
+        max_input_tokens = int(os.environ.get("MAX_INPUT_TOKENS", 2000 if counter.exact else 0))
+        if max_input_tokens > 0:
+            self.token_budget = TokenBudget(max_input_tokens, counter=counter)
+            self.max_tokens = min(self.max_tokens, self.token_budget.max_output_tokens)
+        self.token_stats = Counter()
+        # Each turn must be answered within TURN_TIMEOUT seconds (see agents/deadline.py). API calls get timeouts 
+        # from the time left, and the function-selection call is skipped unless RESPONSE_RESERVE seconds 
+        # would still be left for the response call after at least MIN_CALL_TIME seconds for itself. 
+        self.response_reserve = float(os.environ.get("RESPONSE_RESERVE", 2.5))
+        self.min_call_time = float(os.environ.get("MIN_CALL_TIME", 1.0))
+        self.deadline_stats = Counter()
+        # Responses are streamed and closed once MAX_SENTENCES sentences are complete (see agents/streaming.py), 
+        # unless STREAM_RESPONSES=0 or the response cache is enabled, which does not store streams. 
+        self.stream_responses = os.environ.get("STREAM_RESPONSES", "1") == "1"
+        self.max_sentences = int(os.environ.get("MAX_SENTENCES", 2))
+        self.stream_stats = StreamStats()
+        # Failed calls are retried with backoff within their timeout, behind a circuit breaker shared by the 
+        # OpenAI agents of the process (see agents/resilience.py). 
+        self.resilience = default_resilience("openai")
+        # Optional on-disk response cache for local runs, enabled by LLM_CACHE_PATH (see agents/llm_cache.py). 
+        self.llm_cache = default_cache()
+
+        # Function calling is disabled by default. When enabled, the local router is consulted first, 
+        # and the function-selection API call is skipped when the router is confident. 
+        self.use_function_calls = os.environ.get("USE_FUNCTION_CALLS", "0") == "1"
+        self.router = None
+        router_path = os.environ.get("FUNCTION_ROUTER_PATH", DEFAULT_ROUTER_PATH)
+        if os.path.exists(router_path):
+            self.router = FunctionRouter.load(router_path)
+        self.router_min_confidence = float(os.environ.get("ROUTER_MIN_CONFIDENCE", 0.9))
+        # In the combined mode, one call returns both the function calls and a draft response, and the 
+        # second call is only made when the function results can change the answer (see `_generate_combined`). 
+        self.combined_call = os.environ.get("COMBINED_CALL", "0") == "1"
+        self.combined_stats = Counter()
+        # In the speculative mode, the response is generated without function results in parallel with the 
+        # function-selection call, on turns where the router expects no tool information (see `_generate_speculative`). 
+        # The evaluator allows MAX_CALLS_PER_TURN API calls per turn, counted by the turn's `Deadline` (retries included), 
+        # so a discarded speculation is only regenerated when a call is left. 
+        self.speculative_response = os.environ.get("SPECULATIVE_RESPONSE", "0") == "1"
+        self.speculation_min_confidence = float(os.environ.get("SPECULATION_MIN_CONFIDENCE", 0.8))
+        self.max_calls_per_turn = MAX_CALLS_PER_TURN
+        self.speculative_stats = Counter()
+        self._speculation_pool = ThreadPoolExecutor(max_workers=4) if self.speculative_response else None
+        # Entity binders, name indexes and static prompt blocks are built once per conversation. 
+        self._conversation_cache = OrderedDict()
+        self.max_cached_conversations = 64
+
 
     ############################################################
     # The entrypoint of the evaluator.  
     ############################################################
     def generate_functions_and_responses(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor): 
+        deadline = Deadline(stats=self.deadline_stats, max_calls=self.max_calls_per_turn)
+        if self.combined_call:
+            reply = self._generate_combined(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline)
+            return {"final_responses": reply}
+
+        if self.use_function_calls and self.speculative_response and self._should_speculate(tool_registry, action_registry, dialogue):
+            reply = self._generate_speculative(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline)
+            return {"final_responses": reply}
+
+        function_results = [] # only for task2
+        if self.use_function_calls:
+            try:
+                with deadline.stage("select_functions", planned=max(0.0, deadline.remaining() - self.response_reserve)):
+                    functions_to_call = self._select_functions(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, deadline)
+                function_results = executor.execute(functions_to_call)
+            except Exception as e:
+                # the response is still generated, without function results
+                print(f"[ERROR] Function selection failed ({classify_error(e)}): {e}")
+
         try:
-            function_results = [] # only for task2
-            messages_resp = self._create_messages_for_dialogue(worldview, npc_persona, role, knowledge, state, dialogue, function_results)
-
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages_resp,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                max_tokens=self.max_tokens
-            )
-            reply = response.choices[0].message.content
+            with deadline.stage("response"):
+                reply = self._response_text(
+                    self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, function_results),
+                    timeout=deadline.timeout(), deadline=deadline
+                )
         except Exception as e:
             reply = "Sorry, I encountered an error generating a response."
-            print(f"[ERROR] LLM call failed: {e}")
+            deadline.stats["fallback"] += 1
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
 
         return {"final_responses": reply}
 
@@ -63,6 +145,367 @@ class NewOpenAIAgent(object):
     # Helper functions. 
     ############################################################
 
+    def _select_functions(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, deadline=None):
+        """
+        Selects the function calls of the current turn. 
+        The local router is tried first; the LLM is only called when the router is not confident 
+        or cannot fill in the arguments of the predicted functions, and when the `deadline` leaves 
+        enough time for it and the response call. 
+
+        Returns: 
+            List[Dict], function calls of the form {'name': ..., 'parameters': {...}}. 
+        """
+        functions_to_call = self._route_functions(tool_registry, action_registry, knowledge, dialogue)
+        if functions_to_call is not None:
+            return functions_to_call
+
+        timeout = None
+        if deadline is not None:
+            if not deadline.allows(self.min_call_time, reserve=self.response_reserve):
+                deadline.skip("function_call")
+                return []
+            timeout = deadline.timeout(reserve=self.response_reserve)
+        request = self._function_request(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue)
+        if request is None:
+            # the call would exceed the input limit, so the response is generated without function results 
+            return []
+        # retries leave the call of the response
+        response = self._chat_completion(request, timeout=timeout, deadline=deadline, reserve_calls=1)
+        return self._parse_function_calls(response, knowledge)
+
+    def _generate_combined(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline):
+        """
+        Generates the response of the turn in the combined mode. 
+
+        When the router predicts the functions, they are executed and the response is generated in one call. 
+        Otherwise one call returns the function calls and a draft response as JSON; the functions are executed, 
+        and a second call regenerates the response with their results only if `_needs_second_call`. 
+        `combined_stats` counts how often the second call is made or avoided. 
+        """
+        self.combined_stats["turns"] += 1
+        draft = None
+        function_results = []
+        try:
+            routed = self._route_functions(tool_registry, action_registry, knowledge, dialogue)
+            if routed is not None:
+                self.combined_stats["routed"] += 1
+                function_results = executor.execute(routed)
+            else:
+                with deadline.stage("combined_call"):
+                    response = self._chat_completion(
+                        self._combined_request(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue),
+                        timeout=deadline.timeout(), deadline=deadline
+                    )
+                functions_to_call, draft = self._parse_combined(response, tool_registry, action_registry, knowledge)
+                function_results = executor.execute(functions_to_call) if functions_to_call else []
+                if not _needs_second_call(function_results, tool_registry, draft):
+                    self.combined_stats["second_call_avoided"] += 1
+                    return draft
+                if not deadline.calls_left() or not deadline.allows(self.min_call_time):
+                    deadline.skip("response")
+                    self.combined_stats["second_call_skipped"] += 1
+                    return draft
+
+            with deadline.stage("response"):
+                reply = self._response_text(
+                    self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, function_results),
+                    timeout=deadline.timeout(), deadline=deadline
+                )
+            if routed is None:
+                self.combined_stats["second_call"] += 1
+            return reply
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            if draft:
+                return draft
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+    def _should_speculate(self, tool_registry, action_registry, dialogue):
+        """
+        Whether to generate the response speculatively: when the router is not confident enough to skip 
+        the function-selection call, but expects with at least `speculation_min_confidence` that no tool 
+        (as opposed to an action) is needed, so the response will most likely not depend on function results. 
+        """
+        if self.router is None or not dialogue:
+            return False
+        registry = {**tool_registry['function_registry'], **action_registry['function_registry']}
+        prediction = self.router.predict(dialogue, allowed_names=registry.keys())
+        if prediction.confidence >= self.router_min_confidence:
+            return False
+        return _no_tool_probability(prediction, tool_registry) >= self.speculation_min_confidence
+
+    def _generate_speculative(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, executor, deadline):
+        """
+        Generates the response of the turn speculatively, in parallel with the function selection. 
+
+        The response is requested without function results, and used unless a tool returns information 
+        it could not know (see `_needs_second_call`). In that case it is discarded and regenerated with 
+        the results if the call limit allows; otherwise it is kept and counted as mispredicted. 
+        `speculative_stats["latency_saved"]` adds up the time saved over running both calls back to back. 
+        """
+        self.speculative_stats["turns"] += 1
+        start = time.perf_counter()
+        try:
+            speculation = self._speculation_pool.submit(
+                _timed, self._response_text,
+                self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, []),
+                timeout=deadline.timeout(), deadline=deadline
+            )
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+        function_results = []
+        select_time = 0.0
+        try:
+            with deadline.stage("select_functions", planned=max(0.0, deadline.remaining() - self.response_reserve)):
+                functions_to_call, select_time = _timed(
+                    self._select_functions, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue, deadline
+                )
+            function_results = executor.execute(functions_to_call)
+        except Exception as e:
+            print(f"[ERROR] Function selection failed ({classify_error(e)}): {e}")
+
+        try:
+            with deadline.stage("response"):
+                reply, response_time = speculation.result()
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            reply = None
+
+        if reply is not None and not _needs_second_call(function_results, tool_registry, reply):
+            self.speculative_stats["used"] += 1
+            self.speculative_stats["latency_saved"] += select_time + response_time - (time.perf_counter() - start)
+            return reply
+        if not deadline.calls_left() or not deadline.allows(self.min_call_time):
+            if reply is not None:
+                self.speculative_stats["mispredicted"] += 1
+                return reply
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+        self.speculative_stats["discarded"] += 1
+        try:
+            with deadline.stage("response"):
+                return self._response_text(
+                    self._response_request(worldview, npc_persona, role, knowledge, state, dialogue, function_results),
+                    timeout=deadline.timeout(), deadline=deadline
+                )
+        except Exception as e:
+            print(f"[ERROR] LLM call failed ({classify_error(e)}): {e}")
+            if reply is not None:
+                return reply
+            deadline.stats["fallback"] += 1
+            return "Sorry, I encountered an error generating a response."
+
+    def _combined_request(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue):
+        """
+        Returns the keyword arguments of the combined API call: the response prompt, followed by 
+        the available functions and the JSON output format. 
+        """
+        instructions = self._lookup_cached(
+            ("combined_instructions", tuple(_function_names(tool_registry, action_registry))),
+            lambda: _render_combined_instructions(tool_registry, action_registry)
+        )
+        messages = self._create_messages_for_dialogue(worldview, npc_persona, role, knowledge, state, dialogue, [], instructions)
+        return dict(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_tokens=self.max_tokens,
+            response_format={"type": "json_object"}
+        )
+
+    def _parse_combined(self, response, tool_registry, action_registry, knowledge):
+        """
+        Reads the function calls and the draft response of a combined API response. 
+        Unknown functions are ignored; a reply that is not valid JSON is used as the draft, without function calls. 
+
+        Returns: 
+            (List[Dict] of function calls, str draft response)
+        """
+        content = response.choices[0].message.content or ""
+        try:
+            output = json.loads(content)
+        except json.JSONDecodeError:
+            return [], content.strip()
+        if not isinstance(output, dict):
+            return [], content.strip()
+
+        known = set(_function_names(tool_registry, action_registry))
+        functions_to_call = []
+        for call in output.get("function_calls") or []:
+            if not isinstance(call, dict) or call.get("name") not in known:
+                continue
+            parameters = call.get("parameters")
+            parameters = self._get_name_index(knowledge).canonicalize_parameters(parameters) if isinstance(parameters, dict) else {}
+            functions_to_call.append({"name": call["name"], "parameters": parameters})
+        draft = output.get("draft_response")
+        return functions_to_call, draft.strip() if isinstance(draft, str) else ""
+
+    def _chat_completion(self, request, timeout=None, deadline=None, reserve_calls=0):
+        """
+        Sends a chat completion request, through the response cache when it is enabled. 
+        `timeout` is the time in seconds for the request, including its retries (see `self.resilience`). 
+        Each attempt takes one of the calls of the turn's `deadline`, and retries leave `reserve_calls` calls for the later stages. 
+        """
+        def send(**request):
+            return self.resilience.call(lambda left: self.client.chat.completions.create(**_with_timeout(request, left)), timeout,
+                                        deadline=deadline, reserve_calls=reserve_calls)
+
+        if self.llm_cache is None:
+            return send(**request)
+        return self.llm_cache.create(send, **request)
+
+    def _response_text(self, request, timeout=None, deadline=None):
+        """
+        Generates the text of a response request. The response is streamed unless streaming is disabled, 
+        and the stream is closed as soon as `max_sentences` sentences are complete. 
+        The time to first token and the total time are recorded in `stream_stats`. 
+        """
+        start = time.perf_counter()
+        if not self.stream_responses or self.llm_cache is not None:
+            response = self._chat_completion(request, timeout=timeout, deadline=deadline)
+            self.stream_stats.record(None, time.perf_counter() - start, False)
+            return response.choices[0].message.content
+
+        def stream_text(left):
+            cutoff = SentenceCutoff(self.max_sentences)
+            first_token = None
+            stream = self.client.chat.completions.create(**_with_timeout(dict(request, stream=True), left))
+            try:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    if cutoff.feed(delta):
+                        break
+            finally:
+                stream.close()
+            return cutoff, first_token
+
+        cutoff, first_token = self.resilience.call(stream_text, timeout, deadline=deadline)
+        self.stream_stats.record(first_token, time.perf_counter() - start, cutoff.cut)
+        return cutoff.result()
+
+    def _function_request(self, tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue):
+        """
+        Returns the keyword arguments of the function-selection API call, or None when no function 
+        definitions fit into the input token budget. 
+        """
+        messages_func, all_functions = self._create_messages_for_function(tool_registry, action_registry, worldview, npc_persona, role, knowledge, state, dialogue)
+        if not all_functions:
+            return None
+        return dict(
+            model=self.model,
+            messages=messages_func,
+            tools=all_functions,
+            tool_choice="auto",
+            temperature=0.0,
+            max_tokens=self.max_tokens
+        )
+
+    def _parse_function_calls(self, response, knowledge):
+        """
+        Reads the function calls of a function-selection API response. 
+
+        Returns: 
+            List[Dict], function calls of the form {'name': ..., 'parameters': {...}}. 
+        """
+        functions_to_call = []
+        for tool_call in response.choices[0].message.tool_calls or []:
+            try:
+                parameters = json.loads(tool_call.function.arguments)
+            except json.JSONDecodeError:
+                parameters = {}
+            if isinstance(parameters, dict):
+                # map near-miss names such as "Avis-Wind" to the names in the knowledge
+                parameters = self._get_name_index(knowledge).canonicalize_parameters(parameters)
+            functions_to_call.append({"name": tool_call.function.name, "parameters": parameters})
+        return functions_to_call
+
+    def _response_request(self, worldview, npc_persona, role, knowledge, state, dialogue, function_results):
+        """
+        Returns the keyword arguments of the response-generation API call. 
+        """
+        messages_resp = self._create_messages_for_dialogue(worldview, npc_persona, role, knowledge, state, dialogue, function_results)
+        return dict(
+            model=self.model,
+            messages=messages_resp,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_tokens=self.max_tokens
+        )
+
+    def _route_functions(self, tool_registry, action_registry, knowledge, dialogue):
+        """
+        Predicts the function calls of the current turn with the local router. 
+
+        Returns: 
+            List[Dict] of function calls, or None when the router is unavailable, not confident, 
+            or predicts a function whose arguments cannot be bound from the dialogue. 
+            Name arguments are bound deterministically by the conversation's `EntityBinder`. 
+        """
+        if self.router is None or not dialogue:
+            return None
+        registry = {**tool_registry['function_registry'], **action_registry['function_registry']}
+        prediction = self.router.predict(dialogue, allowed_names=registry.keys())
+        if prediction.confidence < self.router_min_confidence:
+            return None
+
+        binder = self._get_entity_binder(knowledge)
+        functions_to_call = []
+        for name in prediction.names:
+            properties = registry[name]['parameters'].get('properties', {})
+            # search_* functions take free-form criteria, which the router cannot fill in. 
+            if name.startswith('search') or not properties:
+                return None
+            parameters = binder.bind_arguments(properties, dialogue)
+            if parameters is None:
+                return None
+            functions_to_call.append({"name": name, "parameters": parameters})
+        return functions_to_call
+
+    def _get_entity_binder(self, knowledge):
+        """
+        Returns the entity binder for the conversation's knowledge, building it on first use. 
+        """
+        return self._get_cached("entity_binder", knowledge, EntityBinder.from_knowledge)
+
+    def _get_name_index(self, knowledge):
+        """
+        Returns the trigram name index for the conversation's knowledge, building it on first use. 
+        """
+        return self._get_cached("name_index", knowledge, NameIndex.from_knowledge)
+
+    def _get_cached(self, kind, knowledge, build):
+        """
+        Returns `build(knowledge_info)` for the conversation, from a bounded LRU keyed by the knowledge item names. 
+        """
+        key = (kind, tuple(item.get("name", "") for item in knowledge["knowledge_info"]))
+        return self._lookup_cached(key, lambda: build(knowledge["knowledge_info"]))
+
+    def _lookup_cached(self, key, build):
+        """
+        Returns the value cached under `key`, calling `build()` on a miss. Least recently used entries are evicted. 
+        """
+        value = self._conversation_cache.get(key)
+        if value is None:
+            value = build()
+            self._conversation_cache[key] = value
+            # up to one binder, one name index and one static prompt per cached conversation
+            # (the combined-mode instructions are shared by the conversations of a function list)
+            if len(self._conversation_cache) > 4 * self.max_cached_conversations:
+                self._conversation_cache.popitem(last=False)
+        else:
+            self._conversation_cache.move_to_end(key)
+        return value
+
     def _prepare_openai_functions(self, tool_registry, action_registry):
         openai_tool_functions = list(tool_registry['function_registry'].values())
         openai_action_functions = list(action_registry['function_registry'].values())
@@ -83,6 +526,9 @@ class NewOpenAIAgent(object):
         Returns: 
             input_messages: List[Dict], the messages to feed to OpenAI client. 
             all_functions: List[Dict], a list of functions in the OpenAI function calling format. 
+                           Over the input token budget, the definitions are compacted or reduced to the 
+                           functions the router ranks first (see `_fit_function_messages`), and None is 
+                           returned when not even one fits. 
         """
         # 1) Build & validate function definitions
         all_functions = self._prepare_openai_functions(tool_registry, action_registry)
@@ -107,15 +553,13 @@ class NewOpenAIAgent(object):
 
                 
         # 3. 프롬프트 보수적 재작성 + Mentioned Items 포함
-        last = dialogue[-1] if dialogue else {}
-        items = last.get("target_item") or []
+        # Target items and the knowledge names bound from the current utterance, with their exact spelling. 
         mentioned_items_text = ""
-        if isinstance(items, list) and items:
-            names = [i["name"] for i in items if isinstance(i, dict) and "name" in i]
-            if names:
-                mentioned_items_text = (
-                    "\n## Mentioned Item Names from this turn:\n" + "\n".join(f"- {n}" for n in names) + "\n"
-                )
+        names = [b.name for b in self._get_entity_binder(knowledge).bind(dialogue) if b.source != "history"]
+        if names:
+            mentioned_items_text = (
+                "\n## Mentioned Item Names from this turn:\n" + "\n".join(f"- {n}" for n in names) + "\n"
+            )
 
         # npc_identity = f"You are NPC {npc_persona['name']}, a {npc_persona['occupation']} working as {role}."
         # world_context = f"Setting: {state.get('place', '')}, Date: {state.get('date', '')}"
@@ -155,107 +599,359 @@ If you're unsure, it is better to attempt a reasonable function call with minima
             role = "user" if turn["speaker"] == "player" else "assistant"
             messages.append({"role": role, "content": turn.get("text", "")})
 
+        if self.token_budget is not None:
+            self.token_stats["function_calls"] += 1
+            if self.token_budget.counter.count_messages(messages, all_functions) > self.token_budget.limit:
+                messages, all_functions = self._fit_function_messages(messages, all_functions, dialogue)
 
         return messages, all_functions
 
+    def _fit_function_messages(self, messages, all_functions, dialogue):
+        """
+        Fits the function-selection request into the input token budget. 
+        The instructions and the current utterance are always kept. The function definitions are tried 
+        as given, compacted (descriptions without their 'Returns' part and with the parameter documentation 
+        moved into the schema), as summaries (the first paragraph of each description), and finally as the 
+        longest list of summaries, in the order of the router's scores, that fits; the history fills the rest, 
+        newest first. 
 
+        Returns: 
+            (messages, functions), with functions None when not even one definition fits. 
+        """
+        counter = self.token_budget.counter
+        system, previous, current = messages[0], messages[1:-1], messages[-1:]
+        fixed = counter.count_messages([system] + current)
+        for level, functions in self._function_variants(all_functions, dialogue, self.token_budget.limit - fixed):
+            reserved = counter.count_messages([system] + current, functions)
+            if reserved <= self.token_budget.limit:
+                break
+        else:
+            self.token_stats["function_skipped"] += 1
+            return messages, None
+
+        fit = self.token_budget.fit(
+            [Section("history", 3, [m["content"] for m in reversed(previous)], part_overhead=TOKENS_PER_MESSAGE)], reserved
+        )
+        self.token_stats["function_trimmed"] += 1
+        self.token_stats[f"function_{level}"] += 1
+        self.token_stats["dropped_function_history"] += fit.dropped.get("history", 0)
+        return [system] + [previous[len(previous) - 1 - i] for i in reversed(fit.indices["history"])] + current, functions
 
-    def _create_messages_for_dialogue(self, worldview, persona, role, knowledge, state, dialogue, function_results):
+    def _function_variants(self, all_functions, dialogue, available):
+        """
+        Yields (level, function definitions) from the most to the least complete: 'full', 'compact', 'summary' 
+        and, with the router, 'routed': the summaries ranked by the router's score, as many as fit into 
+        `available` tokens, leaving out those scored below `_MIN_ROUTED_SCORE` (the best one is always tried). 
+        The compacted definitions are cached per function list. 
+        """
+        yield "full", all_functions
+        names = tuple(fn["function"]["name"] for fn in all_functions)
+        compact = self._lookup_cached(("compact_functions", names), lambda: [_compact_function(fn, True) for fn in all_functions])
+        yield "compact", compact
+        summaries = self._lookup_cached(("summary_functions", names), lambda: [_compact_function(fn, False) for fn in all_functions])
+        yield "summary", summaries
+        if self.router is None or not dialogue:
+            return
+        scores = self.router.predict(dialogue, allowed_names=names).scores
+        ranked = sorted(range(len(names)), key=lambda i: -scores.get(names[i], 0.0))
+        counter = self.token_budget.counter
+        routed = []
+        for i in ranked:
+            if routed and scores.get(names[i], 0.0) < _MIN_ROUTED_SCORE:
+                # the router rules the rest out, so the budget is left to the history 
+                break
+            if counter.count(json.dumps(routed + [summaries[i]], ensure_ascii=False)) > available:
+                break
+            routed.append(summaries[i])
+        if routed:
+            yield "routed", routed
+
+
+
+    def _create_messages_for_dialogue(self, worldview, persona, role, knowledge, state, dialogue, function_results, instructions=""):
         """
         Based on the background information of the video game and the dialogue history, 
         creates the messages to feed to OpenAI client to generate the text response. 
+        The static part of the system prompt is rendered once per conversation (see `_get_static_blocks`); 
+        only the function results and the dialogue history are assembled per turn. 
+        When the messages exceed the input token budget, they are trimmed by `_fit_dialogue_messages`. 
 
         Args: 
             worldview, persona, role, knowledge, state: They are the background information of the video game scenario. 
             dialogue: List[Dict], the full dialogue history. `dialogue[-1]` refers to the current turn. 
             function_results: A list of function call results. 
+            instructions: Extra instructions appended to the system prompt, and never trimmed. 
         """
-        dialogue_prompt = (
-            "# Instruction\n"
-            "You are not an assistant. You are a character in a fantasy video game.\n"
-            "Stay consistent with your character’s personality and quirks, even when unsure.\n"
-            "You may show light emotion or subtle behavior if it fits the moment.\n"
-            "Speak naturally and briefly, as if talking to another adventurer—not like an AI.\n"
-            "\n"
-            "# Guidelines for your response\n"
-            "- Respond in 1 to 2 short, direct sentences.\n"
-            "- When it feels natural, echo the tone or sentence structure of the player.\n"
-            "- Prioritize relevant in-world knowledge, not poetic or dramatic commentary.\n"
-            "- Include subtle actions or concrete examples if they help make the point.\n"
-            "- Avoid filler or long explanations unless the player’s intent is unclear.\n"
-            "- Never break character or sound like an assistant.\n"
-            "\n"
-            "# Character Settings:\n"
-            "{}\n"
-            "\n"
-            "# General Knowledge of All Items\n"
-            "{}\n"
-            "\n"
-            "# Worldview\n"
-            "{}\n"
-            "\n"
-            "# State\n"
-            "{}\n"
-        )
-        worldview = worldview + '\n' + knowledge['general_info']
+        blocks = self._get_static_blocks(worldview, persona, knowledge)
 
-        # 'persona' is a dict that specifies properties of the character. 
-        character_setting = ""
-        for k, v in persona.items():
-            character_setting += f'- {k}: {v}\n'
-        
         # function_knowledge records the specific knowledge obtained from the function calls. 
-        function_knowledge = ""
+        function_knowledge = []
         for f_result in function_results:
             # record each function call in the following format: 
             # function_name: parameter_name1, parameter_name2, ... -> return_value1, return_value2, ...
-            parameter_info = []
-            return_value_info = []
-            for arg in f_result["parameters"]:
-                parameter_info.append(f'{arg}: {str(f_result["parameters"][arg])}')
-            parameter_info = ", ".join(parameter_info)
+            parameter_info = ", ".join(f'{arg}: {str(value)}' for arg, value in f_result["parameters"].items())
+            return_value_info = ", ".join(str(item) for item in f_result["return"])
+            function_knowledge.append(f'{f_result["name"]}: {parameter_info} -> {return_value_info}\n')
+
+        # prepare the dialogue history. The dataset uses 'npc' to indicate the characters in the game. 
+        history = [
+            {"role": "assistant" if item["speaker"] == "npc" else "user", "content": item["text"]}
+            for item in dialogue
+        ]
+        messages = [{"role": "system", "content": blocks["head"] + "".join(function_knowledge) + blocks["tail"] + instructions}] + history
+
+        if self.token_budget is not None:
+            self.token_stats["response_calls"] += 1
+            if self.token_budget.counter.count_messages(messages) > self.token_budget.limit:
+                messages = self._fit_dialogue_messages(blocks, function_knowledge, history, knowledge, dialogue, instructions)
+        return messages
 
-            for item in f_result["return"]:
-                return_value_info.append(str(item))
-            return_value_info = ", ".join(return_value_info)
-            function_knowledge += f'{f_result["name"]}: {parameter_info} -> {return_value_info}\n'
+    def _fit_dialogue_messages(self, blocks, function_knowledge, history, knowledge, dialogue, instructions=""):
+        """
+        Trims the response messages to the input token budget. 
+        The current utterance and the function results are always kept; then, by priority, 
+        the knowledge of the items targeted in the current turn, the persona, 
+        the history (newest first), the other knowledge items and the worldview (cut to fit). 
+        """
+        counter = self.token_budget.counter
+        # the names mentioned in, or targeted by, the current utterance
+        targets = {b.name for b in self._get_entity_binder(knowledge).bind(dialogue[-1:])}
+        target_ids = [i for i, (name, _) in enumerate(blocks["knowledge"]) if name in targets]
+        other_ids = [i for i, (name, _) in enumerate(blocks["knowledge"]) if name not in targets]
+        previous = history[:-1]
+        sections = [
+            Section("function_results", 0, function_knowledge),
+            Section("target_knowledge", 1, [blocks["knowledge"][i][1] for i in target_ids]),
+            Section("persona", 2, blocks["character"]),
+            Section("history", 3, [m["content"] for m in reversed(previous)], part_overhead=TOKENS_PER_MESSAGE),
+            Section("knowledge", 4, [blocks["knowledge"][i][1] for i in other_ids]),
+            Section("worldview", 5, [blocks["worldview"]], truncatable=True),
+        ]
+        # the instructions, section headings, the system and current messages and the reply priming
+        reserved = (counter.count(_DIALOGUE_PROMPT.format("", "", "", ""))
+                    + 2 * TOKENS_PER_MESSAGE + REPLY_TOKENS + (counter.count(history[-1]["content"]) if history else 0)
+                    + (counter.count(instructions) if instructions else 0))
+
+        # tokenizer counts of separately counted parts can differ slightly from the count of the joined prompt; 
+        # the estimate adds up exactly, since every part ends at whitespace 
+        for _ in range(3 if counter.exact else 1):
+            fit = self.token_budget.fit(sections, reserved)
+            kept, indices = fit.kept, fit.indices
+            knowledge_lines = dict(zip([target_ids[i] for i in indices["target_knowledge"]], kept["target_knowledge"]))
+            knowledge_lines.update(zip([other_ids[i] for i in indices["knowledge"]], kept["knowledge"]))
+            prompt = _DIALOGUE_PROMPT.format(
+                "".join(kept["persona"]),
+                "".join(kept["function_results"]),
+                "".join(knowledge_lines[i] for i in sorted(knowledge_lines)),
+                "".join(kept["worldview"]),
+            ) + instructions
+            kept_history = [previous[len(previous) - 1 - i] for i in reversed(indices["history"])]
+            messages = [{"role": "system", "content": prompt}] + kept_history + history[-1:]
+            if not counter.exact:
+                break
+            overflow = counter.count_messages(messages) - self.token_budget.limit
+            if overflow <= 0:
+                break
+            reserved += overflow
+
+        self.token_stats["response_trimmed"] += 1
+        for name, count in fit.dropped.items():
+            self.token_stats[f"dropped_{name}"] += count
+        for name, count in fit.truncated.items():
+            self.token_stats[f"truncated_{name}"] += count
+        return messages
 
-        
-        # general_knowledge records the general knowledge of all items involved in the dialogue. 
-        general_knowledge = ""
-        for item in knowledge["knowledge_info"]:
-            item_info = []
-            for key in item:
-                item_info.append(f'{key}: {item[key]}')
-            item_info = ", ".join(item_info)
-            general_knowledge += f'{item_info}\n'
-        
-        # prepare the dialogue history. 
-        history_list = []
-        for item in dialogue:
-            # The dataset uses 'npc' to indicate the characters in the game. 
-            role = "user"
-            if item["speaker"] == "npc":
-                role = "assistant"
-            history_list.append({"role":role, "content":item["text"]})
-        
+    def _get_static_blocks(self, worldview, persona, knowledge):
+        """
+        Returns the parts of the response system prompt that do not change within a conversation: 
+        the instructions, character settings, general knowledge of all items and worldview, 
+        both rendered as the text around the function results and as the blocks that `_fit_dialogue_messages` can drop. 
+        They are cached in the bounded LRU of the conversation caches, keyed by the content of their inputs, 
+        so a conversation whose persona or knowledge changes gets a new entry instead of a stale prompt. 
+        """
+        # Strings cache their hash, so keys made of the input strings are cheaper to look up than a digest of them. 
+        key = ("dialogue_prompt", worldview, knowledge["general_info"], _items_key(persona),
+               tuple(_items_key(item) for item in knowledge["knowledge_info"]))
+        return self._lookup_cached(key, lambda: _render_static_blocks(worldview, persona, knowledge))
+
+
+
+_DIALOGUE_PROMPT = (
+    "# Instruction\n"
+    "You are not an assistant. You are a character in a fantasy video game.\n"
+    "Stay consistent with your character’s personality and quirks, even when unsure.\n"
+    "You may show light emotion or subtle behavior if it fits the moment.\n"
+    "Speak naturally and briefly, as if talking to another adventurer—not like an AI.\n"
+    "\n"
+    "# Guidelines for your response\n"
+    "- Respond in 1 to 2 short, direct sentences.\n"
+    "- When it feels natural, echo the tone or sentence structure of the player.\n"
+    "- Prioritize relevant in-world knowledge, not poetic or dramatic commentary.\n"
+    "- Include subtle actions or concrete examples if they help make the point.\n"
+    "- Avoid filler or long explanations unless the player’s intent is unclear.\n"
+    "- Never break character or sound like an assistant.\n"
+    "\n"
+    "# Character Settings:\n"
+    "{}\n"
+    "\n"
+    "# General Knowledge of All Items\n"
+    "{}\n"
+    "\n"
+    "# Worldview\n"
+    "{}\n"
+    "\n"
+    "# State\n"
+    "{}\n"
+)
+
+
+_COMBINED_INSTRUCTIONS = (
+    "\n# Available Functions\n"
+    "{}"
+    "\n# Output Format\n"
+    "Reply with a JSON object only, of the form:\n"
+    '{{"function_calls": [{{"name": "<function name>", "parameters": {{"<parameter name>": "<value>"}}}}], '
+    '"draft_response": "<your reply>"}}\n'
+    "- function_calls: the functions whose results you need to answer the player, with only the parameters "
+    "mentioned or strongly implied in the dialogue. Use an empty list if none is needed.\n"
+    "- draft_response: your reply as the character. If it depends on function results you do not know yet, "
+    "do not make up the details.\n"
+)
+
+# Return values that carry no information for the response.
+_UNINFORMATIVE_VALUES = ("", "n/a", "none", "null")
+
+# Functions that the router scores lower are not offered when the definitions must be reduced to fit the budget. 
+_MIN_ROUTED_SCORE = 0.01
+
+# The 'Parameters' and 'Returns' headings of the numpy-style function descriptions, 
+# and a documented parameter ("item_name : str" followed by indented lines). 
+_DOC_SECTIONS = re.compile(r"\n[ \t]*(?:Parameters|Returns)[ \t]*:?[ \t]*\n[ \t]*-+[ \t]*\n")
+_PARAMETER_DOC = re.compile(r"^(\w+)[ \t]*:[^\n]*\n((?:[ \t]+\S[^\n]*(?:\n|$))*)", re.M)
+
+
+def _function_names(tool_registry, action_registry):
+    return list(tool_registry['function_registry']) + list(action_registry['function_registry'])
+
+
+def _render_combined_instructions(tool_registry, action_registry):
+    """
+    Lists the available functions with their parameters and the first line of their descriptions. 
+    """
+    lines = []
+    for registry in (tool_registry, action_registry):
+        for name, function in registry['function_registry'].items():
+            parameters = ", ".join(function.get("parameters", {}).get("properties", {}))
+            summary = function.get("description", "").strip().split("\n")[0]
+            lines.append(f"- {name}({parameters}): {summary}\n")
+    return _COMBINED_INSTRUCTIONS.format("".join(lines))
 
-        state_info = ""
-        for k, v in state.items():
-            state_info += f'- {k}: {v}\n'
-        
 
-        # prompt = dialogue_prompt.format(character_setting, function_knowledge, general_knowledge, worldview)
-        prompt = dialogue_prompt.format(character_setting, function_knowledge, general_knowledge, worldview, state_info)
-        
-        # print('===============dialog prompt=============')
-        # print(print)
+def _compact_function(function, with_parameters):
+    """
+    Returns a shorter copy of a function definition: the first paragraph of its description, with whitespace 
+    collapsed, and, if `with_parameters`, the documentation of each parameter as its schema description. 
+    The 'Returns' part of the description is dropped. 
+    """
+    base = function["function"]
+    parts = _DOC_SECTIONS.split(base.get("description", ""))
+    parameters = copy.deepcopy(base["parameters"])
+    if with_parameters and len(parts) > 1:
+        properties = parameters.get("properties", {})
+        for match in _PARAMETER_DOC.finditer(parts[1]):
+            if match.group(1) in properties:
+                properties[match.group(1)]["description"] = " ".join(match.group(2).split())
+    return {"type": "function", "function": dict(base, description=" ".join(parts[0].split()), parameters=parameters)}
+
+
+def _with_timeout(request, timeout):
+    """
+    Returns the request with its timeout, if any. 
+    """
+    return request if timeout is None else dict(request, timeout=timeout)
 
-        messages = []
-        messages.append({"role":"system", "content":prompt})
-        messages.extend(history_list)
 
-        return messages
+def _no_tool_probability(prediction, tool_registry):
+    """
+    The router's probability that none of the tools is needed, assuming independent labels. 
+    """
+    probability = 1.0
+    for name, score in prediction.scores.items():
+        if name in tool_registry['function_registry']:
+            probability *= 1.0 - score
+    return probability
+
+
+def _timed(function, *args, **kwargs):
+    """
+    Returns `function(*args, **kwargs)` and the seconds it took. 
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _needs_second_call(function_results, tool_registry, draft):
+    """
+    Whether the response must be regenerated with the function results: when there is no usable draft, 
+    or when a tool (not an action) returned information that the draft could not know. 
+    """
+    if not draft:
+        return bool(function_results)
+    for f_result in function_results:
+        if f_result["name"] not in tool_registry['function_registry']:
+            continue
+        for item in f_result["return"] or []:
+            values = item.values() if isinstance(item, dict) else [item]
+            if any(str(value).strip().lower() not in _UNINFORMATIVE_VALUES for value in values):
+                return True
+    return False
+
+
+def _fingerprint(value):
+    """
+    Returns a content fingerprint of prompt inputs (dicts keep their insertion order in `repr`). 
+    """
+    return hashlib.blake2b(repr(value).encode("utf-8"), digest_size=16).digest()
+
+
+def _items_key(mapping):
+    """
+    Returns the items of a dict as a hashable key, or their fingerprint if a value is not hashable. 
+    """
+    items = tuple(mapping.items())
+    try:
+        hash(items)
+    except TypeError:
+        return _fingerprint(mapping)
+    return items
+
+
+def _render_static_blocks(worldview, persona, knowledge):
+    """
+    Renders the static part of the response system prompt, as droppable blocks and as the text 
+    before (`head`) and after (`tail`) the function results. 
+
+    The prompt is laid out as the template has always been filled: `format` was given the character settings, 
+    function results, item knowledge, worldview and state for four slots, so the function results fill the 
+    item-knowledge slot, the item knowledge the worldview slot, the worldview the state slot, and the state is not 
+    part of the prompt. Changing the layout changes the responses, so it is kept here. 
+    """
+    blocks = {
+        # 'persona' is a dict that specifies properties of the character. 
+        "character": [f'- {k}: {v}\n' for k, v in persona.items()],
+        # the general knowledge of all items involved in the dialogue, as (item name, line) pairs. 
+        "knowledge": [
+            (item.get("name", ""), ", ".join(f'{key}: {item[key]}' for key in item) + "\n")
+            for item in knowledge["knowledge_info"]
+        ],
+        "worldview": worldview + '\n' + knowledge['general_info'],
+    }
+    # the template has no other braces, so splitting at its slots and joining is the same as `format`
+    parts = _DIALOGUE_PROMPT.split("{}")
+    blocks["head"] = parts[0] + "".join(blocks["character"]) + parts[1]
+    blocks["tail"] = parts[2] + "".join(line for _, line in blocks["knowledge"]) + parts[3] + blocks["worldview"] + parts[4]
+    return blocks
 
 
 
@@ -0,0 +1,124 @@
+"""
+A sliding-window rate limiter for the request and token quotas of an LLM provider.
+
+Providers limit the requests and tokens per minute (RPM and TPM). `RateLimiter` keeps the calls of
+the last window in a deque, so admitting a call within the quotas costs amortized O(1), and only delays a call when it
+would exceed a quota, by exactly the time until enough of the window has expired. Limiters are shared
+by name (`shared_rate_limiter`) so that all agents of a process draw from the same quota.
+"""
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, Optional
+
+
+class RateLimiter:
+    """
+    Admits calls within `rpm` requests and `tpm` tokens per `window` seconds; 0 disables a limit.
+
+    Args:
+        rpm: The requests per window.
+        tpm: The tokens per window. A single call larger than `tpm` is admitted once the window is empty.
+        window: The length of the window in seconds.
+        clock, sleep: Replaceable in tests.
+
+    The limiter can be shared by threads.
+    """
+    def __init__(self, rpm: int = 0, tpm: int = 0, window: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = Counter()
+        self._calls = deque()  # (time, tokens) of the admitted calls, oldest first
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def delay(self, tokens: int = 0) -> float:
+        """Returns the seconds until a call of `tokens` tokens would be admitted (0 if it would be now)."""
+        with self._lock:
+            return self._delay(tokens, self.clock())
+
+    def try_acquire(self, tokens: int = 0) -> float:
+        """Admits a call of `tokens` tokens if it fits now and returns 0; otherwise returns the seconds to wait."""
+        with self._lock:
+            now = self.clock()
+            delay = self._delay(tokens, now)
+            if delay == 0:
+                self._admit(tokens, now)
+            return delay
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None, strict: bool = True) -> bool:
+        """
+        Waits until a call of `tokens` tokens fits the quotas, at most `max_wait` seconds, and admits it.
+        Returns whether it was admitted within the quotas. When the wait would exceed `max_wait`, the call
+        is not admitted if `strict`, or admitted over the quota after waiting `max_wait` seconds otherwise.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                delay = self._delay(tokens, now)
+                budget = None if max_wait is None else max_wait - waited
+                if delay == 0 or (budget is not None and budget <= 0 and not strict):
+                    self._admit(tokens, now)
+                    if waited:
+                        self.stats["waited"] += 1
+                        self.stats["wait_seconds"] += waited
+                    if delay:
+                        self.stats["over_quota"] += 1
+                    return delay == 0
+                if strict and budget is not None and delay > budget:
+                    self.stats["rejected"] += 1
+                    return False
+                sleep_for = delay if budget is None else min(delay, budget)
+            self.sleep(sleep_for)
+            waited += sleep_for
+
+    def summary(self) -> Dict:
+        """The counters, with the requests and tokens in the current window."""
+        with self._lock:
+            self._expire(self.clock())
+            return {**self.stats, "window_requests": len(self._calls), "window_tokens": self._tokens}
+
+    def _delay(self, tokens, now):
+        self._expire(now)
+        delay = 0.0
+        if self.rpm and len(self._calls) >= self.rpm:
+            # the call that must leave the window to make room for one more
+            delay = self._calls[len(self._calls) - self.rpm][0] + self.window - now
+        if self.tpm and self._calls and self._tokens + tokens > self.tpm:
+            excess = self._tokens + tokens - self.tpm
+            freed = 0
+            for start, used in self._calls:
+                freed += used
+                if freed >= excess:
+                    break
+            delay = max(delay, start + self.window - now)
+        return max(0.0, delay)
+
+    def _admit(self, tokens, now):
+        self._calls.append((now, tokens))
+        self._tokens += tokens
+        self.stats["admitted"] += 1
+
+    def _expire(self, now):
+        while self._calls and self._calls[0][0] <= now - self.window:
+            self._tokens -= self._calls.popleft()[1]
+
+
+_shared_limiters: Dict[str, RateLimiter] = {}
+_shared_limiters_lock = threading.Lock()
+
+
+def shared_rate_limiter(name: str, rpm: int = 0, tpm: int = 0) -> RateLimiter:
+    """
+    Returns the limiter registered under `name` (e.g. 'gemini-1.5-flash'), creating it with the
+    given quotas on first use, so that concurrent agents of the process share one quota.
+    """
+    with _shared_limiters_lock:
+        if name not in _shared_limiters:
+            _shared_limiters[name] = RateLimiter(rpm, tpm)
+        return _shared_limiters[name]
@@ -0,0 +1,306 @@
+"""
+Retries, backoff and a circuit breaker for LLM calls.
+
+Errors are classified as rate limits (429), transient errors (408, 409, 5xx, connection errors),
+timeouts, or fatal errors (other 4xx, invalid requests, replay cache misses). Rate limits, transient
+errors and timeouts are retried with jittered exponential backoff, or after the `Retry-After` delay
+of the provider. The retries of a call stay within its timeout, which the agents derive from the
+turn deadline (see `deadline.py`), so a retry is only attempted when enough time is left for it.
+When a call is given the turn's `Deadline`, every attempt also counts against the API calls allowed
+per turn: the first attempt is refused with `CallLimitExceeded` when no call is left, and a retry is
+only made when it leaves enough calls for the later stages of the turn.
+
+A `CircuitBreaker` opens after consecutive retryable failures and fails calls immediately until a
+trial call succeeds, so that an outage costs one fast fallback per turn instead of a full timeout.
+The breaker and the counters are shared by the agents of a provider in the process.
+
+Environment variables:
+    LLM_MAX_ATTEMPTS: The attempts per call, including the first one (default 3).
+    LLM_BACKOFF_BASE: The backoff of the first retry in seconds, doubled after each retry (default 0.25).
+    LLM_BACKOFF_MAX: The longest backoff in seconds (default 4).
+    MIN_CALL_TIME: A retry is only made if at least this many seconds of the timeout are left (default 1).
+    BREAKER_FAILURES: The consecutive failures that open the circuit (default 5).
+    BREAKER_RESET: The seconds the circuit stays open before a trial call (default 30).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+
+RATE_LIMIT = 'rate_limit'
+TRANSIENT = 'transient'
+TIMEOUT = 'timeout'
+FATAL = 'fatal'
+RETRYABLE = (RATE_LIMIT, TRANSIENT, TIMEOUT)
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling the provider while the circuit is open."""
+
+
+def classify_error(error: BaseException) -> str:
+    """Returns the category of an error raised by an OpenAI or Gemini client."""
+    from agents.deadline import CallLimitExceeded, DeadlineExceeded
+    if isinstance(error, (DeadlineExceeded, CallLimitExceeded, CircuitOpen)):
+        # no time or call left in the turn, or the provider is known to be down: retrying would not help
+        return FATAL
+    status = _status_code(error)
+    if status == 429:
+        return RATE_LIMIT
+    if status in (408, 409) or (status is not None and status >= 500):
+        return TRANSIENT
+    if status is not None:
+        return FATAL
+    name = type(error).__name__.lower()
+    if isinstance(error, TimeoutError) or "timeout" in name or "deadlineexceeded" in name:
+        return TIMEOUT
+    if isinstance(error, ConnectionError) or "connection" in name or "unavailable" in name:
+        return TRANSIENT
+    if "resourceexhausted" in name or "ratelimit" in name:
+        return RATE_LIMIT
+    return FATAL
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a provider is down.
+
+    The circuit opens after `failure_threshold` consecutive retryable failures. While it is open,
+    `check` raises `CircuitOpen`; after `reset_timeout` seconds one trial call is let through
+    (half-open), which closes the circuit if it succeeds and reopens it otherwise.
+
+    Args:
+        failure_threshold: The consecutive failures that open the circuit.
+        reset_timeout: The seconds before a trial call.
+        clock: A monotonic clock, replaceable in tests.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.opens = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if self.clock() - self.opened_at >= self.reset_timeout else 'open'
+
+    def check(self) -> None:
+        """Raises `CircuitOpen` unless a call may be made now."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self.clock() - self.opened_at < self.reset_timeout or self._trial:
+                raise CircuitOpen(f"circuit open after {self.failures} consecutive failures")
+            self._trial = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release(self) -> None:
+        """Ends a trial call that neither succeeded nor failed for lack of service, e.g. a rejected request."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = self.clock()
+                self.opens += 1
+            self._trial = False
+
+
+class Resilience:
+    """
+    Calls a provider with retries, backoff and a circuit breaker.
+
+    Args:
+        max_attempts: The attempts per call, including the first one.
+        base_delay: The backoff of the first retry; the n-th retry waits up to `base_delay * 2 ** (n - 1)`.
+        max_delay: The longest backoff, also the cap of `Retry-After` delays.
+        min_attempt_time: The seconds of the call's timeout that must be left for a retry.
+        breaker: The `CircuitBreaker`; a new one by default.
+        stats: A Counter of attempts, retries, errors per category, backoff time and short-circuited calls.
+        clock, sleep, rng: Replaceable in tests.
+    """
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.25, max_delay: float = 4.0, min_attempt_time: float = 1.0,
+                 breaker: Optional[CircuitBreaker] = None, stats: Optional[Counter] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep,
+                 rng: Callable[[], float] = random.random):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_attempt_time = min_attempt_time
+        self.breaker = breaker if breaker is not None else CircuitBreaker(clock=clock)
+        self.stats = stats if stats is not None else Counter()
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng
+
+    @classmethod
+    def from_env(cls) -> 'Resilience':
+        return cls(
+            max_attempts=int(os.environ.get("LLM_MAX_ATTEMPTS", 3)),
+            base_delay=float(os.environ.get("LLM_BACKOFF_BASE", 0.25)),
+            max_delay=float(os.environ.get("LLM_BACKOFF_MAX", 4.0)),
+            min_attempt_time=float(os.environ.get("MIN_CALL_TIME", 1.0)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("BREAKER_FAILURES", 5)),
+                reset_timeout=float(os.environ.get("BREAKER_RESET", 30.0)),
+            ),
+        )
+
+    def call(self, attempt: Callable[[Optional[float]], object], timeout: Optional[float] = None,
+             deadline=None, reserve_calls: int = 0):
+        """
+        Returns `attempt(timeout_left)`, retrying retryable errors while attempts and time are left.
+        `timeout` bounds all attempts and backoffs together; None leaves them unbounded.
+        With the turn's `deadline`, each attempt takes one of its calls, and retries leave `reserve_calls`
+        calls for the later stages; None leaves the calls unbounded.
+        Raises the last error, `CircuitOpen` while the circuit is open, or `CallLimitExceeded` when the turn has no call left.
+        """
+        start = self.clock()
+        for n in range(self.max_attempts):
+            self._check()
+            if n == 0:
+                self._take_first_call(deadline)
+            self.stats["attempts"] += 1
+            try:
+                result = attempt(_left(timeout, self.clock() - start))
+            except Exception as e:
+                delay = self._after_failure(e, n, timeout, self.clock() - start, deadline, reserve_calls)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.stats["successes"] += 1
+            return result
+
+    async def acall(self, attempt: Callable, timeout: Optional[float] = None, deadline=None, reserve_calls: int = 0):
+        """Coroutine version of `call`, for coroutine functions `attempt`."""
+        start = self.clock()
+        for n in range(self.max_attempts):
+            self._check()
+            if n == 0:
+                self._take_first_call(deadline)
+            self.stats["attempts"] += 1
+            try:
+                result = await attempt(_left(timeout, self.clock() - start))
+            except Exception as e:
+                delay = self._after_failure(e, n, timeout, self.clock() - start, deadline, reserve_calls)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.stats["successes"] += 1
+            return result
+
+    def backoff(self, retry: int, error: Optional[BaseException] = None) -> float:
+        """The delay before the `retry`-th retry: the provider's `Retry-After` if given, else full jitter."""
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return self.rng() * min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+
+    def summary(self) -> Dict:
+        """The counters, with the state of the circuit and the number of times it opened."""
+        return {**self.stats, "circuit": self.breaker.state, "circuit_opens": self.breaker.opens}
+
+    def _check(self):
+        try:
+            self.breaker.check()
+        except CircuitOpen:
+            self.stats["short_circuited"] += 1
+            raise
+
+    def _take_first_call(self, deadline):
+        from agents.deadline import CallLimitExceeded
+        if deadline is not None and not deadline.take_call():
+            self.stats["call_limit"] += 1
+            # the trial call of a half-open circuit is not made
+            self.breaker.release()
+            raise CallLimitExceeded(f"all {deadline.max_calls} calls of the turn are used")
+
+    def _after_failure(self, error, n, timeout, elapsed, deadline=None, reserve_calls=0):
+        """
+        Records a failed attempt. Returns the backoff before the next attempt, or None to give up.
+        The next attempt takes one of the calls of `deadline`.
+        """
+        kind = classify_error(error)
+        self.stats[f"error_{kind}"] += 1
+        if kind not in RETRYABLE:
+            if _status_code(error) is not None:
+                # the provider answered, so it is up
+                self.breaker.record_success()
+            else:
+                self.breaker.release()
+            return None
+        self.breaker.record_failure()
+        delay = self.backoff(n + 1, error)
+        if n + 1 >= self.max_attempts or (timeout is not None and timeout - elapsed - delay < self.min_attempt_time):
+            self.stats["gave_up"] += 1
+            return None
+        if deadline is not None and not deadline.take_call(reserve=reserve_calls):
+            self.stats["gave_up"] += 1
+            self.stats["call_limit"] += 1
+            return None
+        self.stats["retries"] += 1
+        self.stats["backoff_seconds"] += delay
+        return delay
+
+
+_default_resilience: Dict[str, Resilience] = {}
+_default_resilience_lock = threading.Lock()
+
+
+def default_resilience(provider: str) -> Resilience:
+    """
+    Returns the `Resilience` of a provider (e.g. 'openai', 'gemini'), configured by the environment
+    variables and shared by the agents and the judge of the process.
+    """
+    with _default_resilience_lock:
+        if provider not in _default_resilience:
+            _default_resilience[provider] = Resilience.from_env()
+        return _default_resilience[provider]
+
+
+def _left(timeout, elapsed):
+    return None if timeout is None else timeout - elapsed
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        # google.api_core exceptions carry the HTTP status as `code`
+        code = getattr(error, "code", None)
+        status = code if isinstance(code, int) and 100 <= code < 600 else None
+    return status
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,99 @@
+"""
+Streams responses and stops them once they are long enough.
+
+The response prompt asks for 1 to 2 short sentences, but a model may keep going until `max_tokens`.
+A `SentenceCutoff` is fed the streamed text and tells when `max_sentences` sentences are complete,
+so the agents close the stream (or stop generating) instead of waiting for the rest, which lowers
+the tail latency and the output tokens of a turn. `StreamStats` records the time to first token
+and the total time of every streamed response.
+"""
+import re
+from typing import Dict, List, Optional
+
+
+# A sentence ends with ., ! or ? (possibly repeated, or followed by closing quotes or brackets)
+# and then whitespace. Text that ends with a terminator is not a complete sentence until the next
+# chunk shows whitespace, so that "3." is not cut from "3.5".
+_SENTENCE_END = re.compile(r"""[.!?…]+["'”’)\]]*(?=\s)""")
+# Words whose period does not end a sentence.
+_ABBREVIATIONS = frozenset(["mr", "mrs", "ms", "dr", "st", "sr", "jr", "vs", "etc", "e.g", "i.e"])
+
+
+class SentenceCutoff:
+    """
+    Accumulates streamed text and detects when `max_sentences` sentences are complete.
+
+    Args:
+        max_sentences: The number of sentences kept; 0 disables the cutoff.
+    """
+    def __init__(self, max_sentences: int = 2):
+        self.max_sentences = max_sentences
+        self.text = ""
+        self.cut = False
+        self._scanned = 0
+        self._sentences = 0
+
+    def feed(self, chunk: str) -> bool:
+        """Adds a chunk of text. Returns True once the text holds `max_sentences` sentences, cut after the last one."""
+        if self.cut:
+            return True
+        self.text += chunk
+        if self.max_sentences <= 0:
+            return False
+        for match in _SENTENCE_END.finditer(self.text, self._scanned):
+            self._scanned = match.end()
+            if _is_abbreviation(self.text, match.start()):
+                continue
+            self._sentences += 1
+            if self._sentences >= self.max_sentences:
+                self.text = self.text[:match.end()]
+                self.cut = True
+                return True
+        return False
+
+    def result(self) -> str:
+        return self.text.strip()
+
+
+class StreamStats:
+    """The time to first token and the total time of streamed responses, in seconds."""
+    def __init__(self):
+        self.ttft: List[float] = []
+        self.total: List[float] = []
+        self.cutoffs = 0
+
+    def record(self, ttft: Optional[float], total: float, cut: bool) -> None:
+        if ttft is not None:
+            self.ttft.append(ttft)
+        self.total.append(total)
+        self.cutoffs += int(cut)
+
+    def summary(self) -> Dict:
+        """The number of responses and cutoffs, and the mean, median and 95th percentile of both latencies."""
+        return {
+            "responses": len(self.total),
+            "cutoffs": self.cutoffs,
+            "ttft": _percentiles(self.ttft),
+            "total": _percentiles(self.total),
+        }
+
+    def __bool__(self) -> bool:
+        return bool(self.total)
+
+
+def _is_abbreviation(text: str, end: int) -> bool:
+    if text[end] != ".":
+        return False
+    word = text[:end].rsplit(None, 1)[-1] if text[:end].strip() else ""
+    return word.lower().lstrip("(\"'") in _ABBREVIATIONS or (len(word) == 1 and word.isupper())
+
+
+def _percentiles(values: List[float]) -> Dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+    }
@@ -0,0 +1,295 @@
+"""
+Fits prompts into the token limits of the API track (2000 input and 200 output tokens per call).
+
+Tokens are counted locally with `tiktoken`. The encoding is loaded from the file shipped in
+`data/` (`o200k_base`, the encoding of gpt-4o and gpt-4o-mini), or else from tiktoken's own cache
+(`TIKTOKEN_CACHE_DIR`, `DATA_GYM_CACHE_DIR` or its default directory); it is never downloaded, since
+the evaluation has no internet access and a download would stall the agent's initialization.
+Without tiktoken or an encoding file, tokens are estimated. The estimate over-counts ordinary text
+(about 2 tokens per English word, 1 per punctuation mark) but is not an upper bound: rare letter
+sequences can take more tokens than it counts. Budgets counted with the estimate therefore keep a
+safety margin (`ESTIMATE_MARGIN`) free.
+
+A prompt is described as prioritized sections of droppable parts (lines, messages, knowledge
+items). `TokenBudget.fit` keeps the parts of the most important sections first, e.g. the current
+utterance and the function results, then the knowledge of the target items, the persona, the
+history (newest first), the other knowledge and finally the worldview, and cuts the first part
+that no longer fits when its section is truncatable.
+"""
+import base64
+import bisect
+import functools
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# Tokens added by the chat format around every message, and to prime the reply.
+TOKENS_PER_MESSAGE = 4
+REPLY_TOKENS = 3
+# The share of the input budget kept free when tokens are estimated rather than counted.
+ESTIMATE_MARGIN = 0.1
+
+_ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+# The directory of the shipped encoding files, named `<encoding>.tiktoken`.
+ENCODING_DIR = os.environ.get("TIKTOKEN_ENCODING_DIR", "data")
+# The encodings that can be built from a shipped file: the sha256 of the file, the split pattern and
+# the special tokens, as defined by `tiktoken_ext.openai_public`.
+_SHIPPED_ENCODINGS = {
+    "o200k_base": (
+        "446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d",
+        "|".join([
+            r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+            r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+            r"""\p{N}{1,3}""",
+            r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+            r"""\s*[\r\n]+""",
+            r"""\s+(?!\S)""",
+            r"""\s+""",
+        ]),
+        {"<|endoftext|>": 199999, "<|endofprompt|>": 200018},
+    ),
+}
+
+_PIECES = re.compile(r"[A-Za-z]+|[0-9]|[^\sA-Za-z0-9]|\s\s+")
+
+
+def _piece_tokens(piece: str) -> int:
+    if piece.isascii() and piece.isalpha():
+        return math.ceil(len(piece) / 4)
+    return 1 if piece.isascii() else 2
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    A token estimate for when no tokenizer is available: every digit, punctuation mark, run of
+    whitespace and non-ASCII character counts as a token, and words count one token per 4 letters.
+    This over-counts ordinary text, but not rare letter sequences (see the module docstring).
+    Counts add up over texts joined at whitespace, so parts can be counted separately.
+    """
+    return sum(_piece_tokens(piece) for piece in _PIECES.findall(text))
+
+
+class TokenCounter:
+    """
+    Counts tokens for a model, caching the counts of recent strings (prompt blocks repeat every turn).
+
+    Args:
+        model: The model name, used to pick the tiktoken encoding.
+        max_cached: The number of counted strings kept.
+    """
+    def __init__(self, model: str = "gpt-4o-mini", max_cached: int = 8192):
+        self.encoding = _load_encoding(model)
+        self.max_cached = max_cached
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        # texts that were truncated, with their token boundaries, since the same worldview is cut every turn
+        self._boundaries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def exact(self) -> bool:
+        """Whether counts come from the model's tokenizer rather than the estimate."""
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        """Returns the number of tokens of `text`."""
+        count = self._counts.get(text)
+        if count is None:
+            count = len(self.encoding.encode(text)) if self.encoding is not None else estimate_tokens(text)
+            self._counts[text] = count
+            if len(self._counts) > self.max_cached:
+                self._counts.popitem(last=False)
+        return count
+
+    def count_messages(self, messages: List[Dict], tools: Optional[List[Dict]] = None) -> int:
+        """Returns the input tokens of a chat completion request, counting tool definitions as JSON."""
+        total = REPLY_TOKENS
+        for message in messages:
+            total += TOKENS_PER_MESSAGE + self.count(message.get("content") or "")
+        if tools:
+            total += self.count(json.dumps(tools, ensure_ascii=False))
+        return total
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Returns the longest prefix of `text` with at most `max_tokens` tokens, cut at a word boundary if possible."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            prefix = self.encoding.decode(self._token_boundaries(text)[:max_tokens])
+        else:
+            ends, totals = self._token_boundaries(text)
+            # the end of the last piece that fits
+            fitting = bisect.bisect_right(totals, max_tokens)
+            prefix = text[:ends[fitting - 1]] if fitting else ""
+        cut = prefix.rfind(" ")
+        return prefix[:cut] if cut > len(prefix) // 2 else prefix
+
+
+    def _token_boundaries(self, text: str):
+        """Returns the token ids of `text`, or the end offsets and running token counts of its estimated pieces."""
+        boundaries = self._boundaries.get(text)
+        if boundaries is None:
+            if self.encoding is not None:
+                boundaries = self.encoding.encode(text)
+            else:
+                matches = list(_PIECES.finditer(text))
+                boundaries = ([m.end() for m in matches],
+                              list(itertools.accumulate(_piece_tokens(m.group()) for m in matches)))
+            self._boundaries[text] = boundaries
+            if len(self._boundaries) > 256:
+                self._boundaries.popitem(last=False)
+        return boundaries
+
+
+@dataclass
+class Section:
+    """
+    A prioritized part of a prompt.
+
+    Attributes:
+        name: The key of the section in the fit result.
+        priority: Sections with lower priorities are kept first; priority 0 is always kept.
+        parts: Droppable units, most important first. Each costs `count(part) + part_overhead` tokens.
+        part_overhead: Extra tokens per kept part, e.g. `TOKENS_PER_MESSAGE` for history messages.
+        truncatable: Whether the first part that does not fit is cut to the remaining budget.
+    """
+    name: str
+    priority: int
+    parts: List[str]
+    part_overhead: int = 0
+    truncatable: bool = False
+
+
+@dataclass
+class FitResult:
+    """
+    The parts kept per section and their indices in `Section.parts` (both in their original order),
+    the tokens used including the reserved ones, and the number of parts dropped or cut per section.
+    """
+    kept: Dict[str, List[str]]
+    indices: Dict[str, List[int]]
+    tokens: int
+    dropped: Dict[str, int] = field(default_factory=dict)
+    truncated: Dict[str, int] = field(default_factory=dict)
+
+
+class TokenBudget:
+    """
+    Fits prioritized sections into an input token budget.
+
+    Args:
+        max_input_tokens: The input limit of one API call.
+        max_output_tokens: The output limit of one API call.
+        counter: The `TokenCounter`; a counter for gpt-4o-mini by default.
+        min_truncated_tokens: Truncated parts shorter than this are dropped instead, as a few words are of no use.
+        estimate_margin: The share of `max_input_tokens` kept free when the counter estimates tokens.
+
+    Attributes:
+        limit: The input tokens that prompts are fitted to: `max_input_tokens`, less the margin for estimates.
+    """
+    def __init__(self, max_input_tokens: int = 2000, max_output_tokens: int = 200, counter: Optional[TokenCounter] = None,
+                 min_truncated_tokens: int = 32, estimate_margin: float = ESTIMATE_MARGIN):
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.counter = counter if counter is not None else TokenCounter()
+        self.min_truncated_tokens = min_truncated_tokens
+        self.limit = max_input_tokens if self.counter.exact else int(max_input_tokens * (1 - estimate_margin))
+
+    def fit(self, sections: List[Section], reserved: int = 0) -> FitResult:
+        """
+        Keeps the parts of `sections` that fit into `limit - reserved`, by priority.
+        Within a section, parts are tried in order and a part that does not fit is skipped
+        (or cut, for truncatable sections), so smaller later parts can still use the budget.
+        """
+        remaining = self.limit - reserved
+        kept_index: Dict[str, Dict[int, str]] = {section.name: {} for section in sections}
+        dropped: Dict[str, int] = {}
+        truncated: Dict[str, int] = {}
+        used = 0
+        for section in sorted(sections, key=lambda s: s.priority):
+            for i, part in enumerate(section.parts):
+                cost = self.counter.count(part) + section.part_overhead
+                if section.priority == 0 or cost <= remaining:
+                    kept_index[section.name][i] = part
+                elif section.truncatable and remaining - section.part_overhead >= self.min_truncated_tokens:
+                    cut = self.counter.truncate(part, remaining - section.part_overhead)
+                    if cut:
+                        kept_index[section.name][i] = cut
+                        cost = self.counter.count(cut) + section.part_overhead
+                        truncated[section.name] = truncated.get(section.name, 0) + 1
+                    else:
+                        dropped[section.name] = dropped.get(section.name, 0) + 1
+                        continue
+                else:
+                    dropped[section.name] = dropped.get(section.name, 0) + 1
+                    continue
+                remaining -= cost
+                used += cost
+        indices = {name: sorted(parts) for name, parts in kept_index.items()}
+        kept = {name: [kept_index[name][i] for i in indices[name]] for name in kept_index}
+        return FitResult(kept=kept, indices=indices, tokens=used + reserved, dropped=dropped, truncated=truncated)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_encoding(model: str, encoding_dir: Optional[str] = None):
+    """Returns the tiktoken encoding of `model` from a shipped file or tiktoken's cache, or None."""
+    if tiktoken is None:
+        return None
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except (AttributeError, KeyError):
+        name = "o200k_base"
+    try:
+        encoding = _load_shipped_encoding(name, ENCODING_DIR if encoding_dir is None else encoding_dir)
+        if encoding is None and _encoding_cached(name):
+            encoding = tiktoken.get_encoding(name)
+        # tiktoken would otherwise download the file on first use, which fails without internet after a long wait
+        return encoding
+    except Exception:
+        return None
+
+
+def _load_shipped_encoding(name: str, encoding_dir: str):
+    """Builds an encoding from `<encoding_dir>/<name>.tiktoken`, or returns None if it is not shipped or corrupted."""
+    path = os.path.join(encoding_dir, f"{name}.tiktoken")
+    if name not in _SHIPPED_ENCODINGS or not os.path.exists(path):
+        return None
+    expected_hash, pat_str, special_tokens = _SHIPPED_ENCODINGS[name]
+    with open(path, "rb") as fp:
+        contents = fp.read()
+    if hashlib.sha256(contents).hexdigest() != expected_hash:
+        return None
+    ranks = {}
+    for line in contents.splitlines():
+        if line:
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return tiktoken.Encoding(name=name, pat_str=pat_str, mergeable_ranks=ranks, special_tokens=special_tokens)
+
+
+def _encoding_cached(name: str) -> bool:
+    """Whether the file of an encoding is in tiktoken's cache directory, where it is looked up by the sha1 of its URL."""
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["TIKTOKEN_CACHE_DIR"]
+    elif "DATA_GYM_CACHE_DIR" in os.environ:
+        cache_dir = os.environ["DATA_GYM_CACHE_DIR"]
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    if not cache_dir:
+        # caching is disabled, so tiktoken would download the file
+        return False
+    key = hashlib.sha1(_ENCODING_URL.format(name).encode("utf-8")).hexdigest()
+    return os.path.exists(os.path.join(cache_dir, key))
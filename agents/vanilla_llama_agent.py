@@ -1,9 +1,40 @@
 from typing import List, Dict
+import time
 
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
 import torch
 import copy
 
+from agents.streaming import SentenceCutoff, StreamStats
+
+
+class SentenceStoppingCriteria(StoppingCriteria):
+    """
+        Stops the generation once the generated text holds `max_sentences` sentences (see `agents/streaming.py`), 
+        and records the time of the first generated token. 
+
+        Args: 
+            tokenizer: The tokenizer used to decode the generated tokens. 
+            prompt_length: The number of tokens of the prompt. 
+            max_sentences: The number of sentences kept. 
+    """
+    def __init__(self, tokenizer, prompt_length, max_sentences=2):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_sentences = max_sentences
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.cutoff = SentenceCutoff(max_sentences)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+        # The generated part is short (at most `max_gen_len` tokens), so it is decoded again at every step. 
+        cutoff = SentenceCutoff(self.max_sentences)
+        cutoff.feed(self.tokenizer.decode(input_ids[0][self.prompt_length:], skip_special_tokens=True).replace("\n", " "))
+        self.cutoff = cutoff
+        return torch.full((input_ids.shape[0],), cutoff.cut, dtype=torch.bool, device=input_ids.device)
+
 class VanillaLlamaAgent(object):
     """
         VanillaLlamaAgent is a simple agent implementation for the GPU track of the Sony CPDC 2025 Challenge. 
@@ -36,6 +67,9 @@ class VanillaLlamaAgent(object):
 
         self.max_seq_len = 2048
         self.max_gen_len = 50
+        # The response generation stops once `max_sentences` sentences are complete. 
+        self.max_sentences = 2
+        self.stream_stats = StreamStats()
 
     ############################################################
     # The entrypoint of the evaluator.  
@@ -125,6 +159,7 @@ class VanillaLlamaAgent(object):
             return_tensors="pt"
         ).to(self.model.device)
 
+        stopping = SentenceStoppingCriteria(self.tokenizer, input_ids.shape[-1], self.max_sentences)
         outputs = self.model.generate(
             input_ids,
             num_beams=1,
@@ -133,10 +168,15 @@ class VanillaLlamaAgent(object):
             top_p=None,
             max_new_tokens=self.max_gen_len,
             eos_token_id=self.terminators,
-            pad_token_id=self.tokenizer.eos_token_id
+            pad_token_id=self.tokenizer.eos_token_id,
+            stopping_criteria=StoppingCriteriaList([stopping])
         )
+        self.stream_stats.record(stopping.first_token, time.perf_counter() - stopping.start, stopping.cutoff.cut)
         res = outputs[0][input_ids.shape[-1]:]
         res_str = self.tokenizer.decode(res, skip_special_tokens=True).replace("\n", " ")
+        if stopping.cutoff.cut:
+            # drop the token after the last sentence, which completed the cutoff 
+            res_str = stopping.cutoff.result()
         
         # However, participants can do more than that, like back and forth calling of functions. 
 
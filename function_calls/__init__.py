@@ -11,6 +11,14 @@ from .action_functions_0004 import action_functions_0004
 from .action_functions_0005 import action_functions_0005
 from .action_functions_0006 import action_functions_0006
 from .executor import Executor
+from .conversation_executor import ConversationExecutor
+from .concurrent_executor import ConcurrentExecutor
+from .knowledge_executor import KnowledgeExecutor, KnowledgeIndex, harvest_facts
+from .search_engine import ColumnarKnowledge, normalize_price
+from .metrics import TokenVocabulary, batch_word_f1
+from .batch_scorer import FunctionCallScorer, score_function_calls, load_predictions
+from .instrumentation import ExecutionTracer
+from .threshold_sweep import ThresholdSweep, sweep_thresholds
 
 action_map = {
     'function_list_id_0001': action_functions_0001,
@@ -0,0 +1,171 @@
+"""
+Offline scoring of predicted function calls against the gold functions of a whole dataset.
+
+The gold functions of every turn are compiled once into a `GoldIndex`, and each predicted
+call is matched with the rules of the Executor: check_* calls by exact (case-insensitive)
+arguments, search_* calls by exact numeric arguments and a word F1 above the threshold.
+Action functions (e.g. sell, equip), which the Executor never matches, are matched by name.
+"""
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from .executor import GoldIndex
+
+
+class FunctionCallScorer:
+    """
+        Scores predicted function calls turn by turn, and aggregates the scores per function and over the dataset.
+
+        A predicted call is correct if it matches a gold function of its turn; a gold function is recalled
+        if at least one predicted call matches it. Turns without gold functions and without predicted
+        calls count as perfect.
+
+        Args:
+            threshold: The word F1 threshold of search_* functions (see `Executor`).
+    """
+    def __init__(self, threshold: float = 0.4):
+        self.threshold = threshold
+        self.turns: List[Dict[str, Any]] = []
+        self._functions = defaultdict(lambda: {'predicted': 0, 'gold': 0, 'matched_predicted': 0, 'matched_gold': 0})
+
+    def score_turn(self, predicted_calls: List[Dict], gold_functions: List[Dict], data_id: Any = None,
+                   turn_idx: Optional[int] = None) -> Dict[str, Any]:
+        """
+            Scores the predicted calls of one turn.
+
+            Args:
+                predicted_calls: [{'name': ..., 'parameters': {...}}, ...], e.g. `Executor.function_call_stats`.
+                gold_functions: [{'name': ..., 'parameters': {...}, 'return': [...]}, ...], or `FunctionCall`s.
+                data_id, turn_idx: Copied to the turn score.
+
+            Returns:
+                The turn score, also kept in `self.turns`.
+        """
+        gold_index = GoldIndex(gold_functions)
+        action_names = {}
+        for i, name in enumerate(gold_index.gold_names):
+            if 'check' not in name and 'search' not in name:
+                action_names.setdefault(name.strip(), []).append(i)
+
+        matched_gold = set()
+        matched_predicted = 0
+        for call in predicted_calls:
+            name = call.get('name', '')
+            function_stats = self._functions[name.strip()]
+            function_stats['predicted'] += 1
+            if 'check' in name or 'search' in name:
+                gold_func_index = gold_index.match({'name': name, 'parameters': call.get('parameters') or {}}, self.threshold)
+                matched = gold_func_index != -1
+                if matched:
+                    matched_gold.add(gold_func_index)
+            else:
+                indices = action_names.get(name.strip(), ())
+                matched = bool(indices)
+                matched_gold.update(indices)
+            if matched:
+                matched_predicted += 1
+                function_stats['matched_predicted'] += 1
+
+        for i, name in enumerate(gold_index.gold_names):
+            function_stats = self._functions[name.strip()]
+            function_stats['gold'] += 1
+            if i in matched_gold:
+                function_stats['matched_gold'] += 1
+
+        turn_score = {
+            'data_id': data_id,
+            'turn': turn_idx,
+            'predicted': [call.get('name', '') for call in predicted_calls],
+            'gold': list(gold_index.gold_names),
+            'matched_predicted': matched_predicted,
+            'matched_gold': len(matched_gold),
+        }
+        turn_score.update(_precision_recall_f1(len(predicted_calls), len(gold_functions), matched_predicted, len(matched_gold)))
+        self.turns.append(turn_score)
+        return turn_score
+
+    def score_conversations(self, conversations: Iterable, predictions: Dict[str, List[List[Dict]]]) -> Dict[str, Any]:
+        """
+            Scores a whole dataset.
+
+            Args:
+                conversations: `npcdataset.Conversation`s with gold functions.
+                predictions: Maps data_id to the predicted calls of each turn (see `load_predictions`).
+                             Missing conversations and turns count as turns without calls.
+
+            Returns:
+                The report of `report()`.
+        """
+        for conversation in conversations:
+            predicted_turns = predictions.get(str(conversation.id), [])
+            for turn_idx, turn in enumerate(conversation.turns):
+                predicted_calls = predicted_turns[turn_idx] if turn_idx < len(predicted_turns) else []
+                self.score_turn(predicted_calls, turn.gold_functions, conversation.id, turn_idx)
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        """
+            Returns the scores so far:
+                'aggregate': micro-averaged precision/recall/F1 over all calls,
+                             and the turn-averaged (macro) F1 as 'turn_f1',
+                'functions': micro-averaged scores per function name,
+                'turns': the per-turn scores.
+        """
+        totals = {'predicted': 0, 'gold': 0, 'matched_predicted': 0, 'matched_gold': 0}
+        functions = {}
+        for name, counts in sorted(self._functions.items()):
+            for key in totals:
+                totals[key] += counts[key]
+            functions[name] = dict(counts)
+            functions[name].update(_precision_recall_f1(counts['predicted'], counts['gold'],
+                                                        counts['matched_predicted'], counts['matched_gold']))
+
+        aggregate = dict(totals)
+        aggregate.update(_precision_recall_f1(totals['predicted'], totals['gold'],
+                                              totals['matched_predicted'], totals['matched_gold']))
+        aggregate['turns'] = len(self.turns)
+        aggregate['turn_f1'] = sum(turn['f1'] for turn in self.turns) / len(self.turns) if self.turns else 0.0
+        return {'aggregate': aggregate, 'functions': functions, 'turns': self.turns}
+
+
+def score_function_calls(conversations: Iterable, predictions: Dict[str, List[List[Dict]]], threshold: float = 0.4) -> Dict[str, Any]:
+    """Scores the predicted function calls of a dataset. See `FunctionCallScorer.report` for the result."""
+    return FunctionCallScorer(threshold).score_conversations(conversations, predictions)
+
+
+def load_predictions(result_data: List[Dict]) -> Dict[str, List[List[Dict]]]:
+    """
+        Reads the predicted calls from the results saved by `local_run_task1.py`:
+        [{"data_id": ..., "outputs": [{"tool_calls": [{"function": {"name": ..., "arguments": ...}}], ...}]}].
+        Arguments may be a dict or a JSON string; results saved without arguments are read with empty ones.
+    """
+    predictions = {}
+    for item in result_data:
+        turns = []
+        for output in item.get("outputs", []):
+            calls = []
+            for tool_call in output.get("tool_calls", []):
+                function = tool_call.get("function", {})
+                name = function.get("name")
+                if not name:
+                    continue
+                arguments = function.get("arguments") or {}
+                if isinstance(arguments, str):
+                    try:
+                        arguments = json.loads(arguments)
+                    except json.JSONDecodeError:
+                        arguments = {}
+                calls.append({"name": name, "parameters": arguments})
+            turns.append(calls)
+        predictions[str(item.get("data_id"))] = turns
+    return predictions
+
+
+def _precision_recall_f1(predicted: int, gold: int, matched_predicted: int, matched_gold: int) -> Dict[str, float]:
+    if predicted == 0 and gold == 0:
+        return {'precision': 1.0, 'recall': 1.0, 'f1': 1.0}
+    precision = matched_predicted / predicted if predicted else 0.0
+    recall = matched_gold / gold if gold else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1}
@@ -0,0 +1,124 @@
+"""
+An Executor that can be shared by concurrent threads and asyncio tasks.
+
+Every task records its calls in its own log, so a lock is only taken when a log is
+created or the logs are merged, and `function_call_stats` merges them in a
+deterministic order. A task is identified by an explicit key (e.g. `(data_id, turn_idx)`),
+or else by the asyncio task or thread that made the calls, tracked with a context variable.
+"""
+import asyncio
+import contextlib
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, List, Optional
+
+from .executor import Executor
+from .frozen import freeze
+
+
+# (owner, log key) of the current task scope; the owner is the asyncio task or the thread that opened it
+_task_scope: ContextVar = ContextVar('executor_task_scope', default=None)
+# creation order of implicit task logs
+_implicit_keys = itertools.count()
+
+
+def _current_owner():
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return task if task is not None else threading.current_thread()
+
+
+class ConcurrentExecutor(Executor):
+    """
+        A thread-safe, asyncio-compatible `Executor`.
+
+        Calls are resolved exactly as by `Executor`, and recorded in one log per task:
+            - `execute(function_list, key)` / `await aexecute(function_list, key)` log under `key`,
+            - inside `with executor.task(key):` calls log under `key`,
+            - otherwise each asyncio task (or thread) gets its own log, in order of first use.
+        `function_call_stats` is the concatenation of the logs: explicit keys in sorted order
+        (they must be comparable), then implicit logs in creation order.
+        Calls of concurrent tasks that share a key are logged in completion order.
+    """
+    def __init__(self, tool_registry, action_registry, gold_functions, threshold=0.4, tracer=None, gold_index=None, name_resolver=None):
+        self._logs: Dict[Any, List] = {}
+        self._logs_lock = threading.Lock()
+        super().__init__(tool_registry, action_registry, gold_functions, threshold, tracer, gold_index, name_resolver)
+        self._tracer_lock = threading.Lock()
+
+    @property
+    def function_call_stats(self) -> List:
+        """The calls of all tasks, merged in a deterministic order."""
+        # other threads may open logs or append to them meanwhile, so merge copies
+        with self._logs_lock:
+            logs = [(key, list(log)) for key, log in self._logs.items()]
+        return [call for _, log in sorted(logs, key=lambda item: item[0]) for call in log]
+
+    @function_call_stats.setter
+    def function_call_stats(self, calls):
+        # set by Executor.__init__; calls recorded before any task come first
+        with self._logs_lock:
+            self._logs = {(-1, 0): list(calls)} if calls else {}
+
+    def calls(self, key: Hashable) -> List:
+        """Returns the calls logged under an explicit `key`."""
+        with self._logs_lock:
+            return list(self._logs.get((0, key), []))
+
+    @contextlib.contextmanager
+    def task(self, key: Hashable):
+        """Logs the calls made in this block (by the current thread or asyncio task) under `key`."""
+        token = _task_scope.set((_current_owner(), (0, key)))
+        try:
+            yield self
+        finally:
+            _task_scope.reset(token)
+
+    def execute(self, function_list, key: Optional[Hashable] = None):
+        """
+            Executes the functions as `Executor.execute`, logging them under `key` or the current task.
+        """
+        log_key = self._log_key(key)
+        log = self._logs.get(log_key)
+        if log is None:
+            with self._logs_lock:
+                log = self._logs.setdefault(log_key, [])
+        results = []
+        for func_item in function_list:
+            snapshot = freeze(func_item)
+            log.append(snapshot)
+
+            result = dict(snapshot)
+            if self.tracer is None:
+                result['return'] = self.resolve(snapshot)
+            else:
+                start = time.perf_counter()
+                result['return'] = self.resolve(snapshot)
+                elapsed = time.perf_counter() - start
+                with self._tracer_lock:
+                    self.tracer.record(self, snapshot, elapsed)
+            results.append(result)
+        return results
+
+    async def aexecute(self, function_list, key: Optional[Hashable] = None):
+        """
+            Coroutine version of `execute`, which stays synchronous for the synchronous agents.
+            Resolving calls takes microseconds and never blocks, so it runs directly on the event loop.
+        """
+        return self.execute(function_list, key)
+
+    def _log_key(self, key):
+        if key is not None:
+            return (0, key)
+        owner = _current_owner()
+        scope = _task_scope.get()
+        if scope is not None and scope[0] is owner:
+            return scope[1]
+        # the first call of a new task (or thread) opens an implicit log for it
+        log_key = (1, next(_implicit_keys))
+        _task_scope.set((owner, log_key))
+        return log_key
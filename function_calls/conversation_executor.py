@@ -0,0 +1,80 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from .executor import Executor, GoldIndex
+
+
+class ConversationExecutor:
+    """
+        Hands out the per-turn executors of one conversation.
+
+        The gold functions of all turns are indexed once, directly from the `FunctionCall`s of
+        `Turn.gold_functions`, so creating the executor of a turn is cheap. Every executor handed out
+        is kept, so the function calls of the whole conversation can be read and aggregated afterwards.
+
+        Args:
+            tool_registry, action_registry: The registries of the conversation's function list.
+            gold_functions: One list of gold functions per turn (`FunctionCall`s or dicts).
+            threshold: The word F1 threshold of search_* functions (see `Executor`).
+            tracer: Optional `ExecutionTracer` shared by the executors of all turns.
+            name_resolver: Optional canonical name resolver passed to the executors (see `Executor`).
+    """
+    def __init__(self, tool_registry, action_registry, gold_functions: List[List[Any]], threshold=0.4, tracer=None,
+                 name_resolver=None):
+        self.tool_registry = tool_registry
+        self.action_registry = action_registry
+        self.gold_functions = gold_functions
+        self.threshold = threshold
+        self.tracer = tracer
+        self.name_resolver = name_resolver
+        self.gold_indexes = [GoldIndex(turn_gold_functions) for turn_gold_functions in gold_functions]
+        self.executors: Dict[int, Executor] = {}
+
+    @classmethod
+    def from_conversation(cls, conversation, tool_registry, action_registry, threshold=0.4, tracer=None,
+                          name_resolver=None) -> 'ConversationExecutor':
+        """Builds the executor of an `npcdataset.Conversation`."""
+        return cls(tool_registry, action_registry, [turn.gold_functions for turn in conversation.turns], threshold, tracer,
+                   name_resolver)
+
+    def __len__(self) -> int:
+        return len(self.gold_indexes)
+
+    def turn_executor(self, turn_idx: int) -> Executor:
+        """Returns a new `Executor` for the turn, sharing the precomputed gold index of that turn."""
+        if self.tracer is not None:
+            self.tracer.context = dict(self.tracer.context, turn=turn_idx)
+        executor = Executor(self.tool_registry, self.action_registry, self.gold_functions[turn_idx],
+                            self.threshold, tracer=self.tracer, gold_index=self.gold_indexes[turn_idx],
+                            name_resolver=self.name_resolver)
+        self.executors[turn_idx] = executor
+        return executor
+
+    def function_call_stats(self, turn_idx: Optional[int] = None) -> List:
+        """Returns the calls recorded for a turn, or for all turns in order."""
+        if turn_idx is not None:
+            executor = self.executors.get(turn_idx)
+            return list(executor.function_call_stats) if executor is not None else []
+        return [call for idx in sorted(self.executors) for call in self.executors[idx].function_call_stats]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+            Aggregates the calls of the conversation: the number of calls in total and per turn,
+            the calls per function name, and how many calls matched a gold function.
+        """
+        calls_per_turn = {}
+        names = Counter()
+        matched = 0
+        for turn_idx in sorted(self.executors):
+            executor = self.executors[turn_idx]
+            calls_per_turn[turn_idx] = len(executor.function_call_stats)
+            for call in executor.function_call_stats:
+                names[call['name']] += 1
+                if executor.check_exact_match_gold(call) != -1:
+                    matched += 1
+        return {
+            'calls': sum(calls_per_turn.values()),
+            'calls_per_turn': calls_per_turn,
+            'functions': dict(names),
+            'matched': matched,
+        }
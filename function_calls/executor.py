@@ -1,6 +1,8 @@
-import copy
 from collections import Counter
-import re
+import time
+
+from .frozen import freeze
+from .metrics import split_words, word_f1
 
 class Executor: 
     """
@@ -14,39 +16,78 @@ class Executor:
                It it does not match, it will return nothing. 
                However, in real evaluations, the executor will return adequate values even though it is not an exact match with gold functions. 
             2. Please do not try to tamper with attributes in the Executor. Doing so will lead to errors. 
+
+        Args: 
+            tracer: Optional `ExecutionTracer` (see `instrumentation.py`) that records how each call was matched. 
+            gold_index: Optional prebuilt `GoldIndex` of the gold_functions, e.g. shared by a `ConversationExecutor`. 
+            name_resolver: Optional callable mapping a predicted item or quest name to its canonical name (or None), 
+                           e.g. `agents.name_index.NameIndex.resolve`. When set, check_* calls that miss are retried 
+                           with canonical names, so that near misses such as "Avis-Wind" still match. 
     """
-    def __init__(self, tool_registry, action_registry, gold_functions, threshold=0.4):
+    def __init__(self, tool_registry, action_registry, gold_functions, threshold=0.4, tracer=None, gold_index=None, name_resolver=None):
         self.function_call_stats = []
         self.tool_registry = tool_registry
         self.action_registry = action_registry
         self.gold_functions = gold_functions
-        self.threshold = 0.4
-        # This is a temporary value. The value may be subject to change by the organizers. 
+        self.threshold = threshold
+        # The default 0.4 is a temporary value. The value may be subject to change by the organizers. 
+        self.gold_index = gold_index if gold_index is not None else GoldIndex(gold_functions)
+        self.tracer = tracer
+        self.name_resolver = name_resolver
     
     def execute(self, function_list): 
         """
             Execute the list of functions by checking the gold functions.
             It will also record the function call names and args (for evaluation purposes). 
+
+            Each call is recorded as a read-only snapshot (see `frozen.py`), so later changes by the caller 
+            do not affect `function_call_stats`. The returned dicts share these snapshots and the read-only 
+            gold return values instead of copying them. 
         """
-        copy_functions = copy.deepcopy(function_list)
-        for func_item in copy_functions:
-            self.function_call_stats.append(copy.deepcopy(func_item))
+        results = []
+        for func_item in function_list:
+            snapshot = freeze(func_item)
+            self.function_call_stats.append(snapshot)
 
-            # if it matches a gold function
-            gold_func_index = self.check_exact_match_gold(func_item)
-            if gold_func_index != -1:
-                # matches, we return the gold return value
-                func_item['return'] = copy.deepcopy(self.gold_functions[gold_func_index]['return'])
+            result = dict(snapshot)
+            if self.tracer is None:
+                result['return'] = self.resolve(snapshot)
             else:
-                func_item['return'] = [{'information': 'n/a'}]
+                start = time.perf_counter()
+                result['return'] = self.resolve(snapshot)
+                self.tracer.record(self, snapshot, time.perf_counter() - start)
+            results.append(result)
             
-        return copy_functions
+        return results
+
+    def resolve(self, func_item):
+        """
+            Returns the return value of a single function call. 
+            Subclasses can override this to answer function calls from other sources. 
+        """
+        # if it matches a gold function
+        gold_func_index = self.check_exact_match_gold(func_item)
+        if gold_func_index != -1:
+            # matches, we return the (read-only) gold return value
+            return self.gold_index.returns[gold_func_index]
+        return [{'information': 'n/a'}]
     
     def check_exact_match_gold(self, func_item):
         """
             Checks if the func_item matches any of the gold functions.
             If yes, return the matching index. 
             If not, return -1.  
+
+            check_* calls are looked up in the hash index of the gold functions, 
+            and search_* calls are only compared with the gold functions of the same name. 
+            The result is the same as comparing with every gold function in order (see `scan_gold`). 
+        """
+        return self.gold_index.match(func_item, self.threshold, self.name_resolver)
+
+    def scan_gold(self, func_item):
+        """
+            Compares the func_item with every gold function in order. 
+            This is the reference behaviour of `check_exact_match_gold`. 
         """
         for i, gold_function in enumerate(self.gold_functions):
             if gold_function['name'] == func_item['name']:
@@ -70,98 +111,296 @@ class Executor:
         return -1
     
     def search_function_match(self, pred_function_args, gold_function):
-        gold_function_args = gold_function['parameters']
-        gold_function_response = gold_function['return']
-
-        # some arguments require exact match because they involve numbers
-        repl_args = ['reward', 'price']
-        exact_args = ['reward', 'price', 'attack']
-
-        pred_exact_info = ""
-        pred_info = ""
-
-        for key in pred_function_args:
-            value = ""
-            if pred_function_args[key] != "":
-                value = pred_function_args[key]
-                if not "operator" in key and any([r in key for r in repl_args]):
-                    # check if the value is a 'repl_args' 
-                    value = value.replace(",", "")
-                    value = value.replace(" ", "")
-                    value = value.replace("Gold", "")
-                    value = value.replace("G", "")
-                    value = value.replace("gold", "")
-                    value = value.replace("g", "")
-            
-            if value != "":
-                if not "operator" in key and any([e in key for e in exact_args]):
-                    if pred_exact_info == "":
-                        pred_exact_info = key + "_" + value
-                    else:
-                        pred_exact_info = pred_exact_info + " " + key + "_" + value
-                else:
-                    if pred_info == "":
-                        pred_info = key + " " + value
-                    else:
-                        pred_info = pred_info + " " + key + " " + value
-
-        gold_exact_info = ""
-        gold_info = ""
-        for key in gold_function_args:
-            value = gold_function_args[key]
-            if not "operator" in key and any([r in key for r in repl_args]):
-                value = value.replace(",", "")
-                value = value.replace(" ", "")
-                value = value.replace("Gold", "")
-                value = value.replace("G", "")
-                value = value.replace("gold", "")
-                value = value.replace("g", "")
-
-            if not "operator" in key and any([e in key for e in exact_args]):
-                if gold_exact_info == "":
-                    gold_exact_info = key + "_" + value
-                else:
-                    gold_exact_info = gold_exact_info + " " + key + "_" + value
+        """
+            Checks if the arguments of a search_* call match a gold function. 
+            The arguments that involve numbers must match exactly, 
+            and the word F1 of the other arguments must exceed the threshold. 
+        """
+        return search_signature_match(
+            SearchSignature(pred_function_args, skip_empty=True), 
+            SearchSignature(gold_function['parameters']), 
+            self.threshold
+        )
+
+
+# some arguments require exact match because they involve numbers
+REPL_ARGS = ['reward', 'price']
+EXACT_ARGS = ['reward', 'price', 'attack']
+
+_STRIP_SEPARATORS = str.maketrans('', '', ', ')
+
+
+def normalize_amount(value):
+    """
+        Removes separators and the gold unit from a price or reward, e.g. '1,000 Gold' -> '1000'. 
+        Equivalent to removing ',', ' ', 'Gold', 'G', 'gold' and 'g' in this order. 
+    """
+    value = value.translate(_STRIP_SEPARATORS)
+    if 'g' in value or 'G' in value:
+        value = value.replace("Gold", "").replace("G", "").replace("gold", "").replace("g", "")
+    return value
+
+
+class SearchSignature:
+    """
+        The normalized arguments of a search_* function, precompiled for matching. 
+
+        Arguments that involve numbers (see EXACT_ARGS) are rendered as 'key_value' tokens, 
+        the other arguments as 'key value' text. Both are tokenized as in `word_f1`. 
+
+        Args: 
+            parameters: The arguments of the search_* function. 
+            skip_empty: Skip empty values. This is done for predicted calls, but not for gold functions. 
+    """
+    __slots__ = ('exact_tokens', 'info_tokens', 'info_length')
+
+    def __init__(self, parameters, skip_empty=False):
+        exact_info = []
+        info = []
+        for key in parameters:
+            value = parameters[key]
+            if skip_empty and value == "":
+                continue
+            is_operator = "operator" in key
+            if not is_operator and any([r in key for r in REPL_ARGS]):
+                value = normalize_amount(value)
+                if skip_empty and value == "":
+                    continue
+
+            if not is_operator and any([e in key for e in EXACT_ARGS]):
+                exact_info.append(key + "_" + value)
             else:
-                if gold_info == "":
-                    gold_info = key + " " + value
-                else:
-                    gold_info = gold_info + " " + key + " " + value
-        
-        # exact match of exact arguments
-        exact_check = word_f1(pred_exact_info, gold_exact_info)
-        if exact_check != 1.0:
-            return False
+                info.append(key + " " + value)
 
-        ret = []
-        judgment_score = word_f1(pred_info, gold_info)
-        if judgment_score > self.threshold:
-            return True
-        else:
-            return False
+        self.exact_tokens = Counter(split_words(" ".join(exact_info)))
+        info_tokens = split_words(" ".join(info))
+        self.info_tokens = Counter(info_tokens)
+        self.info_length = len(info_tokens)
 
 
+def search_signature_match(pred_signature, gold_signature, threshold):
+    """
+        Checks if a predicted search_* call matches a gold function, given their signatures. 
+        The exact arguments must match (a word F1 of 1.0 means the token multisets are equal), 
+        and the word F1 of the other arguments must exceed the threshold. 
+    """
+    if pred_signature.exact_tokens != gold_signature.exact_tokens:
+        return False
 
+    judgment_score = signature_f1(pred_signature.info_tokens, pred_signature.info_length, 
+                                  gold_signature.info_tokens, gold_signature.info_length)
+    if judgment_score > threshold:
+        return True
+    else:
+        return False
 
 
-def word_f1(pred_item: str, gold_item: str, expose_p_and_r: bool = False) -> float:
-    if pred_item is None or gold_item is None:
-        return 0
-    p_tokens = re.split(r'[ |]+', pred_item.lower())
-    g_tokens = re.split(r'[ |]+', gold_item.lower())
-    
-    common = Counter(g_tokens) & Counter(p_tokens)
+def signature_f1(p_counter, p_length, g_counter, g_length):
+    """
+        The word F1 of two token Counters, computed exactly as in `word_f1`. 
+    """
+    common = g_counter & p_counter
     num_same = sum(common.values())
     if num_same == 0:
-        if expose_p_and_r:
-            return 0, 0, 0
-        else:
-            return 0
-    precision = 1.0 * num_same / len(p_tokens)
-    recall = 1.0 * num_same / len(g_tokens)
-    f1 = (2 * precision * recall) / (precision + recall)
-    
-    if expose_p_and_r:
-        return precision, recall, f1
-    else:
-        return f1
+        return 0
+    precision = 1.0 * num_same / p_length
+    recall = 1.0 * num_same / g_length
+    return (2 * precision * recall) / (precision + recall)
+
+
+class GoldIndex:
+    """
+        The gold functions of a turn, preprocessed once for matching. 
+
+        Attributes: 
+            names: The set of gold function names. 
+            check_index: Maps (name, sorted parameter names, lowercased values) of check_* gold functions 
+                         to the index of the first gold function with that key. 
+            search_buckets: Maps the name of search_* gold functions to their indices, in order. 
+            fully_indexed: False if a check_* gold function has non-string values, 
+                           in which case check_* calls are matched by scanning. 
+            returns: Read-only snapshots of the gold return values, shared by all matching calls. 
+            search_signatures: Caches the `SearchSignature` of search_* gold functions by index. 
+            gold_names, gold_parameters: The names and parameters of the gold functions, in order. 
+
+        Args: 
+            gold_functions: Dicts with 'name', 'parameters' and 'return', 
+                            or `npcdataset.FunctionCall`s (name, parameters, return_values). 
+    """
+    def __init__(self, gold_functions):
+        self.gold_functions = gold_functions
+        self.gold_names = []
+        self.gold_parameters = []
+        self.returns = []
+        for gold_function in gold_functions:
+            name, parameters, return_values = gold_fields(gold_function)
+            self.gold_names.append(name)
+            self.gold_parameters.append(parameters)
+            self.returns.append(freeze(return_values))
+        self.names = set()
+        self.check_index = {}
+        self.search_buckets = {}
+        self.search_signatures = {}
+        self.fully_indexed = True
+        for i, (name, parameters) in enumerate(zip(self.gold_names, self.gold_parameters)):
+            self.names.add(name)
+            if 'check' in name:
+                key = check_key(name, parameters)
+                if key is None:
+                    self.fully_indexed = False
+                else:
+                    self.check_index.setdefault(key, i)
+            elif 'search' in name:
+                self.search_buckets.setdefault(name, []).append(i)
+
+    def __len__(self):
+        return len(self.gold_functions)
+
+    def match(self, func_item, threshold=0.4, name_resolver=None):
+        """
+            Returns the index of the first gold function that the func_item matches, or -1. 
+
+            check_* calls are looked up in the hash index of the gold functions, 
+            and search_* calls are only compared with the gold functions of the same name. 
+            The result is the same as comparing with every gold function in order (see `Executor.scan_gold`). 
+            With a `name_resolver` (see `Executor`), check_* calls that miss are retried with canonical names. 
+        """
+        gold_func_index = self.match_exact(func_item, threshold)
+        if gold_func_index == -1 and name_resolver is not None and 'check' in func_item['name']:
+            parameters = resolve_names(func_item['parameters'], name_resolver)
+            if parameters is not None:
+                gold_func_index = self.match_exact({'name': func_item['name'], 'parameters': parameters}, threshold)
+        return gold_func_index
+
+    def match_exact(self, func_item, threshold=0.4):
+        """Returns the index of the first gold function that the func_item matches as given, or -1."""
+        name = func_item['name']
+        if name not in self.names:
+            return -1
+        if 'check' in name:
+            if self.fully_indexed:
+                key = check_key(name, func_item['parameters'])
+                if key is not None:
+                    return self.check_index.get(key, -1)
+            return self.scan_check(func_item)
+        elif 'search' in name:
+            pred_signature = None
+            for i in self.search_buckets.get(name, ()):
+                if pred_signature is None:
+                    pred_signature = SearchSignature(func_item['parameters'], skip_empty=True)
+                if search_signature_match(pred_signature, self.search_signature(i), threshold):
+                    return i
+        return -1
+
+    def explain(self, func_item, threshold=0.4, name_resolver=None):
+        """
+            Explains how the func_item is matched. Slower than `match`; used for tracing. 
+            Pass the executor's `name_resolver`, so that the branch is the one the executor took. 
+
+            Returns: 
+                A dict with 
+                    'branch': 'matched', 'name_miss', 'param_key_miss' (no check_* gold function of that name 
+                              has the same parameter names), 'exact_arg_miss' (a check_* value or an exact 
+                              search_* argument differs), 'fuzzy_below_threshold' (the word F1 of the 
+                              search_* arguments is too low) or 'not_matchable' (action functions), 
+                    'gold_index': the matching index, or -1, 
+                    'resolved': whether a check_* call only matched after name resolution, 
+                    'candidates': for search_* calls, [{'gold_index', 'exact', 'f1'}] per gold function of that name. 
+        """
+        name = func_item['name']
+        parameters = func_item['parameters']
+        explanation = {'branch': 'name_miss', 'gold_index': -1, 'resolved': False, 'candidates': []}
+        if 'check' not in name and 'search' not in name:
+            explanation['branch'] = 'not_matchable'
+        elif name not in self.names:
+            pass
+        elif 'check' in name:
+            gold_func_index = self.match(func_item, threshold, name_resolver)
+            explanation['gold_index'] = gold_func_index
+            if gold_func_index != -1:
+                explanation['branch'] = 'matched'
+                explanation['resolved'] = self.match_exact(func_item, threshold) == -1
+            elif any(gold_name == name and sorted(gold_parameters) == sorted(parameters)
+                     for gold_name, gold_parameters in zip(self.gold_names, self.gold_parameters)):
+                explanation['branch'] = 'exact_arg_miss'
+            else:
+                explanation['branch'] = 'param_key_miss'
+        elif 'search' in name:
+            pred_signature = SearchSignature(parameters, skip_empty=True)
+            explanation['branch'] = 'exact_arg_miss'
+            for i in self.search_buckets.get(name, ()):
+                gold_signature = self.search_signature(i)
+                exact = pred_signature.exact_tokens == gold_signature.exact_tokens
+                f1 = signature_f1(pred_signature.info_tokens, pred_signature.info_length, 
+                                  gold_signature.info_tokens, gold_signature.info_length)
+                explanation['candidates'].append({'gold_index': i, 'exact': exact, 'f1': f1})
+                if exact and explanation['gold_index'] == -1:
+                    if f1 > threshold:
+                        explanation['branch'] = 'matched'
+                        explanation['gold_index'] = i
+                    else:
+                        explanation['branch'] = 'fuzzy_below_threshold'
+        return explanation
+
+    def search_signature(self, i):
+        """Returns the `SearchSignature` of the i-th gold function, normalizing it on first use."""
+        signature = self.search_signatures.get(i)
+        if signature is None:
+            signature = self.search_signatures[i] = SearchSignature(self.gold_parameters[i])
+        return signature
+
+    def scan_check(self, func_item):
+        """
+            Matches a check_* call by comparing it with every gold function in order. 
+            Used when parameter values are not strings. 
+        """
+        for i, (gold_name, gold_parameters) in enumerate(zip(self.gold_names, self.gold_parameters)):
+            if gold_name == func_item['name']:
+                gold_function_param_name_list = sorted(gold_parameters.keys())
+                generated_func_param_name_list = sorted(func_item['parameters'].keys())
+                if gold_function_param_name_list == generated_func_param_name_list:
+                    gold_function_param_value_list = [gold_parameters[param_name].lower() for param_name in gold_function_param_name_list]
+                    generated_func_param_value_list = [func_item["parameters"][param_name].lower() for param_name in generated_func_param_name_list]
+                    if gold_function_param_value_list == generated_func_param_value_list:
+                        return i
+        return -1
+
+
+def resolve_names(parameters, name_resolver):
+    """
+        Returns a copy of the parameters with the string values of '*_name' parameters replaced by their canonical names, 
+        or None if no value changes. 
+    """
+    resolved = None
+    for param_name, value in parameters.items():
+        if param_name.endswith('_name') and isinstance(value, str):
+            canonical = name_resolver(value)
+            if canonical is not None and canonical != value:
+                if resolved is None:
+                    resolved = dict(parameters)
+                resolved[param_name] = canonical
+    return resolved
+
+
+def gold_fields(gold_function):
+    """Returns (name, parameters, return value) of a gold function dict or `npcdataset.FunctionCall`."""
+    if isinstance(gold_function, dict):
+        return gold_function['name'], gold_function['parameters'], gold_function.get('return')
+    return gold_function.name, gold_function.parameters, gold_function.return_values
+
+
+def check_key(name, parameters):
+    """
+        The key under which a check_* function is matched: its name, its sorted parameter names, 
+        and the lowercased parameter values in the same order. 
+        Returns None if a value is not a string. 
+    """
+    param_names = tuple(sorted(parameters.keys()))
+    values = []
+    for param_name in param_names:
+        value = parameters[param_name]
+        if not isinstance(value, str):
+            return None
+        values.append(value.lower())
+    return (name, param_names, tuple(values))
+
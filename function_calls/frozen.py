@@ -0,0 +1,62 @@
+"""
+Read-only containers used by the Executor to share function call data without copying.
+
+`FrozenDict` and `FrozenList` subclass `dict` and `list`, so they print, compare and serialize
+exactly like the plain containers, but raise TypeError on mutation.
+Copying them (`copy.copy`, `copy.deepcopy`) returns plain, mutable containers.
+"""
+import copy
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"'{type(self).__name__}' object is read-only")
+
+
+class FrozenDict(dict):
+    """A read-only dict."""
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {copy.deepcopy(k, memo): copy.deepcopy(v, memo) for k, v in self.items()}
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """A read-only list."""
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(v, memo) for v in self]
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(obj):
+    """
+    Returns a read-only snapshot of `obj`. Dicts and lists are converted recursively;
+    already frozen containers are shared as they are.
+    """
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return FrozenList([freeze(v) for v in obj])
+    if isinstance(obj, tuple):
+        return tuple(freeze(v) for v in obj)
+    return obj
@@ -0,0 +1,122 @@
+"""
+Opt-in instrumentation of the Executor.
+
+Pass an `ExecutionTracer` to `Executor(..., tracer=tracer)` to count how every function call
+was matched (see `GoldIndex.explain` for the branches) and, optionally, keep a per-call trace
+with the word F1 of the search_* candidates and the time spent. Without a tracer the Executor
+does no extra work.
+
+One tracer can be shared by all executors of a run; set `tracer.context` (e.g. data_id and turn)
+before each turn to tag the traces. Traces are exported as JSONL and can be merged across runs.
+"""
+import json
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List
+
+
+BRANCHES = ['matched', 'name_miss', 'param_key_miss', 'exact_arg_miss', 'fuzzy_below_threshold', 'not_matchable']
+
+
+class ExecutionTracer:
+    """
+        Records how the function calls of one or more executors were matched.
+
+        Args:
+            keep_traces: Keep one trace dict per call. If False, only the counters are updated.
+
+        Attributes:
+            branches: Counter of match branches over all calls.
+            functions: Maps function names to a Counter of their match branches.
+            calls: The number of recorded calls.
+            total_time: The time spent resolving the recorded calls, in seconds.
+            traces: The per-call traces, if `keep_traces`.
+            context: Fields copied into every trace, e.g. {'data_id': ..., 'turn': ...}.
+    """
+    def __init__(self, keep_traces: bool = True):
+        self.keep_traces = keep_traces
+        self.branches = Counter()
+        self.functions = defaultdict(Counter)
+        self.calls = 0
+        self.total_time = 0.0
+        self.traces: List[Dict[str, Any]] = []
+        self.context: Dict[str, Any] = {}
+
+    def record(self, executor, func_item, elapsed: float) -> None:
+        """Records a call resolved by `executor` in `elapsed` seconds. Called by `Executor.execute`."""
+        # explained with the executor's name resolver, so that the branch is the one that decided the call
+        explanation = executor.gold_index.explain(func_item, executor.threshold, executor.name_resolver)
+        branch = explanation['branch']
+        name = func_item['name']
+        self.calls += 1
+        self.total_time += elapsed
+        self.branches[branch] += 1
+        self.functions[name][branch] += 1
+        if not self.keep_traces:
+            return
+
+        candidates = explanation['candidates']
+        trace = dict(self.context)
+        trace.update({
+            'executor': type(executor).__name__,
+            'name': name,
+            'parameters': dict(func_item['parameters']),
+            'branch': branch,
+            'gold_index': explanation['gold_index'],
+            'resolved': explanation['resolved'],
+            'threshold': executor.threshold,
+            'best_f1': max((c['f1'] for c in candidates), default=None),
+            'candidates': candidates,
+            'elapsed_ms': elapsed * 1000,
+        })
+        self.traces.append(trace)
+
+    def merge(self, other: 'ExecutionTracer') -> 'ExecutionTracer':
+        """Adds the counters and traces of `other` to this tracer. Returns self."""
+        self.calls += other.calls
+        self.total_time += other.total_time
+        self.branches.update(other.branches)
+        for name, branches in other.functions.items():
+            self.functions[name].update(branches)
+        self.traces.extend(other.traces)
+        return self
+
+    @classmethod
+    def aggregate(cls, tracers: Iterable['ExecutionTracer']) -> 'ExecutionTracer':
+        """Merges several tracers, e.g. those of parallel workers, into a new one."""
+        merged = cls()
+        for tracer in tracers:
+            merged.merge(tracer)
+        return merged
+
+    def summary(self) -> Dict[str, Any]:
+        """Returns the counters as a JSON-serializable dict."""
+        return {
+            'calls': self.calls,
+            'branches': {branch: self.branches[branch] for branch in BRANCHES if self.branches[branch]},
+            'functions': {name: dict(branches) for name, branches in sorted(self.functions.items())},
+            'total_time_ms': self.total_time * 1000,
+            'mean_time_us': self.total_time / self.calls * 1e6 if self.calls else 0.0,
+        }
+
+    def export_jsonl(self, path: str) -> None:
+        """Writes one trace per line."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for trace in self.traces:
+                f.write(json.dumps(trace, ensure_ascii=False) + '\n')
+
+    @classmethod
+    def from_jsonl(cls, paths: Iterable[str]) -> 'ExecutionTracer':
+        """Rebuilds a tracer, counters included, from exported traces."""
+        tracer = cls()
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    trace = json.loads(line)
+                    tracer.calls += 1
+                    tracer.total_time += trace.get('elapsed_ms', 0.0) / 1000
+                    tracer.branches[trace['branch']] += 1
+                    tracer.functions[trace['name']][trace['branch']] += 1
+                    tracer.traces.append(trace)
+        return tracer
@@ -0,0 +1,156 @@
+"""
+An Executor that answers function calls from the knowledge of a conversation instead of its gold functions.
+
+`KnowledgeIndex` holds the conversation's `knowledge_info`, optionally merged with facts
+harvested from the gold functions of other datasets (see `harvest_facts`), and
+`KnowledgeExecutor` answers check_* calls from it and search_* calls over its columnar view.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from .executor import Executor
+from .search_engine import ColumnarKnowledge
+
+
+# The fields returned by `check_basic_info`, in the order used by the datasets.
+ITEM_BASIC_INFO_FIELDS = ['type', 'price', 'attack', 'description']
+QUEST_BASIC_INFO_FIELDS = ['duration', 'level', 'reward', 'description']
+
+# Single-field check_* functions whose return values can be harvested as facts.
+# check_description is kept separately, since it returns a long-form description.
+FACT_FUNCTIONS = {
+    'check_basic_info', 'check_price', 'check_type', 'check_attack',
+    'check_level', 'check_duration', 'check_reward',
+}
+
+NOT_AVAILABLE = [{'information': 'n/a'}]
+
+
+class KnowledgeIndex:
+    """
+        A name-keyed index over the knowledge of a conversation.
+        Build it once per conversation and share it between the executors of all turns.
+
+        Each record holds the fields of a `knowledge_info` entry (e.g. name, type, description),
+        optionally merged with facts harvested from other data, such as prices and rewards,
+        which the knowledge lists of the datasets do not contain.
+    """
+    def __init__(self, knowledge_info: List[Dict[str, str]], facts: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.detailed_descriptions: Dict[str, str] = {}
+        self._columnar: Optional[ColumnarKnowledge] = None
+        for item in knowledge_info:
+            name = item.get('name', '')
+            if name:
+                self.records[_key(name)] = dict(item)
+        if facts:
+            for name, fields in facts.items():
+                self.add_facts(name, fields)
+
+    @classmethod
+    def from_conversation(cls, conversation, facts: Optional[Dict[str, Dict[str, Any]]] = None) -> 'KnowledgeIndex':
+        """Builds the index of an `npcdataset.Conversation`."""
+        return cls(conversation.knowledge, facts)
+
+    def add_facts(self, name: str, fields: Dict[str, Any]) -> None:
+        """
+            Adds facts about `name`. Existing knowledge fields are kept.
+            The special field 'detailed_description' holds the return value of `check_description`.
+        """
+        key = _key(name)
+        self._columnar = None
+        record = self.records.setdefault(key, {'name': name})
+        for field_name, value in fields.items():
+            if field_name == 'detailed_description':
+                self.detailed_descriptions[key] = value
+            else:
+                record.setdefault(field_name, value)
+
+    def lookup(self, name: Any) -> Optional[Dict[str, Any]]:
+        """Returns the record of `name` (case-insensitive), or None."""
+        if not isinstance(name, str):
+            return None
+        return self.records.get(_key(name))
+
+    def columnar(self) -> ColumnarKnowledge:
+        """Returns the records as typed columns for search_* functions, parsing them on first use."""
+        if self._columnar is None:
+            self._columnar = ColumnarKnowledge(list(self.records.values()))
+        return self._columnar
+
+
+class KnowledgeExecutor(Executor):
+    """
+        An executor that answers check_* functions from the conversation's knowledge instead of gold data.
+
+        It records function calls exactly like `Executor`, so full pipelines can be run and benchmarked offline
+        with realistic function results and prompt sizes.
+        search_* functions are evaluated over the columnar view of the knowledge (see `search_engine.py`).
+        Action functions return an empty list, as in the datasets.
+        Unknown names and unknown fields return [{'information': 'n/a'}].
+    """
+    def __init__(self, tool_registry, action_registry, knowledge_index: KnowledgeIndex, gold_functions=None, threshold=0.4,
+                 max_search_results=3):
+        super().__init__(tool_registry, action_registry, gold_functions or [], threshold)
+        self.knowledge_index = knowledge_index
+        self.max_search_results = max_search_results
+
+    def resolve(self, func_item):
+        name = func_item['name'].strip()
+        parameters = func_item.get('parameters') or {}
+        if 'check' in name:
+            return self._check(name, parameters)
+        if 'search' in name:
+            return self.knowledge_index.columnar().search(parameters, self.max_search_results)
+        return []
+
+    def _check(self, name, parameters):
+        if 'item_name' in parameters:
+            basic_info_fields = ITEM_BASIC_INFO_FIELDS
+            record = self.knowledge_index.lookup(parameters['item_name'])
+        elif 'quest_name' in parameters:
+            basic_info_fields = QUEST_BASIC_INFO_FIELDS
+            record = self.knowledge_index.lookup(parameters['quest_name'])
+        else:
+            record = None
+        if record is None:
+            return [dict(item) for item in NOT_AVAILABLE]
+
+        if name == 'check_basic_info':
+            return [{field_name: record.get(field_name, 'n/a') for field_name in basic_info_fields}]
+        if name == 'check_description':
+            key = _key(record['name'])
+            return [{'description': self.knowledge_index.detailed_descriptions.get(key, record.get('description', 'n/a'))}]
+
+        field_name = name[len('check_'):]
+        if field_name not in record:
+            return [dict(item) for item in NOT_AVAILABLE]
+        return [{field_name: record[field_name]}]
+
+
+def harvest_facts(conversations: Iterable) -> Dict[str, Dict[str, Any]]:
+    """
+        Collects facts about items and quests from the check_* gold functions of a dataset,
+        e.g. `harvest_facts(load_data('data/task1_train.json'))`.
+        Use facts from training data to benchmark on other data without using its gold functions.
+    """
+    facts: Dict[str, Dict[str, Any]] = {}
+    for conversation in conversations:
+        for turn in conversation.turns:
+            for function in turn.gold_functions:
+                function_name = function.name.strip()
+                parameters = function.parameters or {}
+                name = parameters.get('item_name', parameters.get('quest_name'))
+                if not isinstance(name, str) or not function.return_values:
+                    continue
+                fields = facts.setdefault(name, {})
+                for value in function.return_values:
+                    if function_name == 'check_description' and 'description' in value:
+                        fields.setdefault('detailed_description', value['description'])
+                    elif function_name in FACT_FUNCTIONS:
+                        for field_name, field_value in value.items():
+                            fields.setdefault(field_name, field_value)
+    return facts
+
+
+def _key(name: str) -> str:
+    return name.strip().lower()
@@ -0,0 +1,227 @@
+"""
+Word-overlap F1 metrics shared by the Executor and the local runners.
+
+Texts are tokenized once and mapped to integer ids through a cached, thread-safe `TokenVocabulary`.
+`batch_word_f1` scores many (pred, gold) pairs at once with sparse count vectors,
+and the scalar wrappers `word_f1` and `set_word_f1` return exactly the values of the
+original per-pair implementations.
+"""
+from collections import Counter, OrderedDict
+import re
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+_TOKEN_SEPARATORS = re.compile(r'[ |]+')
+
+
+def split_words(text: str) -> List[str]:
+    """The tokenization of `word_f1`: lowercase, split on spaces and '|'."""
+    return _TOKEN_SEPARATORS.split(text.lower())
+
+
+def split_whitespace(text: str) -> List[str]:
+    """The tokenization of `set_word_f1`: split on whitespace, case-sensitive."""
+    return text.split()
+
+
+class TokenVocabulary:
+    """
+        Maps tokens to integer ids, and caches the tokenization of recently seen texts.
+
+        The vocabulary is reset once it holds more than `max_tokens` tokens, so that it does not grow
+        over a whole run. Ids are therefore only comparable between texts encoded by the same call:
+        texts that are scored against each other go through `encode_many`, `counts_many` or `unique_many`.
+        The vocabulary can be shared by threads.
+
+        Args:
+            tokenize: Splits a text into tokens.
+            cache_size: The number of texts whose ids and counts are kept.
+            max_tokens: The number of token ids kept before the vocabulary is reset.
+    """
+    def __init__(self, tokenize: Callable[[str], List[str]] = split_words, cache_size: int = 8192,
+                 max_tokens: int = 2 ** 18):
+        self.tokenize = tokenize
+        self.cache_size = cache_size
+        self.max_tokens = max_tokens
+        self.token_ids = {}
+        self.resets = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.token_ids)
+
+    def reset(self) -> None:
+        """Forgets all token ids and cached texts, e.g. between runs."""
+        with self._lock:
+            self._reset()
+
+    def encode(self, text: str) -> np.ndarray:
+        """Returns the token ids of `text`, in order."""
+        return self.encode_many((text,))[0]
+
+    def counts(self, text: str) -> Counter:
+        """Returns the token id counts of `text`."""
+        return self.counts_many((text,))[0]
+
+    def unique(self, text: str) -> frozenset:
+        """Returns the set of token ids of `text`."""
+        return self.unique_many((text,))[0]
+
+    def encode_many(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Returns the token ids of each text, all in the same id space."""
+        with self._lock:
+            return [entry[0] for entry in self._entries(texts)]
+
+    def counts_many(self, texts: Sequence[str]) -> List[Counter]:
+        """Returns the token id counts of each text, all in the same id space."""
+        with self._lock:
+            entries = self._entries(texts)
+            for entry in entries:
+                if entry[1] is None:
+                    entry[1] = Counter(entry[0].tolist())
+            return [entry[1] for entry in entries]
+
+    def unique_many(self, texts: Sequence[str]) -> List[frozenset]:
+        """Returns the set of token ids of each text, all in the same id space."""
+        with self._lock:
+            entries = self._entries(texts)
+            for entry in entries:
+                if entry[2] is None:
+                    entry[2] = frozenset(entry[0].tolist())
+            return [entry[2] for entry in entries]
+
+    def _entries(self, texts):
+        # Called with the lock held. The vocabulary is only reset before a call, so that the texts
+        # of one call share their ids.
+        if len(self.token_ids) > self.max_tokens:
+            self._reset()
+        return [self._entry(text) for text in texts]
+
+    def _entry(self, text):
+        entry = self._cache.get(text)
+        if entry is not None:
+            self._cache.move_to_end(text)
+            return entry
+        token_ids = self.token_ids
+        ids = [token_ids.setdefault(token, len(token_ids)) for token in self.tokenize(text)]
+        # [ids, Counter of ids, set of ids], the latter two built on first use
+        entry = [np.array(ids, dtype=np.int64), None, None]
+        self._cache[text] = entry
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    def _reset(self):
+        self.token_ids = {}
+        self._cache = OrderedDict()
+        self.resets += 1
+
+
+WORD_VOCABULARY = TokenVocabulary(split_words)
+WHITESPACE_VOCABULARY = TokenVocabulary(split_whitespace)
+
+
+def batch_word_f1(preds: Sequence[Optional[str]], golds: Sequence[Optional[str]], unique: bool = False,
+                  vocabulary: Optional[TokenVocabulary] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+        Computes the word F1 of many (pred, gold) pairs at once.
+
+        Args:
+            preds: The predicted texts. None scores 0.
+            golds: The gold texts, aligned with `preds`. None scores 0.
+            unique: Count each token once per text (as `set_word_f1`) instead of with multiplicity (as `word_f1`).
+            vocabulary: Defaults to WHITESPACE_VOCABULARY if `unique`, else WORD_VOCABULARY.
+
+        Returns:
+            precision, recall and f1, float64 arrays of length len(preds).
+            Every value equals the one of the corresponding scalar function.
+    """
+    if len(preds) != len(golds):
+        raise ValueError(f"got {len(preds)} predictions but {len(golds)} gold texts")
+    if vocabulary is None:
+        vocabulary = WHITESPACE_VOCABULARY if unique else WORD_VOCABULARY
+    n = len(preds)
+    valid = np.array([p is not None and g is not None for p, g in zip(preds, golds)], dtype=bool)
+    empty = np.zeros(0, dtype=np.int64)
+    # encoded by one call, so that all ids belong to the same vocabulary
+    encoded = iter(vocabulary.encode_many([t for p, g, ok in zip(preds, golds, valid) if ok for t in (p, g)]))
+    pred_ids, gold_ids = [], []
+    for ok in valid:
+        pred_ids.append(next(encoded) if ok else empty)
+        gold_ids.append(next(encoded) if ok else empty)
+
+    # one sparse count vector per pair, as sorted keys pair * V + token id
+    size = 1 + max((int(ids.max()) for ids in pred_ids + gold_ids if len(ids)), default=0)
+    pred_keys, pred_counts = _sparse_counts(pred_ids, size)
+    gold_keys, gold_counts = _sparse_counts(gold_ids, size)
+    common, pred_pos, gold_pos = np.intersect1d(pred_keys, gold_keys, assume_unique=True, return_indices=True)
+    if unique:
+        same = np.ones(len(common), dtype=np.int64)
+        pred_lengths = np.bincount(pred_keys // size, minlength=n)
+        gold_lengths = np.bincount(gold_keys // size, minlength=n)
+    else:
+        same = np.minimum(pred_counts[pred_pos], gold_counts[gold_pos])
+        pred_lengths = np.array([len(ids) for ids in pred_ids], dtype=np.int64)
+        gold_lengths = np.array([len(ids) for ids in gold_ids], dtype=np.int64)
+    num_same = np.bincount(common // size, weights=same, minlength=n)
+
+    precision = np.zeros(n)
+    recall = np.zeros(n)
+    f1 = np.zeros(n)
+    hit = num_same > 0
+    precision[hit] = 1.0 * num_same[hit] / pred_lengths[hit]
+    recall[hit] = 1.0 * num_same[hit] / gold_lengths[hit]
+    f1[hit] = (2 * precision[hit] * recall[hit]) / (precision[hit] + recall[hit])
+    return precision, recall, f1
+
+
+def word_f1(pred_item: str, gold_item: str, expose_p_and_r: bool = False) -> float:
+    """
+        The word F1 of the Executor: lowercase tokens split on spaces and '|', counted with multiplicity.
+        Returns (precision, recall, f1) if `expose_p_and_r`.
+    """
+    if pred_item is None or gold_item is None:
+        return 0
+    p_counts, g_counts = WORD_VOCABULARY.counts_many((pred_item, gold_item))
+
+    common = g_counts & p_counts
+    num_same = sum(common.values())
+    if num_same == 0:
+        if expose_p_and_r:
+            return 0, 0, 0
+        else:
+            return 0
+    precision = 1.0 * num_same / sum(p_counts.values())
+    recall = 1.0 * num_same / sum(g_counts.values())
+    f1 = (2 * precision * recall) / (precision + recall)
+
+    if expose_p_and_r:
+        return precision, recall, f1
+    else:
+        return f1
+
+
+def set_word_f1(pred: str, gold: str) -> float:
+    """
+        The word F1 of the response evaluation: whitespace tokens, each counted once.
+    """
+    pred_tokens, gold_tokens = WHITESPACE_VOCABULARY.unique_many((pred, gold))
+    common = gold_tokens & pred_tokens
+    if not common:
+        return 0.0
+    precision = len(common) / len(pred_tokens) if pred_tokens else 0
+    recall = len(common) / len(gold_tokens) if gold_tokens else 0
+    return 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
+
+
+def _sparse_counts(id_lists: List[np.ndarray], size: int) -> Tuple[np.ndarray, np.ndarray]:
+    lengths = np.array([len(ids) for ids in id_lists], dtype=np.int64)
+    if lengths.sum() == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pairs = np.repeat(np.arange(len(id_lists), dtype=np.int64), lengths)
+    keys = pairs * size + np.concatenate(id_lists)
+    return np.unique(keys, return_counts=True)
@@ -0,0 +1,219 @@
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+# Numeric columns and the order in which they are mentioned in the 'reason' of a result.
+NUMERIC_FIELDS = ['price', 'attack', 'level', 'duration', 'reward']
+REASON_FIELDS = ['price', 'attack', 'type', 'level', 'duration', 'reward']
+
+# Quest levels in increasing order of difficulty.
+LEVEL_ORDER = {'a': 1, 'b': 2, 'c': 3, 's': 4}
+
+COMPARISON_OPERATORS = {
+    'or more': np.greater_equal, 'or above': np.greater_equal, 'or higher': np.greater_equal, 'at least': np.greater_equal,
+    'more than': np.greater, 'above': np.greater, 'over': np.greater, 'higher than': np.greater, 'greater than': np.greater,
+    'or less': np.less_equal, 'or below': np.less_equal, 'or lower': np.less_equal, 'at most': np.less_equal, 'up to': np.less_equal,
+    'less than': np.less, 'below': np.less, 'under': np.less, 'lower than': np.less,
+}
+EXCLUSION_OPERATORS = {'other than', 'except', 'not', 'excluding'}
+APPROXIMATE_OPERATORS = {'about', 'around', 'approximately', 'roughly'}
+# Operators that select a part of the catalog instead of comparing with a value.
+# 'short' and 'long' are used for durations.
+BAND_OPERATORS = {'high': 'high', 'long': 'high', 'low': 'low', 'short': 'low', 'cheap': 'low'}
+# Operators whose meaning the gold data does not show: the tool descriptions offer 'average', but no gold
+# search uses it, so a criterion with it is not applied rather than guessing a band.
+UNFILTERED_OPERATORS = {'average'}
+EXTREME_OPERATORS = {'highest': 'highest', 'longest': 'highest', 'lowest': 'lowest', 'shortest': 'lowest', 'cheapest': 'lowest'}
+NO_LIMIT = {'', 'no limit', 'any'}
+
+APPROXIMATE_TOLERANCE = 0.25
+
+_NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+_DURATION_UNITS = {'day': 1, 'week': 7, 'month': 30}
+
+
+class ColumnarKnowledge:
+    """
+        The knowledge items of a conversation parsed once into typed columns, to evaluate search_* functions.
+
+        Numeric fields (price, attack, level, duration, reward) are stored as float64 arrays, with NaN for unknown values.
+        Prices such as "1,000G" or "300 Gold" are normalized to integers, durations to days, and levels to their rank.
+        Each numeric column also keeps a sorted index, so that extreme-value queries do not need to sort.
+    """
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self.names = [str(record.get('name', '')) for record in records]
+        self.name_keys = np.array([name.strip().lower() for name in self.names], dtype=object)
+        self.type_tokens = [_words(str(record.get('type', ''))) for record in records]
+        self.columns: Dict[str, np.ndarray] = {}
+        self.sorted_indexes: Dict[str, np.ndarray] = {}
+        for field_name in NUMERIC_FIELDS:
+            column = np.array([_parse_value(field_name, record.get(field_name)) for record in records], dtype=np.float64)
+            self.columns[field_name] = column
+            # NaN values are sorted to the end.
+            self.sorted_indexes[field_name] = np.argsort(column, kind='stable')
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def search(self, parameters: Dict[str, Any], max_results: int = 3) -> List[Dict[str, str]]:
+        """
+            Evaluates the parameters of a search_item or search_quest call.
+
+            Args:
+                parameters: e.g. {'item_price': '1,000G', 'item_price_operator': 'or less', 'item_type': 'Sword'}.
+                max_results: More matching items than this are reported as 'many'.
+
+            Returns:
+                [{'item_name': ..., 'reason': ...}, ...] (or 'quest_name'),
+                [{'information': 'many'}] when too many items match or no criterion applies,
+                [{'information': 'n/a'}] when nothing matches.
+                Free-text description criteria are not evaluated.
+        """
+        prefix = 'quest' if any(key.startswith('quest') for key in parameters) else 'item'
+        mask = np.ones(len(self.records), dtype=bool)
+        extremes = []
+        used_fields = []
+        for key, value in parameters.items():
+            if key.endswith('_operator') or not isinstance(value, str):
+                continue
+            field_name = key[len(prefix) + 1:] if key.startswith(prefix + '_') else key
+            operator = str(parameters.get(key + '_operator', '')).strip().lower()
+            applied = self._apply(field_name, value, operator, mask, extremes)
+            if applied and field_name not in used_fields:
+                used_fields.append(field_name)
+
+        if not used_fields:
+            return [{'information': 'many'}]
+
+        for field_name, direction in extremes:
+            mask = self._extreme(field_name, direction, mask)
+
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return [{'information': 'n/a'}]
+        if len(rows) > max_results:
+            return [{'information': 'many'}]
+
+        sort_field = next((f for f in used_fields if f in self.columns), None)
+        if sort_field is not None:
+            rows = rows[np.argsort(self.columns[sort_field][rows], kind='stable')]
+        return [{f'{prefix}_name': self.names[row], 'reason': self._reason(row, used_fields)} for row in rows]
+
+    ############################################################
+    # Operator evaluation
+    ############################################################
+
+    def _apply(self, field_name, value, operator, mask, extremes):
+        """Applies one criterion to `mask` in place. Returns whether the criterion was used."""
+        value = value.strip()
+        lowered = value.lower()
+        if lowered in NO_LIMIT or operator == 'no limit':
+            return False
+        if operator in UNFILTERED_OPERATORS or lowered in UNFILTERED_OPERATORS:
+            return False
+
+        if field_name == 'name':
+            names = np.array([v.strip().lower() for v in value.split('|') if v.strip()], dtype=object)
+            selected = np.isin(self.name_keys, names)
+            mask &= ~selected if operator in EXCLUSION_OPERATORS else selected
+            return True
+
+        if field_name == 'type':
+            # 'Sword' matches both 'Single-Handed Sword' and 'Double-Handed Sword'.
+            wanted = [_words(v) for v in value.split('|') if v.strip()]
+            selected = np.fromiter((any(w <= tokens for w in wanted) for tokens in self.type_tokens), dtype=bool, count=len(self))
+            mask &= ~selected if operator in EXCLUSION_OPERATORS else selected
+            return True
+
+        if field_name not in self.columns:
+            return False
+        column = self.columns[field_name]
+
+        for word in (operator, lowered):
+            if word in EXTREME_OPERATORS:
+                extremes.append((field_name, EXTREME_OPERATORS[word]))
+                return True
+            if word in BAND_OPERATORS:
+                mask &= self._band(column, BAND_OPERATORS[word])
+                return True
+
+        # Values such as 'C|challenging' are alternatives; use the first parseable one.
+        numbers = [n for n in (_parse_value(field_name, v) for v in value.split('|')) if not np.isnan(n)]
+        if not numbers:
+            return False
+        number = numbers[0]
+
+        with np.errstate(invalid='ignore'):
+            if operator in COMPARISON_OPERATORS:
+                mask &= COMPARISON_OPERATORS[operator](column, number)
+            elif operator in EXCLUSION_OPERATORS:
+                mask &= ~np.isin(column, numbers) & ~np.isnan(column)
+            elif operator in APPROXIMATE_OPERATORS:
+                mask &= np.abs(column - number) <= APPROXIMATE_TOLERANCE * abs(number)
+            else:
+                mask &= np.isin(column, numbers)
+        return True
+
+    def _band(self, column, band):
+        known = column[~np.isnan(column)]
+        if len(known) == 0:
+            return np.zeros(len(column), dtype=bool)
+        low, high = np.quantile(known, [1 / 3, 2 / 3])
+        with np.errstate(invalid='ignore'):
+            if band == 'high':
+                return column >= high
+            return column <= low
+
+    def _extreme(self, field_name, direction, mask):
+        column = self.columns[field_name]
+        order = self.sorted_indexes[field_name]
+        candidates = order[mask[order] & ~np.isnan(column[order])]
+        result = np.zeros(len(mask), dtype=bool)
+        if len(candidates) == 0:
+            return result
+        target = column[candidates[-1]] if direction == 'highest' else column[candidates[0]]
+        result[candidates[column[candidates] == target]] = True
+        return result
+
+    def _reason(self, row, used_fields):
+        record = self.records[row]
+        parts = []
+        for field_name in REASON_FIELDS:
+            if field_name in used_fields and record.get(field_name) not in (None, ''):
+                parts.append(f'Its {field_name} is {record[field_name]}.')
+        return ' '.join(parts)
+
+
+def normalize_price(value: Any) -> Optional[int]:
+    """Normalizes prices such as "1,000G", "300 Gold" or "10,000 gold" to integers. Returns None if there is no number."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, str):
+        return None
+    match = _NUMBER_PATTERN.search(value.replace(',', ''))
+    return int(float(match.group())) if match else None
+
+
+def _parse_value(field_name: str, value: Any) -> float:
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    if field_name == 'level':
+        return float(LEVEL_ORDER.get(text, np.nan))
+    if field_name == 'duration':
+        unit = next((days for name, days in _DURATION_UNITS.items() if name in text), 1)
+        match = _NUMBER_PATTERN.search(text)
+        if match:
+            return float(match.group()) * unit
+        return float(unit) if text.startswith(('a ', 'an ', 'one ')) and unit > 1 else np.nan
+    number = normalize_price(text)
+    return np.nan if number is None else float(number)
+
+
+def _words(text: str) -> frozenset:
+    return frozenset(w for w in re.split(r'[\s\-]+', text.strip().lower()) if w)
@@ -0,0 +1,135 @@
+"""
+One-pass tuning of the word F1 threshold of search_* matching.
+
+The exact-argument check and the fuzzy word F1 of every (predicted search_* call, gold search_*
+function) candidate pair are computed once. The accuracy for a whole grid of thresholds is then
+evaluated with NumPy over the stored scores, so saved predictions can be re-scored for any
+threshold without executing the agent again.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .batch_scorer import FunctionCallScorer
+from .executor import GoldIndex
+
+
+DEFAULT_THRESHOLDS = np.round(np.arange(0.0, 1.0001, 0.05), 2)
+
+
+class ThresholdSweep:
+    """
+        Collects the candidate scores of search_* calls and evaluates them for many thresholds.
+
+        The matching rules are those of `GoldIndex.match`: a search_* call matches the first gold function
+        of the same name whose exact arguments are equal and whose word F1 is above the threshold.
+        Other calls do not depend on the threshold; they are scored once by a `FunctionCallScorer`,
+        so that the curve also reports the overall scores.
+    """
+    def __init__(self):
+        self.fixed = FunctionCallScorer()
+        # one row per predicted search_* call: the word F1 of each candidate, -inf if its exact arguments differ
+        self._candidate_f1: List[List[float]] = []
+        # the global ids of the candidates' gold functions, aligned with `_candidate_f1`
+        self._candidate_gold: List[List[int]] = []
+        self.search_gold = 0
+
+    def add_turn(self, predicted_calls: List[Dict], gold_functions: List[Dict], data_id: Any = None,
+                 turn_idx: Optional[int] = None) -> None:
+        """Adds the predicted calls and gold functions of one turn (see `FunctionCallScorer.score_turn`)."""
+        gold_index = GoldIndex(gold_functions)
+        gold_offset = self.search_gold
+        self.search_gold += sum('search' in name for name in gold_index.gold_names)
+        # global ids of the search_* gold functions of this turn
+        gold_ids = {}
+        for i, name in enumerate(gold_index.gold_names):
+            if 'search' in name:
+                gold_ids[i] = gold_offset + len(gold_ids)
+
+        other_calls = []
+        for call in predicted_calls:
+            name = call.get('name', '')
+            if 'search' not in name or 'check' in name:
+                other_calls.append(call)
+                continue
+            explanation = gold_index.explain({'name': name, 'parameters': call.get('parameters') or {}})
+            candidates = explanation['candidates']
+            self._candidate_f1.append([c['f1'] if c['exact'] else -np.inf for c in candidates])
+            self._candidate_gold.append([gold_ids[c['gold_index']] for c in candidates])
+
+        other_gold = [gold_function for gold_function, name in zip(gold_functions, gold_index.gold_names) if 'search' not in name]
+        self.fixed.score_turn(other_calls, other_gold, data_id, turn_idx)
+
+    def add_conversations(self, conversations: Iterable, predictions: Dict[str, List[List[Dict]]]) -> 'ThresholdSweep':
+        """Adds a whole dataset (see `FunctionCallScorer.score_conversations`). Returns self."""
+        for conversation in conversations:
+            predicted_turns = predictions.get(str(conversation.id), [])
+            for turn_idx, turn in enumerate(conversation.turns):
+                predicted_calls = predicted_turns[turn_idx] if turn_idx < len(predicted_turns) else []
+                self.add_turn(predicted_calls, turn.gold_functions, conversation.id, turn_idx)
+        return self
+
+    def curve(self, thresholds: Optional[Iterable[float]] = None) -> Dict[str, Any]:
+        """
+            Evaluates every threshold of the grid.
+
+            Returns:
+                {'thresholds': [...],
+                 'search': {'matched_predicted', 'matched_gold', 'precision', 'recall', 'f1'},
+                 'overall': {'precision', 'recall', 'f1'},
+                 'best_threshold': the threshold with the highest overall F1 (the lowest one on ties)},
+                where every metric is a list aligned with 'thresholds'.
+        """
+        thresholds = np.asarray(DEFAULT_THRESHOLDS if thresholds is None else list(thresholds), dtype=np.float64)
+        n_calls = len(self._candidate_f1)
+        width = max((len(row) for row in self._candidate_f1), default=0)
+        scores = np.full((n_calls, max(width, 1)), -np.inf)
+        gold = np.full((n_calls, max(width, 1)), -1, dtype=np.int64)
+        for i, (row, ids) in enumerate(zip(self._candidate_f1, self._candidate_gold)):
+            scores[i, :len(row)] = row
+            gold[i, :len(ids)] = ids
+
+        # above[call, candidate, threshold]; the first candidate above the threshold is the match
+        above = scores[:, :, None] > thresholds[None, None, :]
+        matched = above.any(axis=1)
+        first = above.argmax(axis=1)
+        matched_gold_ids = np.take_along_axis(gold, first, axis=1)
+        recalled = np.zeros((self.search_gold, len(thresholds)), dtype=bool)
+        call_idx, threshold_idx = np.nonzero(matched)
+        recalled[matched_gold_ids[call_idx, threshold_idx], threshold_idx] = True
+
+        search_matched_predicted = matched.sum(axis=0)
+        search_matched_gold = recalled.sum(axis=0)
+        search = _precision_recall_f1(n_calls, self.search_gold, search_matched_predicted, search_matched_gold)
+        search.update({'matched_predicted': search_matched_predicted.tolist(), 'matched_gold': search_matched_gold.tolist()})
+
+        fixed = self.fixed.report()['aggregate']
+        overall = _precision_recall_f1(fixed['predicted'] + n_calls, fixed['gold'] + self.search_gold,
+                                       fixed['matched_predicted'] + search_matched_predicted,
+                                       fixed['matched_gold'] + search_matched_gold)
+        best = int(np.argmax(overall['f1'])) if len(thresholds) else -1
+        return {
+            'thresholds': thresholds.tolist(),
+            'search': search,
+            'overall': overall,
+            'best_threshold': float(thresholds[best]) if best >= 0 else None,
+        }
+
+
+def sweep_thresholds(conversations: Iterable, predictions: Dict[str, List[List[Dict]]],
+                     thresholds: Optional[Iterable[float]] = None) -> Dict[str, Any]:
+    """Evaluates saved predictions for a grid of search_* thresholds. See `ThresholdSweep.curve`."""
+    return ThresholdSweep().add_conversations(conversations, predictions).curve(thresholds)
+
+
+def _precision_recall_f1(predicted, gold, matched_predicted, matched_gold) -> Dict[str, List[float]]:
+    matched_predicted = np.asarray(matched_predicted, dtype=np.float64)
+    matched_gold = np.asarray(matched_gold, dtype=np.float64)
+    if predicted == 0 and gold == 0:
+        ones = np.ones_like(matched_predicted).tolist()
+        return {'precision': ones, 'recall': ones, 'f1': ones}
+    precision = matched_predicted / predicted if predicted else np.zeros_like(matched_predicted)
+    recall = matched_gold / gold if gold else np.zeros_like(matched_gold)
+    total = precision + recall
+    f1 = np.divide(2 * precision * recall, total, out=np.zeros_like(total), where=total > 0)
+    return {'precision': precision.tolist(), 'recall': recall.tolist(), 'f1': f1.tolist()}
@@ -0,0 +1,115 @@
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import npcdataset.parsers
+from agents.async_openai_agent import AsyncOpenAIAgent
+from function_calls import tool_map, action_map, ConversationExecutor, load_predictions, score_function_calls
+
+
+def load_data(file_path):
+    with open(file_path, "r", encoding='utf-8') as fp:
+        data = json.load(fp)
+    return npcdataset.parsers.parse_conversation_data(data, "test")
+
+
+async def run_conversation(agent, conversation, semaphore) -> Dict[str, List]:
+    """Generates the responses of one conversation. Turns are processed in order, since each builds on the previous one."""
+    async with semaphore:
+        cur_conv_responses = {"data_id": conversation.id, "outputs": []}
+        tool_registry = tool_map[conversation.function_list_id]
+        action_registry = action_map[conversation.function_list_id]
+        conv_exec = ConversationExecutor.from_conversation(conversation, tool_registry, action_registry)
+        npc_persona = conversation.personas['npc'].to_dict()
+        knowledge = {"general_info": conversation.general_knowledge, "knowledge_info": conversation.knowledge}
+        for turn_idx, turn in enumerate(conversation.turns):
+            dialogue = [
+                {"speaker": msg.speaker, "text": msg.text, "target_item": msg.target_items}
+                for msg in turn.messages
+            ]
+            cur_turn_exec = conv_exec.turn_executor(turn_idx)
+            all_results = await agent.agenerate_functions_and_responses(
+                tool_registry,
+                action_registry,
+                conversation.worldview,
+                npc_persona,
+                conversation.roles['npc'],
+                knowledge,
+                conversation.state,
+                dialogue,
+                cur_turn_exec
+            )
+            cur_conv_responses["outputs"].append({
+                "tool_calls": [
+                    {"function": {"name": f["name"], "arguments": f.get("parameters", {})}} for f in cur_turn_exec.function_call_stats
+                ],
+                "response": all_results['final_responses']
+            })
+        return cur_conv_responses
+
+
+async def run_all(make_agent, data_set, concurrency_levels):
+    """
+    Runs the dataset once per concurrency level. Returns the wall-clock times, the responses and the agent of the last run.
+
+    Every level gets a new agent from `make_agent` with the LLM response cache turned off, so that a level is not
+    sped up by the responses, entity binders, name indexes or prompt blocks cached by the levels before it.
+    """
+    print("🧊 Each concurrency level runs on a new agent, with the LLM response cache off")
+    timings = []
+    generated_responses = []
+    agent = None
+    for concurrency in concurrency_levels:
+        agent = make_agent()
+        agent.llm_cache = None
+        semaphore = asyncio.Semaphore(concurrency)
+        start = time.perf_counter()
+        # gather keeps the results in the order of the dataset
+        generated_responses = await asyncio.gather(*[run_conversation(agent, conversation, semaphore) for conversation in data_set])
+        timings.append((concurrency, time.perf_counter() - start))
+        print(f"⏱️ concurrency {concurrency:>3}: {timings[-1][1]:.2f} seconds")
+        await agent.aclose()
+    return timings, generated_responses, agent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', type=str, default='data/task1_sample.json')
+    parser.add_argument('--save_path', type=str, default='results/task1_responses_async.json')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16],
+                        help="numbers of conversations processed concurrently; the dataset is run once per level, each on a new agent")
+    args = parser.parse_args()
+
+    data_set = load_data(args.data_path)
+    n_turns = sum(len(conversation.turns) for conversation in data_set)
+    print(f"🔍 {len(data_set)} conversations, {n_turns} turns")
+
+    timings, generated_responses, agent = asyncio.run(run_all(AsyncOpenAIAgent, data_set, args.concurrency))
+
+    save_directory = os.path.dirname(args.save_path)
+    if save_directory and not os.path.exists(save_directory):
+        os.makedirs(save_directory)
+    with open(args.save_path, 'w', encoding='utf-8') as f:
+        json.dump(generated_responses, f, indent=4, ensure_ascii=False)
+    print("✅ Responses saved to:", args.save_path)
+
+    base_time = timings[0][1]
+    for concurrency, elapsed in timings:
+        print(f"📈 concurrency {concurrency:>3}: {elapsed:.2f} s, {n_turns / elapsed:.2f} turns/s, speed-up x{base_time / elapsed:.2f}")
+    if getattr(agent, "deadline_stats", None):
+        print("⏳ Turn deadline:", dict(agent.deadline_stats))
+    if getattr(agent, "combined_stats", None):
+        print("🔀 Combined call:", dict(agent.combined_stats))
+    if getattr(agent, "speculative_stats", None):
+        print("⚡ Speculative response:", dict(agent.speculative_stats))
+    if getattr(agent, "stream_stats", None):
+        print("📶 Response latency:", agent.stream_stats.summary())
+    if getattr(agent, "resilience", None) is not None:
+        print("🛡️ LLM resilience:", agent.resilience.summary())
+
+    if any(turn.gold_functions for conversation in data_set for turn in conversation.turns):
+        aggregate = score_function_calls(data_set, load_predictions(generated_responses))['aggregate']
+        print(f"🎯 Function calls: Precision {aggregate['precision']:.2%}, Recall {aggregate['recall']:.2%}, F1 {aggregate['f1']:.2%}")
@@ -4,19 +4,20 @@ import numpy as np
 import copy
 import npcdataset.parsers
 from agents.user_config import UserAgent
-from function_calls import tool_map, action_map, Executor 
+from agents.name_index import NameIndex
+from agents.llm_cache import default_cache
+from function_calls import tool_map, action_map, ConversationExecutor, KnowledgeExecutor, KnowledgeIndex, harvest_facts, score_function_calls, load_predictions, ExecutionTracer
 import argparse 
 import time 
 from tqdm import tqdm 
 import os
-from evaluation_utils import extract_gold_functions, extract_predicted_functions
 
 def load_data(file_path):
     with open(file_path, "r", encoding='utf-8') as fp:
         data = json.load(fp)
     return npcdataset.parsers.parse_conversation_data(data, "test")
 
-def get_functions_and_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, executor) -> List[Dict[str, List]]:
+def get_functions_and_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, executor, npc_persona=None) -> List[Dict[str, List]]:
     dialogue = [
         {
             "speaker": msg.speaker,
@@ -29,7 +30,7 @@ def get_functions_and_responses(agent, cur_conv, cur_turn, tool_registry, action
         tool_registry, 
         action_registry, 
         cur_conv.worldview,
-        cur_conv.personas['npc'].to_dict(), 
+        npc_persona if npc_persona is not None else cur_conv.personas['npc'].to_dict(), 
         cur_conv.roles['npc'], 
         {"general_info": cur_conv.general_knowledge, "knowledge_info": cur_conv.knowledge},
         cur_conv.state, 
@@ -41,6 +42,16 @@ def get_functions_and_responses(agent, cur_conv, cur_turn, tool_registry, action
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--save_path', type=str, default='results/task1_responses.json')
+    parser.add_argument('--executor', type=str, default='gold', choices=['gold', 'knowledge'],
+                        help="'gold' answers function calls from gold data, 'knowledge' from the conversation knowledge")
+    parser.add_argument('--facts_from', nargs='*', default=[],
+                        help="datasets whose check_* gold functions provide prices, rewards, etc. for the knowledge executor; "
+                             "none by default, and never the evaluated dataset, whose gold functions hold the answers "
+                             "(the sample conversations also appear in the train files)")
+    parser.add_argument('--trace_path', type=str, default='',
+                        help="if set, trace how every function call is matched by the gold executor and save the traces as JSONL")
+    parser.add_argument('--resolve_names', action='store_true',
+                        help="let the gold executor map near-miss item and quest names to canonical names (see agents/name_index.py)")
     args = parser.parse_args()
 
     start_time = time.time() 
@@ -48,29 +59,43 @@ if __name__ == '__main__':
     data_set = load_data(data_path)
     agent = UserAgent() 
 
+    facts = {}
+    if args.executor == 'knowledge':
+        for facts_path in args.facts_from:
+            if os.path.abspath(facts_path) == os.path.abspath(data_path):
+                print(f"⚠️ Not harvesting facts from {facts_path}, the dataset being evaluated")
+                continue
+            facts.update(harvest_facts(load_data(facts_path)))
+
     save_directory = os.path.dirname(args.save_path)
     if not os.path.exists(save_directory):
         os.makedirs(save_directory)
 
+    tracer = ExecutionTracer() if args.trace_path else None
+
     generated_responses = []
     for conv_idx, conversation in tqdm(enumerate(data_set), total=len(data_set)):
         cur_conv_responses = {"data_id": conversation.id, "outputs": []}
         tool_registry = tool_map[conversation.function_list_id]
         action_registry = action_map[conversation.function_list_id]
+        knowledge_index = KnowledgeIndex.from_conversation(conversation, facts) if args.executor == 'knowledge' else None
+        npc_persona = conversation.personas['npc'].to_dict()
+        if tracer is not None:
+            tracer.context = {"data_id": conversation.id}
+        if knowledge_index is None:
+            # built from the conversation's knowledge and target items only, never from its gold parameters
+            name_index = NameIndex.from_conversation(conversation) if args.resolve_names else None
+            conv_exec = ConversationExecutor.from_conversation(conversation, tool_registry, action_registry, tracer=tracer,
+                                                               name_resolver=name_index.resolve if name_index else None)
         for turn_idx, turn in enumerate(conversation.turns):
-            gold_functions = [
-                {
-                    "name": function.name,
-                    "parameters": function.parameters,
-                    "return": function.return_values
-                }
-                for function in turn.gold_functions
-            ]
-            cur_turn_exec = Executor(tool_registry, action_registry, gold_functions)
-            response = get_functions_and_responses(agent, conversation, turn, tool_registry, action_registry, cur_turn_exec)
+            if knowledge_index is not None:
+                cur_turn_exec = KnowledgeExecutor(tool_registry, action_registry, knowledge_index)
+            else:
+                cur_turn_exec = conv_exec.turn_executor(turn_idx)
+            response = get_functions_and_responses(agent, conversation, turn, tool_registry, action_registry, cur_turn_exec, npc_persona)
             cur_conv_responses["outputs"].append({
                 "tool_calls": [
-                    {"function": {"name": f["name"]}} for f in cur_turn_exec.function_call_stats
+                    {"function": {"name": f["name"], "arguments": f.get("parameters", {})}} for f in cur_turn_exec.function_call_stats
                 ],
                 "response": response
             })
@@ -80,37 +105,31 @@ if __name__ == '__main__':
         json.dump(generated_responses, f, indent=4, ensure_ascii=False)
     print("✅ Responses saved to:", args.save_path)
     print("⏱️ Total time spent:", round(time.time() - start_time, 2), 'seconds')
+    if default_cache() is not None:
+        print("🗃️ LLM cache:", default_cache().stats())
+    if getattr(agent, "deadline_stats", None):
+        print("⏳ Turn deadline:", dict(agent.deadline_stats))
+    if getattr(agent, "combined_stats", None):
+        print("🔀 Combined call:", dict(agent.combined_stats))
+    if getattr(agent, "speculative_stats", None):
+        print("⚡ Speculative response:", dict(agent.speculative_stats))
+    if getattr(agent, "stream_stats", None):
+        print("📶 Response latency:", agent.stream_stats.summary())
+    if getattr(agent, "resilience", None) is not None:
+        print("🛡️ LLM resilience:", agent.resilience.summary())
 
-    # ✅ 정확도 평가
-    with open(data_path, "r", encoding="utf-8") as f:
-        sample_data = json.load(f)
-
-    with open(args.save_path, "r", encoding="utf-8") as f:
-        result_data = json.load(f)
-
-    gold = extract_gold_functions(sample_data)
-    pred = extract_predicted_functions(result_data)
-
-    total = 0
-    correct = 0
-    details = []
-
-    for conv_id, gold_list in gold.items():
-        pred_list = pred.get(conv_id, [])
-        gold_set = set(gold_list)
-        pred_set = set(pred_list)
-        match = gold_set & pred_set
-        total += len(gold_set)
-        correct += len(match)
-        details.append({
-            "id": conv_id,
-            "gold": list(gold_set),
-            "pred": list(pred_set),
-            "matched": list(match)
-        })
+    if tracer is not None:
+        tracer.export_jsonl(args.trace_path)
+        print("🧭 Match branches:", tracer.summary()['branches'])
+        print("✅ Traces saved to:", args.trace_path)
 
-    accuracy = correct / total if total > 0 else 0
+    # ✅ 정확도 평가 (Executor의 매칭 규칙으로 턴 단위 채점)
+    report = score_function_calls(data_set, load_predictions(generated_responses))
+    aggregate = report['aggregate']
 
-    print(f"🔍 총 Gold 함수 수: {total}")
-    print(f"✅ 맞춘 함수 수: {correct}")
-    print(f"🎯 정확도: {accuracy:.2%}")
+    for name, scores in report['functions'].items():
+        print(f"   {name:<24} gold {scores['gold']:>3}  pred {scores['predicted']:>3}  "
+              f"P {scores['precision']:.2%}  R {scores['recall']:.2%}  F1 {scores['f1']:.2%}")
+    print(f"🔍 총 Gold 함수 수: {aggregate['gold']}")
+    print(f"✅ 맞춘 함수 수: {aggregate['matched_gold']}")
+    print(f"🎯 Precision: {aggregate['precision']:.2%}, Recall: {aggregate['recall']:.2%}, F1: {aggregate['f1']:.2%}")
@@ -3,11 +3,14 @@ import json
 import numpy as np
 import npcdataset.parsers
 from agents.user_config import UserAgent
+from agents.llm_cache import default_cache
+from agents.resilience import default_resilience
 import argparse
 from tqdm import tqdm
 import os
 import time
-from function_calls import tool_map, action_map, Executor
+from function_calls import tool_map, action_map, ConversationExecutor
+from function_calls.metrics import set_word_f1
 from dotenv import load_dotenv
 import openai
 from bert_score import BERTScorer
@@ -47,27 +50,30 @@ Give a score from 1 to 5, where:
 
 Only return the score as a number. No explanation.
 """
+    request = dict(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.0
+    )
+    # 일시적 오류(429/5xx)는 재시도하고 (agents/resilience.py), 실패한 평가는 None으로 반환해 평균에서 제외
+    def send(**request):
+        return default_resilience("openai").call(lambda timeout: openai.chat.completions.create(**request))
+
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.0
-        )
+        # 동일한 평가 요청은 LLM_CACHE_PATH 캐시에서 응답 (agents/llm_cache.py)
+        cache = default_cache()
+        if cache is None:
+            response = send(**request)
+        else:
+            response = cache.create(send, **request)
         return int(response.choices[0].message.content.strip())
     except Exception as e:
         print("LLM 평가 오류:", e)
-        return -1
+        return None
 
-# Word F1 계산
+# Word F1 계산 (function_calls.metrics의 캐시된 토큰 집합 사용)
 def word_f1_score(gold: str, pred: str):
-    gold_tokens = set(gold.split())
-    pred_tokens = set(pred.split())
-    common = gold_tokens & pred_tokens
-    if not common:
-        return 0.0
-    precision = len(common) / len(pred_tokens) if pred_tokens else 0
-    recall = len(common) / len(gold_tokens) if gold_tokens else 0
-    return 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
+    return set_word_f1(pred, gold)
 
 # 전체 메트릭 계산
 def evaluate_metrics_all(gold, pred):
@@ -85,7 +91,7 @@ def load_data(file_path):
     return npcdataset.parsers.parse_conversation_data(data, "test")
 
 # 응답 생성
-def get_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, executor) -> List[Dict[str, str]]:
+def get_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, executor, npc_persona=None) -> List[Dict[str, str]]:
     dialogue = [
         {"speaker": msg.speaker, "text": msg.text, "target_item": msg.target_items}
         for msg in cur_turn.messages
@@ -94,7 +100,7 @@ def get_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, exe
         tool_registry,
         action_registry,
         cur_conv.worldview,
-        cur_conv.personas['npc'].to_dict(),
+        npc_persona if npc_persona is not None else cur_conv.personas['npc'].to_dict(),
         cur_conv.roles['npc'],
         {"general_info": cur_conv.general_knowledge, "knowledge_info": cur_conv.knowledge},
         cur_conv.state,
@@ -128,13 +134,13 @@ if __name__ == '__main__':
         tool_registry = tool_map[conversation.function_list_id]
         action_registry = action_map[conversation.function_list_id]
 
+        conv_exec = ConversationExecutor.from_conversation(conversation, tool_registry, action_registry)
+        npc_persona = conversation.personas['npc'].to_dict()
+
         for turn_idx, turn in tqdm(list(enumerate(conversation.turns)), desc=f"💬 Conversation {conv_idx}", leave=False):
             gold = turn.gold_response
-            executor = Executor(tool_registry, action_registry, [
-                {"name": fn.name, "parameters": fn.parameters, "return": fn.return_values}
-                for fn in turn.gold_functions
-            ])
-            generated = get_responses(agent, conversation, turn, tool_registry, action_registry, executor)
+            executor = conv_exec.turn_executor(turn_idx)
+            generated = get_responses(agent, conversation, turn, tool_registry, action_registry, executor, npc_persona)
 
             llm_score = evaluate_with_llm(gold, generated)
             word_f1, bleu, cpd, use = evaluate_metrics_all(gold, generated)
@@ -180,7 +186,8 @@ if __name__ == '__main__':
     print(f"\n✅ All results saved to: {args.save_path}")
 
     def avg(lst): return sum(lst) / len(lst) if lst else 0.0
-    print(f"\n📈 Average LLM Score: {avg(all_llm_scores):.3f}")
+    judged = [score for score in all_llm_scores if score is not None]
+    print(f"\n📈 Average LLM Score: {avg(judged):.3f} ({len(all_llm_scores) - len(judged)} failed evaluations excluded)")
     print(f"📘 Average BERTScore F1: {avg(all_bert_f1):.4f}")
     print(f"📝 Average Word F1: {avg(all_word_f1):.4f}")
     print(f"📘 Average BLEU: {avg(all_bleu):.4f}")
@@ -188,6 +195,9 @@ if __name__ == '__main__':
     print(f"🔗 Average USEScore: {avg(all_use):.4f}")
     print(f"➕ Sum of BLEU + BERTScore F1: {avg(all_bleu) + avg(all_bert_f1):.4f}")
     print("⏱️ Total time spent:", round(time.time() - start_time, 2), "seconds")
+    if default_cache() is not None:
+        print("🗃️ LLM cache:", default_cache().stats())
+    print("🛡️ LLM resilience:", default_resilience("openai").summary())
 
 
 
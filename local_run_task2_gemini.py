@@ -7,7 +7,7 @@ import argparse
 from tqdm import tqdm
 import os
 import time
-from function_calls import tool_map, action_map, Executor
+from function_calls import tool_map, action_map, ConversationExecutor
 # from dotenv import load_dotenv
 
 # load_dotenv()
@@ -20,7 +20,7 @@ def load_data(file_path):
 
     return npcdataset.parsers.parse_conversation_data(data, "test")
 
-def get_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, executor) -> List[Dict[str, str]]: 
+def get_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, executor, npc_persona=None) -> List[Dict[str, str]]: 
     """
         Parameters: 
             agent: UserAgent, the agent that the participants use to generate responses. 
@@ -28,6 +28,7 @@ def get_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, exe
             cur_turn: current turn, contains the conversation history up to this turn. 
             tool_registry, agent_registry: functions available for task 2. 
             executor: It can perform adequate function calls and return proper return values. 
+            npc_persona: the NPC persona as a dict, converted once per conversation by the caller (optional). 
         Returns: str, the response of the current turn. 
     """
     dialogue = [
@@ -42,7 +43,7 @@ def get_responses(agent, cur_conv, cur_turn, tool_registry, action_registry, exe
         tool_registry, 
         action_registry, 
         cur_conv.worldview,
-        cur_conv.personas['npc'].to_dict(), 
+        npc_persona if npc_persona is not None else cur_conv.personas['npc'].to_dict(), 
         cur_conv.roles['npc'], 
         {"general_info": cur_conv.general_knowledge, "knowledge_info": cur_conv.knowledge},
         cur_conv.state, 
@@ -74,17 +75,11 @@ if __name__ == '__main__':
         cur_conv_responses = {}
         tool_registry = tool_map[conversation.function_list_id]
         action_registry = action_map[conversation.function_list_id]
+        conv_exec = ConversationExecutor.from_conversation(conversation, tool_registry, action_registry)
+        npc_persona = conversation.personas['npc'].to_dict()
         for turn_idx, turn in enumerate(conversation.turns):
-            gold_functions = [
-                {
-                    "name": function.name,
-                    "parameters": function.parameters,
-                    'return': function.return_values
-                }
-                for function in turn.gold_functions
-            ]
-            cur_turn_exec = Executor(tool_registry, action_registry, gold_functions)
-            response = get_responses(agent, conversation, turn, tool_registry, action_registry, cur_turn_exec)
+            cur_turn_exec = conv_exec.turn_executor(turn_idx)
+            response = get_responses(agent, conversation, turn, tool_registry, action_registry, cur_turn_exec, npc_persona)
             cur_conv_responses[f"turn_{turn_idx}"] = response 
         generated_responses.append(cur_conv_responses)
 
@@ -92,3 +87,5 @@ if __name__ == '__main__':
         json.dump(generated_responses, f, indent=4)
     print("Responses saved to ", args.save_path)
     print("Total time spent: ", time.time() - start_time, ' seconds')
+    if getattr(agent, "rate_limiter", None) is not None:
+        print("Rate limiter: ", agent.rate_limiter.summary())
@@ -0,0 +1,282 @@
+# mock_openai_server.py
+
+"""
+A local stand-in for the OpenAI chat completions API, for benchmarking the agents offline.
+
+    python mock_openai_server.py --gold data/task1_sample.json data/task2_sample.json --latency lognormal:-1.2:0.4
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock python local_run_async.py --concurrency 1 8 32
+
+It serves `POST /v1/chat/completions` in the wire format used by `NewOpenAIAgent`: plain, tool-calling,
+JSON-mode and streamed (server-sent events) completions. Responses are deterministic. When the last user
+message of a request is an utterance of the `--gold` datasets, the server returns the gold function calls
+(restricted to the offered tools) for tool requests, the gold response otherwise, and both for JSON-mode
+requests; other requests get a canned reply chosen by a hash of the prompt.
+
+Latencies are drawn from `--latency` (plus `--token_latency` per streamed word), errors are injected
+with `--error_rate`/`--error_codes`, hung requests with `--hang_rate`, and `--rpm`/`--tpm` enforce
+sliding-window rate limits with 429 responses and `Retry-After` headers.
+`GET /stats` returns the request counters, which are also printed on exit.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from agents.rate_limiter import RateLimiter
+from agents.token_budget import estimate_tokens
+
+
+_CANNED_REPLIES = [
+    "Welcome, traveler. What can I do for you today?",
+    "Ah, a fine question. Let me think about that for a moment.",
+    "I'm afraid I don't know much about that. Is there anything else you need?",
+    "Of course. Take your time and look around.",
+    "That's a good choice. Many adventurers have asked about it.",
+]
+
+
+def parse_latency(spec):
+    """
+    Returns a function drawing latencies in seconds from a spec: a number (fixed), 'uniform:LOW:HIGH',
+    'normal:MEAN:STD' or 'lognormal:MU:SIGMA' (the log of the latency is normal). Negative draws are clamped to 0.
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        if not params:
+            value = float(kind)
+            return lambda rng: value
+        args = [float(p) for p in params.split(":")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid latency spec '{spec}'")
+    if kind == "uniform" and len(args) == 2:
+        return lambda rng: rng.uniform(*args)
+    if kind == "normal" and len(args) == 2:
+        return lambda rng: max(0.0, rng.gauss(*args))
+    if kind == "lognormal" and len(args) == 2:
+        return lambda rng: rng.lognormvariate(*args)
+    raise argparse.ArgumentTypeError(f"invalid latency spec '{spec}'")
+
+
+def load_gold(paths):
+    """Maps each player utterance of the datasets to its gold function calls and response (the first one wins)."""
+    gold = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+        for conv_data in data:
+            for key in sorted((k for k in conv_data if k.startswith("turn_")), key=lambda k: int(k.split("_")[1])):
+                turn_data = conv_data[key]
+                dialogue = turn_data.get("dialogue", [])
+                if not dialogue:
+                    continue
+                gold.setdefault(_normalize(dialogue[-1].get("text", "")), {
+                    "functions": [{"name": f["name"].strip(), "parameters": f.get("parameters", {})}
+                                  for f in turn_data.get("gold_functions", [])],
+                    "response": turn_data.get("gold_response", ""),
+                })
+    return gold
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, args):
+        super().__init__(address, MockHandler)
+        self.args = args
+        self.latency = args.latency
+        self.gold = load_gold(args.gold)
+        self.limiter = RateLimiter(args.rpm, args.tpm)
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    def draw(self, function):
+        with self.rng_lock:
+            return function(self.rng)
+
+    def count(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"}]})
+        elif self.path.rstrip("/") == "/stats":
+            with self.server.stats_lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "invalid_request_error", "Invalid JSON body")
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+            return
+
+        server = self.server
+        args = server.args
+        server.count("requests")
+        messages = body.get("messages") or []
+        prompt_tokens = sum(4 + estimate_tokens(str(m.get("content") or "")) for m in messages) + 3
+        if body.get("tools"):
+            prompt_tokens += estimate_tokens(json.dumps(body["tools"], ensure_ascii=False))
+
+        wait = server.limiter.try_acquire(prompt_tokens + int(body.get("max_tokens") or 0))
+        if wait:
+            server.count("rate_limited")
+            self._send_error(429, "rate_limit_exceeded", "Rate limit reached", {"Retry-After": f"{wait:.2f}"})
+            return
+
+        time.sleep(server.draw(server.latency))
+        roll = server.draw(lambda rng: rng.random())
+        if roll < args.hang_rate:
+            server.count("hung")
+            time.sleep(args.hang)
+        elif roll < args.hang_rate + args.error_rate:
+            code = server.draw(lambda rng: rng.choice(args.error_codes))
+            server.count(f"error_{code}")
+            self._send_error(code, "server_error" if code >= 500 else "rate_limit_exceeded", "Injected error",
+                             {"Retry-After": "0.5"} if code == 429 else None)
+            return
+
+        content, tool_calls = self._complete(body, messages)
+        server.count("streamed" if body.get("stream") else "completed")
+        if body.get("stream"):
+            self._send_stream(body, content, tool_calls)
+        else:
+            completion_tokens = estimate_tokens(content or "") + (estimate_tokens(json.dumps(tool_calls)) if tool_calls else 0)
+            message = {"role": "assistant", "content": content if not tool_calls else None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            self._send_json(200, {
+                "id": self._completion_id(body),
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+    def _complete(self, body, messages):
+        """Returns the content and the tool calls of the response to a request."""
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        gold = self.server.gold.get(_normalize(str(last_user)))
+        self.server.count("gold_hits" if gold else "gold_misses")
+        if gold is None:
+            digest = hashlib.blake2b(json.dumps(messages, sort_keys=True).encode("utf-8"), digest_size=8).digest()
+            gold = {"functions": [], "response": _CANNED_REPLIES[digest[0] % len(_CANNED_REPLIES)]}
+
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"function_calls": gold["functions"], "draft_response": gold["response"]}), None
+        tools = {tool["function"]["name"] for tool in body.get("tools") or [] if "function" in tool}
+        if tools and body.get("tool_choice") != "none":
+            calls = [f for f in gold["functions"] if f["name"] in tools]
+            return "", [
+                {"id": f"call_{i}", "type": "function",
+                 "function": {"name": f["name"], "arguments": json.dumps(f["parameters"], ensure_ascii=False)}}
+                for i, f in enumerate(calls)
+            ] or None
+        return gold["response"], None
+
+    def _send_stream(self, body, content, tool_calls):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        base = {"id": self._completion_id(body), "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "gpt-4o-mini")}
+
+        def chunk(delta, finish_reason=None):
+            data = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+            self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            chunk({"role": "assistant", "content": ""})
+            if tool_calls:
+                chunk({"tool_calls": [dict(call, index=i) for i, call in enumerate(tool_calls)]})
+            else:
+                words = (content or "").split(" ")
+                for i, word in enumerate(words):
+                    chunk({"content": word if i == len(words) - 1 else word + " "})
+                    if self.server.args.token_latency:
+                        time.sleep(self.server.args.token_latency)
+            chunk({}, "tool_calls" if tool_calls else "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client closed the stream early, e.g. after enough sentences
+            self.server.count("stream_closed_early")
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, kind, message, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": kind, "code": kind}}, headers)
+
+    def _completion_id(self, body):
+        return "chatcmpl-mock-" + hashlib.blake2b(json.dumps(body, sort_keys=True).encode("utf-8"), digest_size=6).hexdigest()
+
+    def log_message(self, format, *args):
+        if self.server.args.verbose:
+            super().log_message(format, *args)
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--gold', nargs='*', default=['data/task1_sample.json', 'data/task2_sample.json'],
+                        help="datasets whose gold function calls and responses are returned")
+    parser.add_argument('--latency', type=parse_latency, default=parse_latency("0.3"),
+                        help="seconds before the first byte: a number, uniform:LOW:HIGH, normal:MEAN:STD or lognormal:MU:SIGMA")
+    parser.add_argument('--token_latency', type=float, default=0.02, help="seconds between streamed words")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument('--error_codes', nargs='+', type=int, default=[429, 500, 503])
+    parser.add_argument('--hang_rate', type=float, default=0.0, help="fraction of requests delayed by --hang seconds")
+    parser.add_argument('--hang', type=float, default=30.0)
+    parser.add_argument('--rpm', type=int, default=0, help="requests per minute, 0 for no limit")
+    parser.add_argument('--tpm', type=int, default=0, help="tokens (prompt + max_tokens) per minute, 0 for no limit")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), args)
+    print(f"🧪 Mock OpenAI server on http://{args.host}:{args.port}/v1 with {len(server.gold)} gold utterances")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("📊 Requests:", dict(server.stats))
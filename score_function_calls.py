@@ -0,0 +1,54 @@
+# score_function_calls.py
+
+import argparse
+import json
+import os
+import time
+
+import npcdataset.parsers
+from function_calls import load_predictions, score_function_calls, sweep_thresholds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='data/task1_sample.json')
+    parser.add_argument('--results', type=str, default='results/task1_responses.json',
+                        help="responses saved by local_run_task1.py")
+    parser.add_argument('--threshold', type=float, default=0.4)
+    parser.add_argument('--sweep', nargs='*', type=float, default=None,
+                        help="also report search_* and overall F1 for these thresholds (default grid: 0.0 to 1.0 by 0.05)")
+    parser.add_argument('--save_path', type=str, default='', help="optionally save the full report as JSON")
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as fp:
+        data_set = npcdataset.parsers.parse_conversation_data(json.load(fp), "test")
+    with open(args.results, "r", encoding="utf-8") as fp:
+        predictions = load_predictions(json.load(fp))
+
+    start = time.perf_counter()
+    report = score_function_calls(data_set, predictions, args.threshold)
+    elapsed = time.perf_counter() - start
+
+    for name, scores in report['functions'].items():
+        print(f"   {name:<24} gold {scores['gold']:>3}  pred {scores['predicted']:>3}  "
+              f"P {scores['precision']:.2%}  R {scores['recall']:.2%}  F1 {scores['f1']:.2%}")
+    aggregate = report['aggregate']
+    print(f"🎯 Precision: {aggregate['precision']:.2%}, Recall: {aggregate['recall']:.2%}, F1: {aggregate['f1']:.2%}")
+    print(f"💬 Turn-averaged F1 over {aggregate['turns']} turns: {aggregate['turn_f1']:.2%}")
+    print(f"⚡ Scoring time: {elapsed * 1000:.1f} ms")
+
+    if args.sweep is not None:
+        curve = sweep_thresholds(data_set, predictions, args.sweep or None)
+        print("📈 Threshold sweep (search_* F1 / overall F1):")
+        for threshold, search_f1, overall_f1 in zip(curve['thresholds'], curve['search']['f1'], curve['overall']['f1']):
+            print(f"   {threshold:.2f}  {search_f1:.2%}  {overall_f1:.2%}")
+        print(f"🏁 Best threshold: {curve['best_threshold']}")
+        report['threshold_sweep'] = curve
+
+    if args.save_path:
+        save_directory = os.path.dirname(args.save_path)
+        if save_directory and not os.path.exists(save_directory):
+            os.makedirs(save_directory)
+        with open(args.save_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        print("✅ Report saved to:", args.save_path)
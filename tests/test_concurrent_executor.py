@@ -0,0 +1,114 @@
+import asyncio
+import threading
+
+from function_calls.concurrent_executor import ConcurrentExecutor
+
+
+GOLD = [{"name": "check_price", "parameters": {"item_name": "Long Sword"}, "return": [{"price": "300"}]}]
+
+
+def call(task, i):
+    return {"name": "check_price", "parameters": {"item_name": "Long Sword", "task": task, "i": i}}
+
+
+def logged(calls):
+    return [(c["parameters"]["task"], c["parameters"]["i"]) for c in calls]
+
+
+def run_threads(target, n):
+    threads = [threading.Thread(target=target, args=(t,)) for t in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_explicit_keys_keep_separate_logs_across_threads():
+    executor = ConcurrentExecutor({}, {}, GOLD)
+    returns = []
+
+    def work(task):
+        for i in range(50):
+            returns.append(executor.execute([call(task, i)], key=(task, 0))[0]["return"])
+        returns.append(executor.execute([GOLD[0]], key=(task, 1))[0]["return"])
+
+    run_threads(work, 8)
+    assert returns.count([{"price": "300"}]) == 8 and returns.count([{"information": "n/a"}]) == 400
+    for task in range(8):
+        assert logged(executor.calls((task, 0))) == [(task, i) for i in range(50)]
+    # merged in sorted key order
+    stats = executor.function_call_stats
+    assert [c["parameters"].get("task") for c in stats] == [t for task in range(8) for t in [task] * 50 + [None]]
+    assert logged(stats[:50]) == [(0, i) for i in range(50)]
+
+
+def test_each_thread_gets_its_own_implicit_log():
+    executor = ConcurrentExecutor({}, {}, GOLD)
+    started = threading.Barrier(4)
+
+    def work(task):
+        started.wait()
+        for i in range(20):
+            executor.execute([call(task, i)])
+
+    run_threads(work, 4)
+    stats = logged(executor.function_call_stats)
+    assert sorted(stats) == [(task, i) for task in range(4) for i in range(20)]
+    # each thread's calls are contiguous and in order
+    for start in range(0, 80, 20):
+        assert stats[start:start + 20] == [(stats[start][0], i) for i in range(20)]
+
+
+def test_asyncio_tasks_and_task_scopes_keep_separate_logs():
+    executor = ConcurrentExecutor({}, {}, GOLD)
+
+    async def implicit(task):
+        for i in range(10):
+            await executor.aexecute([call(task, i)])
+            await asyncio.sleep(0)
+
+    async def scoped(task):
+        with executor.task(("turn", task)):
+            for i in range(10):
+                await executor.aexecute([call(task, i)])
+                await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(*[implicit(t) for t in range(3)], *[scoped(t) for t in range(3, 6)])
+
+    asyncio.run(main())
+    for task in range(3, 6):
+        assert logged(executor.calls(("turn", task))) == [(task, i) for i in range(10)]
+    stats = logged(executor.function_call_stats)
+    # explicit keys first, then the implicit logs in creation order
+    assert stats[:30] == [(task, i) for task in range(3, 6) for i in range(10)]
+    assert stats[30:] == [(task, i) for task in range(3) for i in range(10)]
+
+
+def test_stats_can_be_read_while_other_threads_execute():
+    executor = ConcurrentExecutor({}, {}, GOLD)
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            try:
+                executor.function_call_stats
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    run_threads(lambda task: [executor.execute([call(task, i)], key=(task, i)) for i in range(200)], 4)
+    done.set()
+    thread.join()
+    assert errors == []
+    assert len(executor.function_call_stats) == 800
+
+
+def test_logged_calls_are_snapshots():
+    executor = ConcurrentExecutor({}, {}, GOLD)
+    item = call(0, 0)
+    executor.execute([item], key="turn")
+    item["parameters"]["i"] = 1
+    assert logged(executor.calls("turn")) == [(0, 0)]
@@ -0,0 +1,70 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from agents.deadline import Deadline, DeadlineExceeded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_timeouts_leave_the_reserve_and_the_margin():
+    clock = FakeClock()
+    deadline = Deadline(budget=7.0, margin=0.5, clock=clock)
+    assert deadline.remaining() == 6.5
+    assert deadline.timeout(reserve=2.5) == 4.0
+    assert deadline.timeout(reserve=2.5, cap=3.0) == 3.0
+    clock.now += 5.0
+    assert deadline.allows(1.0) and not deadline.allows(1.0, reserve=1.0)
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(reserve=1.5)
+    clock.now += 2.0
+    assert deadline.expired()
+
+
+def test_calls_are_counted_and_leave_the_reserve():
+    stats = Counter()
+    deadline = Deadline(max_calls=3, stats=stats)
+    assert deadline.take_call(reserve=1) and deadline.take_call(reserve=1)
+    assert not deadline.take_call(reserve=1)
+    assert deadline.calls == 2 and deadline.calls_left() == 1
+    assert deadline.take_call()
+    assert not deadline.take_call()
+    assert deadline.calls_left() == 0 and stats["calls_refused"] == 2
+
+
+def test_calls_are_counted_once_across_threads():
+    deadline = Deadline(max_calls=50)
+    taken = []
+    threads = [threading.Thread(target=lambda: taken.extend(deadline.take_call() for _ in range(20))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert taken.count(True) == 50 and deadline.calls == 50
+
+
+def test_stages_record_overruns_skips_and_timeouts():
+    clock = FakeClock()
+    stats = Counter()
+    deadline = Deadline(budget=7.0, margin=0.5, clock=clock, stats=stats)
+    with deadline.stage("select_functions", planned=2.0):
+        clock.now += 3.0
+    with deadline.stage("response"):
+        clock.now += 1.0
+    deadline.skip("second_call")
+    with pytest.raises(TimeoutError):
+        with deadline.stage("response"):
+            raise TimeoutError("read timed out")
+    assert stats == Counter({"turns": 1, "overrun_select_functions": 1, "skipped_second_call": 1, "timeout_response": 1})
+    summary = deadline.summary()
+    assert summary["elapsed"] == 4.0 and summary["remaining"] == 2.5
+    assert [(s["stage"], s["skipped"]) for s in summary["stages"]] == [
+        ("select_functions", False), ("response", False), ("second_call", True), ("response", False),
+    ]
@@ -0,0 +1,95 @@
+import random
+
+from agents.entity_binder import ITEM, QUEST, AhoCorasick, EntityBinder
+
+
+KNOWLEDGE = [
+    {"name": "Long Sword", "type": "Sword"},
+    {"name": "Sword", "type": "Sword"},
+    {"name": "Hunter's Bow", "type": "Bow"},
+    {"name": "The Lost Crown"},
+    {"name": "Avis Wind", "type": "Bow"},
+]
+
+
+def naive_matches(patterns, text):
+    """Every (start, end, value) occurrence, found by brute force."""
+    return sorted((i, i + len(pattern), value) for pattern, value in patterns
+                  for i in range(len(text) - len(pattern) + 1) if text.startswith(pattern, i))
+
+
+def test_automaton_reports_every_overlapping_occurrence():
+    patterns = [("he", "he"), ("she", "she"), ("his", "his"), ("hers", "hers"), ("s", "s")]
+    automaton = AhoCorasick()
+    for pattern, value in patterns:
+        automaton.add(pattern, value)
+    assert sorted(automaton.iter_matches("ushers")) == naive_matches(patterns, "ushers")
+
+
+def test_automaton_matches_brute_force_on_random_text():
+    rng = random.Random(0)
+    patterns = [("".join(rng.choice("ab") for _ in range(rng.randint(1, 4))), str(i)) for i in range(12)]
+    automaton = AhoCorasick()
+    for pattern, value in patterns:
+        automaton.add(pattern, value)
+    for _ in range(50):
+        text = "".join(rng.choice("abc") for _ in range(rng.randint(0, 30)))
+        assert sorted(automaton.iter_matches(text)) == naive_matches(patterns, text)
+
+
+def test_overlapping_names_keep_the_longest_match():
+    binder = EntityBinder.from_knowledge(KNOWLEDGE)
+    text = "Is the Long Sword better than a Sword?"
+    bindings = binder.find(text)
+    assert [b.name for b in bindings] == ["Long Sword", "Sword"]
+    assert [text[b.start:b.end] for b in bindings] == ["Long Sword", "Sword"]
+
+
+def test_matches_need_word_boundaries():
+    binder = EntityBinder(["Sword", "Avis Wind"])
+    assert binder.find("Swordsman and Broadsword") == []
+    assert [b.name for b in binder.find("(avis-wind), sword.")] == ["Avis Wind", "Sword"]
+
+
+def test_generated_and_given_aliases():
+    binder = EntityBinder.from_knowledge(KNOWLEDGE, aliases={"Avis Wind": ["the wind bow"]})
+    assert [b.name for b in binder.find("Hunters Bow or lost crown?")] == ["Hunter's Bow", "The Lost Crown"]
+    assert [b.name for b in binder.find("I want The Wind Bow")] == ["Avis Wind"]
+
+
+def test_kinds_come_from_the_knowledge_entries():
+    binder = EntityBinder.from_knowledge(KNOWLEDGE)
+    assert binder.kinds["Long Sword"] == ITEM
+    assert binder.kinds["The Lost Crown"] == QUEST
+    assert [b.kind for b in binder.find("Long Sword for the Lost Crown")] == [ITEM, QUEST]
+
+
+def test_bind_orders_utterance_target_items_then_history():
+    binder = EntityBinder.from_knowledge(KNOWLEDGE)
+    dialogue = [
+        {"speaker": "player", "text": "Tell me about the Avis Wind."},
+        {"speaker": "npc", "text": "A fine bow. The Long Sword is also here."},
+        {"speaker": "player", "text": "And the Sword?", "target_item": [{"name": "Hunter's Bow"}, {"name": "Sword"}]},
+    ]
+    bindings = binder.bind(dialogue)
+    assert [(b.name, b.source) for b in bindings] == [
+        ("Sword", "utterance"), ("Hunter's Bow", "target_item"), ("Long Sword", "history"), ("Avis Wind", "history"),
+    ]
+    assert binder.bind([]) == []
+
+
+def test_bind_arguments_respects_parameter_kinds():
+    binder = EntityBinder.from_knowledge(KNOWLEDGE)
+    dialogue = [{"text": "Does the Lost Crown reward a Long Sword or Avis Wind?"}]
+    assert binder.bind_arguments({"quest_name": {}}, dialogue) == {"quest_name": "The Lost Crown"}
+    assert binder.bind_arguments({"item_name": {}}, dialogue) == {"item_name": "Long Sword"}
+    assert binder.bind_arguments({"item_names": {}}, dialogue) == {"item_names": ["Long Sword", "Avis Wind"]}
+
+
+def test_bind_arguments_gives_up_on_unbindable_parameters():
+    binder = EntityBinder.from_knowledge(KNOWLEDGE)
+    assert binder.bind_arguments({"item_name": {}, "attribute": {}}, [{"text": "Long Sword"}]) is None
+    assert binder.bind_arguments({"quest_name": {}}, [{"text": "Long Sword"}]) is None
+    # names of the current turn only, unless the turn mentions none
+    dialogue = [{"text": "Avis Wind?"}, {"text": "Which one is cheaper?"}]
+    assert binder.bind_arguments({"item_names": {}}, dialogue) == {"item_names": ["Avis Wind"]}
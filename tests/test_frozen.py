@@ -0,0 +1,47 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from function_calls.executor import Executor
+from function_calls.frozen import FrozenDict, FrozenList, freeze
+
+
+GOLD = [{"name": "check_price", "parameters": {"item_name": "Long Sword"}, "return": [{"price": "300"}]}]
+
+
+def test_frozen_containers_behave_like_plain_ones_but_reject_mutation():
+    frozen = freeze({"a": [1, {"b": 2}], "c": (3, [4])})
+    assert frozen == {"a": [1, {"b": 2}], "c": (3, [4])}
+    assert json.dumps(frozen) == json.dumps({"a": [1, {"b": 2}], "c": [3, [4]]})
+    assert isinstance(frozen["a"], FrozenList) and isinstance(frozen["a"][1], FrozenDict)
+    for mutate in (lambda: frozen.update(x=1), lambda: frozen["a"].append(5), lambda: frozen["c"][1].pop(),
+                   lambda: frozen["a"][1].__setitem__("b", 3)):
+        with pytest.raises(TypeError):
+            mutate()
+    assert freeze(frozen) is frozen
+
+
+def test_copies_are_plain_and_mutable():
+    frozen = freeze({"a": [1, {"b": 2}]})
+    deep = copy.deepcopy(frozen)
+    assert type(deep) is dict and type(deep["a"]) is list and type(deep["a"][1]) is dict
+    deep["a"].append(3)
+    assert type(copy.copy(frozen)) is dict
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
+
+
+def test_execute_records_snapshots_and_shares_gold_returns():
+    executor = Executor({}, {}, GOLD)
+    call = {"name": "check_price", "parameters": {"item_name": "Long Sword"}}
+    first, = executor.execute([call])
+    second, = executor.execute([call])
+    call["parameters"]["item_name"] = "Short Sword"
+    assert [c["parameters"]["item_name"] for c in executor.function_call_stats] == ["Long Sword", "Long Sword"]
+    assert first["return"] == [{"price": "300"}] and first["return"] is second["return"]
+    with pytest.raises(TypeError):
+        first["return"][0]["price"] = "0"
+    # the result dict itself belongs to the caller
+    first["return"] = []
+    assert second["return"] == [{"price": "300"}]
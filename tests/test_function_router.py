@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from agents.function_router import DEFAULT_ROUTER_PATH, FunctionRouter, load_router_examples
+
+
+DIALOGUES = [
+    [{"speaker": "player", "text": "How much is the Long Sword?"}],
+    [{"speaker": "npc", "text": "Would you like to buy it?"}, {"speaker": "player", "text": "Yes, please."}],
+    [{"speaker": "player", "text": "What does this quest reward?", "target_item": [{"name": "The Lost Crown"}]}],
+    [],
+]
+
+
+@pytest.fixture(scope="module")
+def router():
+    examples = load_router_examples("data/task1_sample.json") + load_router_examples("data/task2_sample.json")
+    return FunctionRouter.train(examples, n_features=2 ** 10, epochs=50)
+
+
+def assert_same_predictions(router, loaded, dialogues):
+    for dialogue in dialogues:
+        expected, actual = router.predict(dialogue), loaded.predict(dialogue)
+        assert actual.names == expected.names
+        assert actual.confidence == expected.confidence
+        assert actual.scores == expected.scores
+
+
+def test_save_and_load_round_trip(router, tmp_path):
+    path = str(tmp_path / "router.npz")
+    router.save(path)
+    loaded = FunctionRouter.load(path)
+    assert loaded.labels == router.labels and loaded.n_features == router.n_features
+    assert np.array_equal(loaded.weights, router.weights) and np.array_equal(loaded.bias, router.bias)
+    examples = load_router_examples("data/task1_sample.json")
+    assert_same_predictions(router, loaded, DIALOGUES + [dialogue for dialogue, _ in examples])
+
+
+def test_training_is_deterministic(router):
+    examples = load_router_examples("data/task1_sample.json") + load_router_examples("data/task2_sample.json")
+    again = FunctionRouter.train(examples, n_features=2 ** 10, epochs=50)
+    assert again.labels == router.labels
+    assert np.array_equal(again.weights, router.weights)
+
+
+def test_labels_are_stripped_and_allowed_names_restrict_predictions(router):
+    assert all(label == label.strip() for label in router.labels)
+    dialogue = DIALOGUES[0]
+    allowed = router.labels[:2]
+    prediction = router.predict(dialogue, allowed_names=allowed + ["unknown_function"], threshold=0.0)
+    assert prediction.names == allowed and set(prediction.scores) == set(allowed)
+    assert router.predict(dialogue, allowed_names=[]).names == []
+    assert router.predict(dialogue, allowed_names=[]).confidence == 1.0
+
+
+def test_committed_router_loads_and_predicts():
+    router = FunctionRouter.load(DEFAULT_ROUTER_PATH)
+    assert router.weights.shape == (router.n_features, len(router.labels))
+    for dialogue in DIALOGUES:
+        prediction = router.predict(dialogue)
+        assert set(prediction.names) <= set(router.labels)
+        assert 0.0 <= prediction.confidence <= 1.0
+        assert all(0.0 <= p <= 1.0 for p in prediction.scores.values())
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from function_calls.executor import Executor, GoldIndex
+
+
+def load_turns(*paths):
+    """The gold functions of every turn of the datasets."""
+    turns = []
+    for path in paths:
+        with open(path, encoding="utf-8") as fp:
+            for conversation in json.load(fp):
+                turns.extend(turn["gold_functions"] for key, turn in conversation.items()
+                             if key.startswith("turn_") and turn.get("gold_functions"))
+    return turns
+
+
+@pytest.fixture(scope="module")
+def turns():
+    return load_turns("data/task1_sample.json", "data/task2_sample.json", "data/task1_train.json")
+
+
+def perturbations(function):
+    """The gold call itself and variants with whitespace, case, type and key changes."""
+    name, parameters = function["name"], function["parameters"]
+    yield {"name": name, "parameters": dict(parameters)}
+    yield {"name": name + " ", "parameters": dict(parameters)}
+    yield {"name": name, "parameters": {k: v.upper() if isinstance(v, str) else v for k, v in parameters.items()}}
+    for key, value in parameters.items():
+        if isinstance(value, str):
+            yield {"name": name, "parameters": dict(parameters, **{key: value + " "})}
+            yield {"name": name, "parameters": dict(parameters, **{key: " " + value.replace(" ", "  ")})}
+            yield {"name": name, "parameters": dict(parameters, **{key: ""})}
+            digits = value.replace(",", "").split(" ")[0]
+            if digits.isdigit():
+                yield {"name": name, "parameters": dict(parameters, **{key: int(digits)})}
+        yield {"name": name, "parameters": dict(parameters, **{key: None})}
+        yield {"name": name, "parameters": dict(parameters, **{key: [value]})}
+        yield {"name": name, "parameters": {k: v for k, v in parameters.items() if k != key}}
+    yield {"name": name, "parameters": dict(parameters, extra="value")}
+
+
+def outcome(match, func_item):
+    try:
+        return match(func_item)
+    except Exception as e:
+        return type(e).__name__
+
+
+def assert_same_matches(gold_functions, calls):
+    executor = Executor({}, {}, gold_functions)
+    index = GoldIndex(gold_functions)
+    for func_item in calls:
+        expected = outcome(executor.scan_gold, func_item)
+        assert outcome(lambda f: index.match(f, executor.threshold), func_item) == expected, func_item
+        assert outcome(executor.check_exact_match_gold, func_item) == expected, func_item
+
+
+def test_index_matches_scan_for_gold_and_perturbed_calls(turns):
+    for gold_functions in turns:
+        calls = [call for function in gold_functions for call in perturbations(function)]
+        assert_same_matches(gold_functions, calls)
+
+
+def test_index_matches_scan_when_gold_values_are_not_strings(turns):
+    # a non-string gold value disables the hash index of check_* functions
+    for gold_functions in turns[:200]:
+        perturbed = [dict(f, parameters={k: (len(v) if isinstance(v, str) and i == 0 else v)
+                                         for i, (k, v) in enumerate(f["parameters"].items())})
+                     for f in gold_functions]
+        calls = [call for function in gold_functions + perturbed for call in perturbations(function)]
+        assert_same_matches(perturbed, calls)
+
+
+def test_first_of_duplicate_gold_functions_wins():
+    gold = {"name": "check_price", "parameters": {"item_name": "Long Sword"}, "return": [{"price": "300"}]}
+    other = {"name": "check_price", "parameters": {"item_name": "long sword"}, "return": [{"price": "999"}]}
+    index = GoldIndex([gold, other])
+    assert index.match({"name": "check_price", "parameters": {"item_name": "LONG SWORD"}}) == 0
+    assert index.returns[0] == [{"price": "300"}]
+
+
+def test_unknown_and_action_functions_do_not_match():
+    index = GoldIndex([{"name": "buy_item", "parameters": {"item_name": "Long Sword"}, "return": []}])
+    assert index.match({"name": "buy_item", "parameters": {"item_name": "Long Sword"}}) == -1
+    assert index.match({"name": "check_price", "parameters": {"item_name": "Long Sword"}}) == -1
+
+
+def test_name_resolver_only_retries_check_calls_that_miss():
+    gold = [{"name": "check_price", "parameters": {"item_name": "Avis Wind"}, "return": [{"price": "500"}]}]
+    index = GoldIndex(gold)
+    resolver = {"avis-wind": "Avis Wind"}.get
+    assert index.match({"name": "check_price", "parameters": {"item_name": "avis-wind"}}) == -1
+    assert index.match({"name": "check_price", "parameters": {"item_name": "avis-wind"}}, name_resolver=resolver) == 0
+    explanation = index.explain({"name": "check_price", "parameters": {"item_name": "avis-wind"}}, name_resolver=resolver)
+    assert explanation["branch"] == "matched" and explanation["resolved"]
@@ -0,0 +1,119 @@
+import pytest
+from openai.types.chat import ChatCompletion
+
+from agents.llm_cache import CacheMiss, LLMCache
+
+
+REQUEST = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Hello"}], "temperature": 0}
+
+
+def completion(content):
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    })
+
+
+class FakeCreate:
+    def __init__(self, content="Welcome!"):
+        self.content = content
+        self.requests = []
+
+    def __call__(self, **request):
+        self.requests.append(request)
+        return completion(self.content)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache" / "llm.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_key_ignores_transport_fields_and_key_order(cache):
+    reordered = {"temperature": 0, "messages": REQUEST["messages"], "model": "gpt-4o-mini"}
+    assert cache.key(reordered) == cache.key(REQUEST)
+    assert cache.key(dict(REQUEST, stream=True, timeout=3.0, user=None)) == cache.key(REQUEST)
+    assert cache.key(dict(REQUEST, max_tokens=10)) != cache.key(REQUEST)
+
+
+def test_sampled_requests_are_keyed_by_seed(tmp_path, cache):
+    sampled = dict(REQUEST, temperature=0.7)
+    other_seed = LLMCache(str(tmp_path / "other.sqlite"), seed=1)
+    try:
+        assert other_seed.key(sampled) != cache.key(sampled)
+        assert other_seed.key(REQUEST) == cache.key(REQUEST)
+    finally:
+        other_seed.close()
+
+
+def test_create_calls_once_and_then_answers_from_the_cache(cache):
+    create = FakeCreate()
+    first = cache.create(create, **REQUEST)
+    second = cache.create(create, **REQUEST)
+    assert len(create.requests) == 1
+    assert second.choices[0].message.content == first.choices[0].message.content == "Welcome!"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_streaming_requests_are_not_cached(cache):
+    create = FakeCreate()
+    cache.create(create, **REQUEST, stream=True)
+    cache.create(create, **REQUEST, stream=True)
+    assert len(create.requests) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_text_caches_other_clients(cache):
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "Greetings."
+
+    request = {"model": "gemini-1.5-flash", "prompt": "Hi"}
+    assert cache.text(request, generate) == "Greetings."
+    assert cache.text(request, generate) == "Greetings."
+    assert len(calls) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"), max_entries=3)
+    try:
+        for key in "abc":
+            cache.put(key, key)
+        assert cache.get("a") == "a"
+        cache.put("d", "d")
+        # the two least recently used entries go in one batch
+        assert [cache.get(key) for key in "abcd"] == ["a", None, None, "d"]
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["evictions"] == 2
+    finally:
+        cache.close()
+
+
+def test_responses_persist_and_replay_mode_is_read_only(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    cache = LLMCache(path)
+    cache.create(FakeCreate("Stored."), **REQUEST)
+    cache.close()
+
+    replay = LLMCache(path, mode="replay")
+    try:
+        create = FakeCreate()
+        assert replay.create(create, **REQUEST).choices[0].message.content == "Stored."
+        assert create.requests == []
+        with pytest.raises(CacheMiss):
+            replay.create(create, **dict(REQUEST, max_tokens=5))
+        assert create.requests == []
+        replay.put("new", "ignored")
+        assert replay.get("new") is None
+    finally:
+        replay.close()
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LLMCache(str(tmp_path / "llm.sqlite"), mode="write")
@@ -0,0 +1,113 @@
+import json
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from function_calls.metrics import TokenVocabulary, batch_word_f1, set_word_f1, split_words, word_f1
+
+
+def reference_word_f1(pred_item, gold_item):
+    """The original per-pair word F1 of the Executor."""
+    if pred_item is None or gold_item is None:
+        return 0
+    p_tokens = re.split(r'[ |]+', pred_item.lower())
+    g_tokens = re.split(r'[ |]+', gold_item.lower())
+    num_same = sum((Counter(g_tokens) & Counter(p_tokens)).values())
+    if num_same == 0:
+        return 0
+    precision = 1.0 * num_same / len(p_tokens)
+    recall = 1.0 * num_same / len(g_tokens)
+    return (2 * precision * recall) / (precision + recall)
+
+
+def reference_set_word_f1(gold, pred):
+    """The original response word F1 of local_run_task2.py."""
+    gold_tokens = set(gold.split())
+    pred_tokens = set(pred.split())
+    common = gold_tokens & pred_tokens
+    if not common:
+        return 0.0
+    precision = len(common) / len(pred_tokens) if pred_tokens else 0
+    recall = len(common) / len(gold_tokens) if gold_tokens else 0
+    return 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
+
+
+EDGE_PAIRS = [
+    ("", ""),
+    ("", "price 100"),
+    ("Long Sword", "long sword"),
+    ("a a a b", "a b b"),
+    ("item_name|Long Sword", "item_name Long  Sword"),
+    ("  leading and trailing  ", "leading trailing"),
+    ("Price: 300 Gold.", "price: 300 gold"),
+    ("완전히 다른 문장", "완전히 같은 문장"),
+]
+
+
+@pytest.fixture(scope="module")
+def response_pairs():
+    """Pairs of gold responses of the sample conversations, each with the next one."""
+    responses = []
+    for path in ("data/task1_sample.json", "data/task2_sample.json"):
+        with open(path, encoding="utf-8") as fp:
+            for conversation in json.load(fp):
+                responses.extend(turn["gold_response"] for key, turn in conversation.items() if key.startswith("turn_"))
+    return list(zip(responses, responses[1:] + responses[:1])) + [(r, r) for r in responses[:5]]
+
+
+def test_word_f1_matches_the_reference(response_pairs):
+    for pred, gold in response_pairs + EDGE_PAIRS:
+        assert word_f1(pred, gold) == reference_word_f1(pred, gold)
+    assert word_f1(None, "x") == 0
+
+
+def test_set_word_f1_matches_the_reference(response_pairs):
+    for pred, gold in response_pairs + EDGE_PAIRS:
+        assert set_word_f1(pred, gold) == reference_set_word_f1(gold, pred)
+
+
+def test_batch_word_f1_matches_the_scalar_functions(response_pairs):
+    pairs = response_pairs + EDGE_PAIRS + [(None, "gold"), ("pred", None)]
+    preds, golds = [p for p, _ in pairs], [g for _, g in pairs]
+    _, _, f1 = batch_word_f1(preds, golds)
+    assert f1.tolist() == [reference_word_f1(p, g) for p, g in pairs]
+    precision, recall, f1 = batch_word_f1(preds[:-2], golds[:-2], unique=True)
+    assert f1.tolist() == [reference_set_word_f1(g, p) for p, g in pairs[:-2]]
+    assert np.all((precision >= 0) & (precision <= 1)) and np.all((recall >= 0) & (recall <= 1))
+
+
+def test_batch_word_f1_of_nothing_and_of_mismatched_lengths():
+    assert [a.tolist() for a in batch_word_f1([], [])] == [[], [], []]
+    with pytest.raises(ValueError):
+        batch_word_f1(["a"], [])
+
+
+def test_small_vocabulary_resets_between_calls_without_changing_scores(response_pairs):
+    vocabulary = TokenVocabulary(split_words, cache_size=4, max_tokens=5)
+    preds, golds = [p for p, _ in response_pairs], [g for _, g in response_pairs]
+    for start in range(0, len(preds), 3):
+        _, _, f1 = batch_word_f1(preds[start:start + 3], golds[start:start + 3], vocabulary=vocabulary)
+        assert f1.tolist() == [reference_word_f1(p, g) for p, g in zip(preds[start:start + 3], golds[start:start + 3])]
+    assert vocabulary.resets > 0
+
+
+def test_shared_vocabulary_is_thread_safe(response_pairs):
+    vocabulary = TokenVocabulary(split_words, cache_size=8, max_tokens=20)
+    expected = [reference_word_f1(p, g) for p, g in response_pairs]
+    errors = []
+
+    def score():
+        for _ in range(5):
+            _, _, f1 = batch_word_f1([p for p, _ in response_pairs], [g for _, g in response_pairs], vocabulary=vocabulary)
+            if f1.tolist() != expected:
+                errors.append(f1)
+
+    threads = [threading.Thread(target=score) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
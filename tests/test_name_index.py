@@ -0,0 +1,57 @@
+from agents.name_index import NameIndex
+
+
+NAMES = ["Avis Wind", "Long Sword", "Short Sword", "Long Bow", "Hunter's Bow", "Battle Axe", "Rose Battle Whip"]
+
+
+def make_index():
+    return NameIndex(NAMES)
+
+
+def test_normalized_exact_matches_resolve():
+    index = make_index()
+    assert index.resolve("Avis-Wind") == "Avis Wind"
+    assert index.resolve("Hunter's  BOW") == "Hunter's Bow"
+    assert "long sword" in index
+
+
+def test_clear_near_misses_resolve():
+    index = make_index()
+    assert index.resolve("Long Swrd") == "Long Sword"
+    assert index.resolve("Longsword") == "Long Sword"
+    assert index.resolve("avis wind sword") == "Avis Wind"
+    assert index.resolve("Battle Ax") == "Battle Axe"
+    assert index.resolve("hunters bow") == "Hunter's Bow"
+
+
+def test_substring_shared_by_several_names_is_not_resolved():
+    index = make_index()
+    # "Long Sword" leads "Short Sword" by less than the margin
+    assert [name for name, _ in index.search("Sword", limit=2)] == ["Long Sword", "Short Sword"]
+    assert index.resolve("Sword") is None
+
+
+def test_ambiguous_prefix_is_not_resolved():
+    index = make_index()
+    assert [name for name, _ in index.search("Long", limit=2)] == ["Long Bow", "Long Sword"]
+    assert index.resolve("Long") is None
+
+
+def test_short_queries_are_not_resolved():
+    index = NameIndex(["Axe of Dawn"], min_score=0.0)
+    assert index.resolve("Axe") is None
+    assert NameIndex(["Axe"]).resolve("axe") == "Axe"
+
+
+def test_canonicalize_parameters_keeps_unresolved_values():
+    index = make_index()
+    parameters = {"item_name": "Sword", "item_names": ["Long Swrd", "Long"], "quest_name": None, "attribute": "price"}
+    assert index.canonicalize_parameters(parameters) == {
+        "item_name": "Sword", "item_names": ["Long Sword", "Long"], "quest_name": None, "attribute": "price",
+    }
+    assert parameters["item_names"] == ["Long Swrd", "Long"]
+
+
+def test_from_knowledge_ignores_duplicates_and_non_strings():
+    index = NameIndex.from_knowledge([{"name": "Long Bow"}, {"name": "long-bow"}, {"name": None}, {}])
+    assert index.names == ["Long Bow"]
@@ -0,0 +1,118 @@
+from agents.rate_limiter import RateLimiter, shared_rate_limiter
+
+
+class FakeClock:
+    """A clock that only moves when the limiter sleeps or a test advances it."""
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(rpm=0, tpm=0):
+    clock = FakeClock()
+    return RateLimiter(rpm, tpm, window=60.0, clock=clock, sleep=clock.sleep), clock
+
+
+def test_requests_within_quota_are_admitted_immediately():
+    limiter, clock = make_limiter(rpm=3)
+    assert [limiter.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert limiter.summary()["window_requests"] == 3
+    assert clock.slept == []
+
+
+def test_request_over_rpm_waits_for_the_oldest_call_to_expire():
+    limiter, clock = make_limiter(rpm=2)
+    limiter.try_acquire()
+    clock.now = 10.0
+    limiter.try_acquire()
+    clock.now = 20.0
+    assert limiter.try_acquire() == 40.0
+    # the rejected call is not counted in the window
+    assert limiter.summary()["window_requests"] == 2
+
+
+def test_window_expiry_frees_requests_and_tokens():
+    limiter, clock = make_limiter(rpm=2, tpm=100)
+    limiter.try_acquire(40)
+    limiter.try_acquire(40)
+    assert limiter.delay(10) == 60.0
+    clock.now = 60.0
+    assert limiter.delay(10) == 0
+    summary = limiter.summary()
+    assert summary["window_requests"] == 0
+    assert summary["window_tokens"] == 0
+
+
+def test_tpm_delay_waits_until_enough_tokens_leave_the_window():
+    limiter, clock = make_limiter(tpm=100)
+    for start in (0.0, 10.0, 20.0):
+        clock.now = start
+        limiter.try_acquire(30)
+    clock.now = 30.0
+    # 90 + 50 tokens exceed the quota by 40: the calls at 0 and 10 must leave the window
+    assert limiter.delay(50) == 40.0
+    # 90 + 20 tokens exceed it by 10: the call at 0 is enough
+    assert limiter.delay(20) == 30.0
+    assert limiter.delay(10) == 0
+
+
+def test_call_larger_than_tpm_is_admitted_into_an_empty_window():
+    limiter, clock = make_limiter(tpm=100)
+    assert limiter.try_acquire(150) == 0
+    clock.now = 5.0
+    assert limiter.try_acquire(10) == 55.0
+
+
+def test_acquire_sleeps_until_the_call_fits():
+    limiter, clock = make_limiter(rpm=1)
+    limiter.try_acquire()
+    assert limiter.acquire() is True
+    assert clock.slept == [60.0]
+    assert limiter.stats["waited"] == 1
+    assert limiter.stats["wait_seconds"] == 60.0
+
+
+def test_strict_acquire_rejects_a_wait_beyond_max_wait_without_sleeping():
+    limiter, clock = make_limiter(rpm=1)
+    limiter.try_acquire()
+    assert limiter.acquire(max_wait=5.0) is False
+    assert clock.slept == []
+    assert limiter.stats["rejected"] == 1
+    assert limiter.summary()["window_requests"] == 1
+
+
+def test_non_strict_acquire_admits_over_quota_after_max_wait():
+    limiter, clock = make_limiter(rpm=1)
+    limiter.try_acquire()
+    assert limiter.acquire(max_wait=5.0, strict=False) is False
+    assert clock.slept == [5.0]
+    assert limiter.stats["over_quota"] == 1
+    assert limiter.stats["wait_seconds"] == 5.0
+    assert limiter.summary()["window_requests"] == 2
+
+
+def test_non_strict_acquire_with_no_time_left_admits_without_sleeping():
+    limiter, clock = make_limiter(rpm=1)
+    limiter.try_acquire()
+    assert limiter.acquire(max_wait=0.0, strict=False) is False
+    assert clock.slept == []
+    assert limiter.stats["over_quota"] == 1
+
+
+def test_zero_quotas_disable_the_limits():
+    limiter, _ = make_limiter()
+    assert all(limiter.try_acquire(10 ** 6) == 0 for _ in range(1000))
+
+
+def test_shared_rate_limiter_is_shared_by_name():
+    limiter = shared_rate_limiter("test-shared-model", rpm=5)
+    assert shared_rate_limiter("test-shared-model", rpm=99) is limiter
+    assert limiter.rpm == 5
+    assert shared_rate_limiter("test-other-model") is not limiter
@@ -0,0 +1,238 @@
+import asyncio
+
+import pytest
+
+from agents.deadline import CallLimitExceeded, Deadline, DeadlineExceeded
+from agents.resilience import FATAL, RATE_LIMIT, TIMEOUT, TRANSIENT, CircuitBreaker, CircuitOpen, Resilience, classify_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse({"retry-after": retry_after} if retry_after is not None else {})
+
+
+class Flaky:
+    """Raises the given errors in turn, then returns 'ok'."""
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def make_resilience(clock, max_attempts=3, failure_threshold=5, **kwargs):
+    breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=30.0, clock=clock)
+    return Resilience(max_attempts=max_attempts, base_delay=0.25, max_delay=4.0, min_attempt_time=1.0,
+                      breaker=breaker, clock=clock, sleep=clock.sleep, rng=lambda: 1.0, **kwargs)
+
+
+def test_classify_error():
+    assert classify_error(StatusError(429)) == RATE_LIMIT
+    assert classify_error(StatusError(503)) == TRANSIENT
+    assert classify_error(StatusError(408)) == TRANSIENT
+    assert classify_error(StatusError(400)) == FATAL
+    assert classify_error(TimeoutError()) == TIMEOUT
+    assert classify_error(ConnectionError()) == TRANSIENT
+    assert classify_error(DeadlineExceeded()) == FATAL
+    assert classify_error(CallLimitExceeded()) == FATAL
+    assert classify_error(CircuitOpen()) == FATAL
+    assert classify_error(ValueError()) == FATAL
+
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.opens == 1
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+
+
+def test_breaker_lets_one_trial_through_when_half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 30.0
+    assert breaker.state == 'half_open'
+    breaker.check()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.check()
+
+
+def test_failed_trial_reopens_the_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 30.0
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.opens == 2
+    clock.now = 59.0
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+
+
+def test_released_trial_lets_another_trial_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 30.0
+    breaker.check()
+    breaker.release()
+    breaker.check()
+    assert breaker.state == 'half_open'
+
+
+def test_retryable_errors_are_retried_with_exponential_backoff():
+    clock = FakeClock()
+    resilience = make_resilience(clock)
+    attempt = Flaky(StatusError(500), StatusError(503))
+    assert resilience.call(attempt) == "ok"
+    assert clock.slept == [0.25, 0.5]
+    assert resilience.stats["retries"] == 2
+    assert resilience.stats["successes"] == 1
+    assert resilience.breaker.failures == 0
+
+
+def test_retry_after_is_honored_up_to_max_delay():
+    clock = FakeClock()
+    resilience = make_resilience(clock)
+    assert resilience.call(Flaky(StatusError(429, "1.5"), StatusError(429, "60"))) == "ok"
+    assert clock.slept == [1.5, 4.0]
+
+
+def test_fatal_errors_are_not_retried():
+    clock = FakeClock()
+    resilience = make_resilience(clock)
+    with pytest.raises(StatusError):
+        resilience.call(Flaky(StatusError(400)))
+    assert resilience.stats["attempts"] == 1
+    assert resilience.stats["error_fatal"] == 1
+    assert clock.slept == []
+
+
+def test_gives_up_after_max_attempts():
+    clock = FakeClock()
+    resilience = make_resilience(clock, max_attempts=2)
+    with pytest.raises(StatusError):
+        resilience.call(Flaky(StatusError(500), StatusError(500), StatusError(500)))
+    assert resilience.stats["attempts"] == 2
+    assert resilience.stats["gave_up"] == 1
+
+
+
+def test_at_least_one_attempt_is_required():
+    for max_attempts in (0, -1):
+        with pytest.raises(ValueError):
+            Resilience(max_attempts=max_attempts)
+    assert make_resilience(FakeClock(), max_attempts=1).call(lambda left: "ok") == "ok"
+
+
+def test_retries_stay_within_the_timeout():
+    clock = FakeClock()
+    resilience = make_resilience(clock)
+    attempt = Flaky(StatusError(500), StatusError(500))
+    # the first backoff leaves 1.25s, the second would leave 0.75s, less than min_attempt_time
+    with pytest.raises(StatusError):
+        resilience.call(attempt, timeout=1.5)
+    assert attempt.timeouts == [1.5, 1.25]
+    assert resilience.stats["gave_up"] == 1
+
+
+def test_open_circuit_short_circuits_calls():
+    clock = FakeClock()
+    resilience = make_resilience(clock, max_attempts=1, failure_threshold=2)
+    for _ in range(2):
+        with pytest.raises(StatusError):
+            resilience.call(Flaky(StatusError(500)))
+    attempt = Flaky()
+    with pytest.raises(CircuitOpen):
+        resilience.call(attempt)
+    assert attempt.timeouts == []
+    assert resilience.summary()["circuit"] == 'open'
+    assert resilience.stats["short_circuited"] == 1
+
+
+def test_retries_draw_from_the_calls_of_the_turn():
+    clock = FakeClock()
+    resilience = make_resilience(clock)
+    deadline = Deadline(clock=clock, max_calls=2)
+    # the first stage keeps one call for the second, so it is not retried
+    first = Flaky(StatusError(500))
+    with pytest.raises(StatusError):
+        resilience.call(first, deadline=deadline, reserve_calls=1)
+    assert len(first.timeouts) == 1
+    assert resilience.stats["call_limit"] == 1
+    # the second stage gets the last call, and no retry
+    second = Flaky(StatusError(500))
+    with pytest.raises(StatusError):
+        resilience.call(second, deadline=deadline)
+    assert len(second.timeouts) == 1
+    assert deadline.calls == 2
+    # a third call is refused before it is made
+    third = Flaky()
+    with pytest.raises(CallLimitExceeded):
+        resilience.call(third, deadline=deadline)
+    assert third.timeouts == []
+    assert deadline.stats["calls_refused"] == 3
+
+
+def test_retry_is_made_when_the_turn_has_calls_left():
+    clock = FakeClock()
+    resilience = make_resilience(clock)
+    deadline = Deadline(clock=clock, max_calls=3)
+    assert resilience.call(Flaky(StatusError(500)), deadline=deadline, reserve_calls=1) == "ok"
+    assert deadline.calls == 2
+    assert deadline.calls_left() == 1
+
+
+def test_acall_retries_and_draws_from_the_calls_of_the_turn():
+    clock = FakeClock()
+    resilience = make_resilience(clock)
+    resilience.rng = lambda: 0.0
+    deadline = Deadline(clock=clock, max_calls=2)
+    errors = [StatusError(500), StatusError(500), StatusError(500)]
+
+    async def attempt(timeout):
+        raise errors.pop(0)
+
+    with pytest.raises(StatusError):
+        asyncio.run(resilience.acall(attempt, deadline=deadline))
+    assert len(errors) == 1
+    assert deadline.calls == 2
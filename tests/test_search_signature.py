@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from function_calls.executor import Executor, GoldIndex, SearchSignature, normalize_amount, search_signature_match, signature_f1
+from function_calls.metrics import split_words, word_f1
+
+
+def reference_search_match(pred_function_args, gold_function_args, threshold):
+    """The original string-building search_function_match of the Executor."""
+    repl_args = ['reward', 'price']
+    exact_args = ['reward', 'price', 'attack']
+
+    def render(args, skip_empty):
+        exact_info, info = "", ""
+        for key in args:
+            value = args[key]
+            if skip_empty and value == "":
+                continue
+            if "operator" not in key and any(r in key for r in repl_args):
+                value = value.replace(",", "").replace(" ", "").replace("Gold", "").replace("G", "").replace("gold", "").replace("g", "")
+                if skip_empty and value == "":
+                    continue
+            if "operator" not in key and any(e in key for e in exact_args):
+                exact_info = key + "_" + value if exact_info == "" else exact_info + " " + key + "_" + value
+            else:
+                info = key + " " + value if info == "" else info + " " + key + " " + value
+        return exact_info, info
+
+    pred_exact_info, pred_info = render(pred_function_args, True)
+    gold_exact_info, gold_info = render(gold_function_args, False)
+    if word_f1(pred_exact_info, gold_exact_info) != 1.0:
+        return False
+    return word_f1(pred_info, gold_info) > threshold
+
+
+@pytest.fixture(scope="module")
+def search_turns():
+    turns = []
+    for path in ("data/task1_sample.json", "data/task2_sample.json", "data/task1_train.json", "data/task2_train.json"):
+        with open(path, encoding="utf-8") as fp:
+            for conversation in json.load(fp):
+                for key, turn in conversation.items():
+                    if key.startswith("turn_"):
+                        searches = [f for f in turn.get("gold_functions", []) if "search" in f["name"]]
+                        if searches:
+                            turns.append(searches)
+    return turns
+
+
+def variants(parameters):
+    yield dict(parameters)
+    for key, value in parameters.items():
+        yield {k: v for k, v in parameters.items() if k != key}
+        yield dict(parameters, **{key: ""})
+        yield dict(parameters, **{key: value.upper()})
+        yield dict(parameters, **{key: value + " Gold"})
+        yield dict(parameters, **{key: "1,000 g"})
+
+
+def test_normalize_amount_matches_the_replace_chain():
+    for value in ["1,000 Gold", "300G", "300 gold", "300g", " 2 500 ", "Gold", "gG", "100 Gg", ""]:
+        expected = value.replace(",", "").replace(" ", "").replace("Gold", "").replace("G", "").replace("gold", "").replace("g", "")
+        assert normalize_amount(value) == expected
+
+
+def test_signature_f1_equals_word_f1_of_the_rendered_text():
+    pred = SearchSignature({"item_type": "Bow", "attack_operator": "high", "price": "300 Gold"}, skip_empty=True)
+    gold = SearchSignature({"item_type": "bow", "attack_operator": "high", "price": "300"})
+    assert pred.exact_tokens == gold.exact_tokens == {"price_300": 1}
+    assert signature_f1(pred.info_tokens, pred.info_length, gold.info_tokens, gold.info_length) == \
+        word_f1("item_type Bow attack_operator high", "item_type bow attack_operator high") == 1.0
+    assert pred.info_length == len(split_words("item_type Bow attack_operator high"))
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.4, 0.6, 0.99])
+def test_signature_match_equals_the_reference(search_turns, threshold):
+    for searches in search_turns:
+        for gold in searches:
+            gold_signature = SearchSignature(gold["parameters"])
+            for candidate in searches:
+                for parameters in variants(candidate["parameters"]):
+                    expected = reference_search_match(parameters, gold["parameters"], threshold)
+                    assert search_signature_match(SearchSignature(parameters, skip_empty=True), gold_signature, threshold) == expected
+
+
+def test_first_matching_gold_search_wins(search_turns):
+    # the index returns the first gold function of the name that matches, as the linear scan does
+    for searches in search_turns:
+        index = GoldIndex(searches)
+        executor = Executor({}, {}, searches)
+        for candidate in searches:
+            for parameters in variants(candidate["parameters"]):
+                func_item = {"name": candidate["name"], "parameters": parameters}
+                expected = next((i for i, gold in enumerate(searches) if gold["name"] == candidate["name"]
+                                 and reference_search_match(parameters, gold["parameters"], executor.threshold)), -1)
+                assert index.match(func_item, executor.threshold) == expected
+
+
+def test_overlapping_gold_searches_are_ranked_in_order():
+    gold = [
+        {"name": "search_item", "parameters": {"item_type": "Sword", "attack_operator": "high"}, "return": ["first"]},
+        {"name": "search_item", "parameters": {"item_type": "Sword"}, "return": ["second"]},
+    ]
+    index = GoldIndex(gold)
+    assert index.match({"name": "search_item", "parameters": {"item_type": "sword"}}) == 0
+    assert index.match({"name": "search_item", "parameters": {"item_type": "sword"}}, threshold=0.7) == 1
+    assert index.match({"name": "search_item", "parameters": {"item_type": "bow", "price": "100"}}) == -1
@@ -0,0 +1,72 @@
+from agents.streaming import SentenceCutoff, StreamStats
+
+
+def feed_all(cutoff, chunks):
+    """Feeds chunks until the cutoff stops the stream; returns the number of chunks consumed."""
+    for n, chunk in enumerate(chunks, 1):
+        if cutoff.feed(chunk):
+            return n
+    return len(chunks)
+
+
+def test_stops_after_max_sentences():
+    cutoff = SentenceCutoff(2)
+    chunks = ["Welcome, traveler. ", "The blade costs 300 gold! ", "Anything else?", " Come back soon."]
+    assert feed_all(cutoff, chunks) == 2
+    assert cutoff.cut
+    assert cutoff.result() == "Welcome, traveler. The blade costs 300 gold!"
+
+
+def test_sentence_is_complete_only_once_whitespace_follows():
+    cutoff = SentenceCutoff(1)
+    assert not cutoff.feed("It costs 3.")
+    assert not cutoff.feed("5 gold.")
+    assert cutoff.feed(" Deal?")
+    assert cutoff.result() == "It costs 3.5 gold."
+
+
+def test_abbreviations_and_initials_do_not_end_a_sentence():
+    cutoff = SentenceCutoff(1)
+    assert not cutoff.feed("Ask Mr. Smith or J. Doe, e.g. at the inn")
+    assert cutoff.feed(". Then rest. ")
+    assert cutoff.result() == "Ask Mr. Smith or J. Doe, e.g. at the inn."
+
+
+def test_closing_quotes_and_repeated_terminators_stay_with_the_sentence():
+    cutoff = SentenceCutoff(1)
+    assert cutoff.feed('He said "Run!!" and left.')
+    assert cutoff.result() == 'He said "Run!!"'
+
+
+def test_unfinished_text_is_kept_whole():
+    cutoff = SentenceCutoff(2)
+    assert feed_all(cutoff, ["One sentence.", " And half of another"]) == 2
+    assert not cutoff.cut
+    assert cutoff.result() == "One sentence. And half of another"
+
+
+def test_feed_after_cut_is_ignored():
+    cutoff = SentenceCutoff(1)
+    assert cutoff.feed("Done. ")
+    assert cutoff.feed("More text. ")
+    assert cutoff.result() == "Done."
+
+
+def test_zero_max_sentences_disables_the_cutoff():
+    cutoff = SentenceCutoff(0)
+    assert feed_all(cutoff, ["A. ", "B. ", "C. "]) == 3
+    assert not cutoff.cut
+    assert cutoff.result() == "A. B. C."
+
+
+def test_stream_stats_summary():
+    stats = StreamStats()
+    assert not stats
+    stats.record(0.2, 1.0, True)
+    stats.record(None, 2.0, False)
+    summary = stats.summary()
+    assert stats
+    assert summary["responses"] == 2
+    assert summary["cutoffs"] == 1
+    assert summary["ttft"]["p50"] == 0.2
+    assert summary["total"]["mean"] == 1.5
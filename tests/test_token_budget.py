@@ -0,0 +1,115 @@
+import hashlib
+
+import pytest
+
+from agents import token_budget
+from agents.token_budget import Section, TokenBudget, TokenCounter, estimate_tokens
+
+
+class WordCounter:
+    """Counts one token per word, so budgets can be checked by hand."""
+    exact = True
+
+    def count(self, text):
+        return len(text.split())
+
+    def truncate(self, text, max_tokens):
+        return " ".join(text.split()[:max_tokens])
+
+
+def test_estimate_counts_words_digits_and_punctuation():
+    assert estimate_tokens("Hello, world!") == 6
+    assert estimate_tokens("The Avis Wind bow costs 300 gold.") == 11
+    assert estimate_tokens("  spaced   text\n") == 5
+    # counts add up over texts joined at whitespace
+    assert estimate_tokens("Hello, world! ") + estimate_tokens("The Avis Wind bow costs 300 gold.") == \
+        estimate_tokens("Hello, world! The Avis Wind bow costs 300 gold.")
+
+
+def test_shipped_encoding_counts_exactly():
+    pytest.importorskip("tiktoken")
+    counter = TokenCounter("gpt-4o-mini")
+    assert counter.exact
+    assert counter.encoding.name == "o200k_base"
+    assert counter.count("Hello, world!") == 4
+    assert counter.count("The Avis Wind bow costs 300 gold.") == 9
+    assert counter.count_messages([{"role": "system", "content": "Hello, world!"}, {"role": "user", "content": "Hi"}]) == 16
+    assert counter.truncate("The Avis Wind bow costs 300 gold.", 4) == "The Avis Wind"
+
+
+def test_corrupted_or_missing_encoding_file_is_not_loaded(tmp_path):
+    pytest.importorskip("tiktoken")
+    assert token_budget._load_shipped_encoding("o200k_base", str(tmp_path)) is None
+    (tmp_path / "o200k_base.tiktoken").write_bytes(b"SGVsbG8= 0\n")
+    assert token_budget._load_shipped_encoding("o200k_base", str(tmp_path)) is None
+
+
+def test_tiktoken_cache_lookup(tmp_path, monkeypatch):
+    key = hashlib.sha1(token_budget._ENCODING_URL.format("cl100k_base").encode("utf-8")).hexdigest()
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    assert not token_budget._encoding_cached("cl100k_base")
+    (tmp_path / key).write_bytes(b"")
+    assert token_budget._encoding_cached("cl100k_base")
+    # an empty cache directory disables tiktoken's cache, so the file would be downloaded
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", "")
+    assert not token_budget._encoding_cached("cl100k_base")
+    monkeypatch.delenv("TIKTOKEN_CACHE_DIR")
+    monkeypatch.setenv("DATA_GYM_CACHE_DIR", str(tmp_path))
+    assert token_budget._encoding_cached("cl100k_base")
+
+
+def test_sections_are_kept_by_priority():
+    budget = TokenBudget(20, counter=WordCounter())
+    sections = [
+        Section("worldview", 3, ["w " * 10]),
+        Section("history", 2, ["h1 h1 h1", "h2 h2 h2", "h3 h3 h3"]),
+        Section("knowledge", 1, ["k k k k", "k k k k"]),
+        Section("utterance", 0, ["u " * 5]),
+    ]
+    fit = budget.fit(sections, reserved=2)
+    # 2 reserved + 5 utterance + 8 knowledge leave 5: one history message, no worldview
+    assert fit.indices == {"worldview": [], "history": [0], "knowledge": [0, 1], "utterance": [0]}
+    assert fit.dropped == {"history": 2, "worldview": 1}
+    assert fit.tokens == 18
+
+
+def test_priority_zero_is_kept_over_budget():
+    budget = TokenBudget(5, counter=WordCounter())
+    fit = budget.fit([Section("utterance", 0, ["u " * 8]), Section("knowledge", 1, ["k"])])
+    assert fit.kept["utterance"] == ["u " * 8]
+    assert fit.dropped == {"knowledge": 1}
+    assert fit.tokens == 8
+
+
+def test_part_that_does_not_fit_is_skipped_for_smaller_later_parts():
+    budget = TokenBudget(6, counter=WordCounter())
+    fit = budget.fit([Section("knowledge", 1, ["a a a", "b b b b", "c c"])])
+    assert fit.kept["knowledge"] == ["a a a", "c c"]
+    assert fit.dropped == {"knowledge": 1}
+
+
+def test_part_overhead_is_counted_per_kept_part():
+    budget = TokenBudget(10, counter=WordCounter())
+    fit = budget.fit([Section("history", 1, ["a a", "b b", "c c"], part_overhead=2)])
+    assert fit.indices["history"] == [0, 1]
+    assert fit.tokens == 8
+
+
+def test_truncatable_section_is_cut_to_the_remaining_budget():
+    budget = TokenBudget(10, counter=WordCounter(), min_truncated_tokens=3)
+    fit = budget.fit([Section("utterance", 0, ["u u u u"]), Section("worldview", 1, ["w1 w2 w3 w4 w5 w6 w7 w8"], truncatable=True)])
+    assert fit.kept["worldview"] == ["w1 w2 w3 w4 w5 w6"]
+    assert fit.truncated == {"worldview": 1}
+    # fewer than min_truncated_tokens left: dropped instead
+    fit = budget.fit([Section("utterance", 0, ["u " * 8]), Section("worldview", 1, ["w1 w2 w3"], truncatable=True)])
+    assert fit.kept["worldview"] == []
+    assert fit.dropped == {"worldview": 1}
+
+
+def test_estimated_counts_keep_a_margin_free():
+    class EstimateCounter(WordCounter):
+        exact = False
+
+    assert TokenBudget(2000, counter=WordCounter()).limit == 2000
+    assert TokenBudget(2000, counter=EstimateCounter()).limit == 1800
+    assert TokenBudget(2000, counter=EstimateCounter(), estimate_margin=0.0).limit == 2000
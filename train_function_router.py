@@ -0,0 +1,71 @@
+# train_function_router.py
+
+import argparse
+import filecmp
+import hashlib
+import os
+import tempfile
+import time
+
+from agents.function_router import DEFAULT_ROUTER_PATH, FunctionRouter, load_router_examples
+
+
+def evaluate(router, examples, min_confidence):
+    """Exact-set accuracy overall and on the turns where the router is confident."""
+    correct = 0
+    confident = 0
+    confident_correct = 0
+    for dialogue, names in examples:
+        prediction = router.predict(dialogue)
+        hit = sorted(prediction.names) == names
+        correct += hit
+        if prediction.confidence >= min_confidence:
+            confident += 1
+            confident_correct += hit
+    return correct, confident, confident_correct
+
+
+def sha256(path):
+    with open(path, "rb") as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train', nargs='+', default=['data/task1_train.json', 'data/task2_train.json'])
+    parser.add_argument('--eval', nargs='*', default=['data/task1_sample.json', 'data/task2_sample.json'])
+    parser.add_argument('--save_path', type=str, default=DEFAULT_ROUTER_PATH)
+    parser.add_argument('--min_confidence', type=float, default=0.9)
+    parser.add_argument('--check', action='store_true',
+                        help="retrain and verify that the result is identical to --save_path instead of overwriting it")
+    args = parser.parse_args()
+
+    for path in args.train:
+        print(f"📄 {path} sha256={sha256(path)}")
+
+    start_time = time.time()
+    router = FunctionRouter.train_from_files(args.train)
+    if args.check:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "function_router.npz")
+            router.save(path)
+            identical = filecmp.cmp(path, args.save_path, shallow=False)
+        print(f"{'✅' if identical else '❌'} Retrained router {'matches' if identical else 'differs from'}: {args.save_path}")
+        raise SystemExit(0 if identical else 1)
+    router.save(args.save_path)
+    print(f"✅ Router with {len(router.labels)} labels saved to: {args.save_path} sha256={sha256(args.save_path)}")
+    print("⏱️ Training time:", round(time.time() - start_time, 2), "seconds")
+
+    examples = []
+    for path in args.eval:
+        examples.extend(load_router_examples(path))
+    if examples:
+        correct, confident, confident_correct = evaluate(router, examples, args.min_confidence)
+        print(f"🎯 Exact-set accuracy: {correct}/{len(examples)}")
+        print(f"🔒 Confident turns (>= {args.min_confidence}): {confident}/{len(examples)}, correct: {confident_correct}")
+
+        start = time.perf_counter()
+        for dialogue, _ in examples:
+            router.predict(dialogue)
+        per_turn = (time.perf_counter() - start) / len(examples)
+        print(f"⚡ Prediction time: {per_turn * 1e6:.1f} µs per turn")